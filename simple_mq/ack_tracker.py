@@ -0,0 +1,139 @@
+# ack_tracker.py
+# 至少一次投递：跟踪主题投递给各订阅者但尚未确认的消息
+# 可见性超时内未确认的消息重新投递给同一订阅者（消费组则重新分配给组内成员），
+# 超过最大投递次数或被拒绝且不再重试时交给死信处理
+import threading
+
+DEFAULT_VISIBILITY_TIMEOUT = 30.0    # 可见性超时（秒）
+DEFAULT_MAX_ATTEMPTS = 5             # 最大投递次数（含首次投递）
+
+
+# 一条未确认的投递；同时作为时间轮中的任务键
+class InFlightMessage:
+    __slots__ = ('message', 'consumer', 'attempts')
+
+    def __init__(self, message, consumer):
+        self.message = message        # 投递的消息对象
+        self.consumer = consumer      # 订阅者（观察者或消费组）
+        self.attempts = 1             # 已投递次数
+
+
+class AckTracker:
+    def __init__(self, topic, timer_wheel, dead_letter, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, dead_letter_topic=None):
+        if visibility_timeout <= 0:
+            raise ValueError("可见性超时必须为正数")
+        if max_attempts < 1:
+            raise ValueError("最大投递次数必须为正整数")
+        self.topic = topic
+        self.timer_wheel = timer_wheel
+        self.dead_letter = dead_letter            # 死信回调：dead_letter(tracker, in_flight)
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.dead_letter_topic = dead_letter_topic
+        self.in_flight = {}                       # key=(订阅者ID, 主题内偏移量)，value=InFlightMessage
+        self.acked_count = 0
+        self.redelivered_count = 0
+        self.dead_lettered_count = 0
+        self._lock = threading.Lock()             # 加锁顺序：先跟踪器锁，后时间轮锁；投递与死信回调在锁外执行
+        self._on_timeout = self.on_timeout        # 绑定方法只创建一次，登记定时任务时复用
+
+    def track(self, consumer, message):
+        """记录一次投递并登记可见性超时"""
+        self.track_many(consumer, (message,))
+
+    def track_many(self, consumer, messages):
+        """批量记录投递；重复投递同一条消息（如重放）时沿用原记录"""
+        consumer_id = consumer.observer_id
+        with self._lock:
+            for message in messages:
+                offset = getattr(message, 'offset', None)
+                if offset is None or (consumer_id, offset) in self.in_flight:
+                    continue
+                entry = self.in_flight[(consumer_id, offset)] = InFlightMessage(message, consumer)
+                self.timer_wheel.schedule(entry, self.visibility_timeout, self._on_timeout)
+
+    def ack(self, consumer_id, offset):
+        """确认消息已处理，返回是否存在对应的未确认投递"""
+        with self._lock:
+            entry = self.in_flight.pop((consumer_id, offset), None)
+            if entry is None:
+                return False
+            self.acked_count += 1
+        self.timer_wheel.cancel(entry)
+        return True
+
+    def nack(self, consumer_id, offset, requeue=True):
+        """拒绝消息：requeue为True时立即重新投递（计入投递次数），否则直接转入死信"""
+        with self._lock:
+            entry = self.in_flight.get((consumer_id, offset))
+            if entry is None:
+                return False
+            redeliver = self._retry_locked(entry) if requeue else self._dead_letter_locked(entry)
+        self._finish(entry, redeliver)
+        return True
+
+    def on_timeout(self, entry):
+        """可见性超时：仍未确认的消息重新投递或转入死信"""
+        with self._lock:
+            if self.in_flight.get((entry.consumer.observer_id, entry.message.offset)) is not entry:
+                return
+            redeliver = self._retry_locked(entry)
+        self._finish(entry, redeliver)
+
+    def _retry_locked(self, entry):
+        # 返回True表示需要重新投递，False表示已转入死信，None表示放弃
+        if getattr(entry.message, 'expired', False):
+            # 消息已按保留策略清除，不再重新投递，也不转入死信
+            del self.in_flight[(entry.consumer.observer_id, entry.message.offset)]
+            return None
+        if entry.attempts >= self.max_attempts:
+            return self._dead_letter_locked(entry)
+        if not self.topic.is_subscribed(entry.consumer):
+            # 订阅者已取消订阅，不再重新投递
+            del self.in_flight[(entry.consumer.observer_id, entry.message.offset)]
+            return None
+        entry.attempts += 1
+        self.redelivered_count += 1
+        self.timer_wheel.schedule(entry, self.visibility_timeout, self._on_timeout)
+        return True
+
+    def _dead_letter_locked(self, entry):
+        del self.in_flight[(entry.consumer.observer_id, entry.message.offset)]
+        self.timer_wheel.cancel(entry)
+        self.dead_lettered_count += 1
+        return False
+
+    def _finish(self, entry, redeliver):
+        if redeliver:
+            entry.consumer.update(entry.message, self.topic.topic_name)
+        elif redeliver is False:
+            self.dead_letter(self, entry)
+
+    def close(self):
+        """取消全部未确认投递的定时任务"""
+        with self._lock:
+            entries = list(self.in_flight.values())
+            self.in_flight.clear()
+        for entry in entries:
+            self.timer_wheel.cancel(entry)
+
+    def in_flight_counts(self):
+        """各订阅者未确认的投递数"""
+        counts = {}
+        with self._lock:
+            for consumer_id, _ in self.in_flight:
+                counts[consumer_id] = counts.get(consumer_id, 0) + 1
+        return counts
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "visibility_timeout": self.visibility_timeout,
+                "max_attempts": self.max_attempts,
+                "dead_letter_topic": self.dead_letter_topic,
+                "in_flight": len(self.in_flight),
+                "acked": self.acked_count,
+                "redelivered": self.redelivered_count,
+                "dead_lettered": self.dead_lettered_count
+            }
@@ -1,14 +1,68 @@
 # app.py
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, g, request, jsonify, render_template
 # from flask_cors import CORS
-from middleware_core import MiddlewareCore
+from middleware_core import MiddlewareCore, DEFAULT_DISPATCH_QUEUE_SIZE, BACKPRESSURE_BLOCK, render_messages
+from consumer_group import GROUP_ROUND_ROBIN
+from ack_tracker import DEFAULT_VISIBILITY_TIMEOUT, DEFAULT_MAX_ATTEMPTS
+from payload_pool import PayloadPool
+from benchmark import run_case, BenchmarkJobs
+from metrics import PROMETHEUS_CONTENT_TYPE
+from profiler import ProfilerSession, DEFAULT_PROFILE_DURATION
+from priority_lanes import parse_priority
+from replication import (ReplicationLog, ReplicationFollower, build_snapshot, DEFAULT_REPLICATION_BATCH,
+                         MAX_REPLICATION_BATCH, MAX_POLL_TIMEOUT)
+import atexit
+import json
+import os
 import time
-import threading
 
 app = Flask(__name__)
 # CORS(app, resources={r"/*": {"origins": "*"}})
 # 初始化中间件协调器（全局唯一，确保所有请求共享同一中间件实例）
-middleware = MiddlewareCore()
+# 持久化主题的分段日志写入message_log目录（仅对开启持久化的主题生效）
+# 共享内存负载池在启动服务时创建（见文件末尾），导入本模块不会申请共享内存
+middleware = MiddlewareCore(log_dir='message_log')
+# 进程退出时停止投递线程、持久化日志刷盘并释放（unlink）负载池的共享内存
+atexit.register(middleware.close)
+# 性能剖析窗口（通过/start_profiling开启，窗口内按采样间隔剖析请求）
+profiler = ProfilerSession()
+# 网页触发的吞吐率测试与基准测试在后台线程中运行，结果通过/get_benchmark_result轮询
+benchmark_jobs = BenchmarkJobs()
+# 主从复制（启动服务时由start_replication按环境变量开启，默认关闭）：
+# MQ_REPLICATION_LEADER=1 作为主节点开启复制日志，提供/replication/snapshot与/replication/events；
+# MQ_REPLICATE_FROM=主节点地址（如 http://127.0.0.1:5000）作为从节点追随主节点的发布与拓扑变更，
+# 只提供读取接口（READ_ONLY_ENDPOINTS），修改请求应发往主节点
+follower = None
+
+def start_replication():
+    global follower
+    if os.environ.get('MQ_REPLICATION_LEADER') == '1' and middleware.replication_log is None:
+        middleware.enable_replication(ReplicationLog())
+    if os.environ.get('MQ_REPLICATE_FROM') and follower is None:
+        follower = ReplicationFollower(middleware, os.environ['MQ_REPLICATE_FROM'])
+        follower.start()
+READ_ONLY_ENDPOINTS = {
+    'static', 'index', 'get_observer_messages', 'poll_observer_messages', 'stream_observer_messages',
+    'get_message_logs', 'get_entities', 'get_observer_subscriptions', 'get_queue_depths', 'test_throughput',
+    'benchmark', 'get_consumer_groups', 'get_ack_stats', 'get_payload_pool_stats', 'metrics', 'start_profiling',
+    'stop_profiling', 'get_profile', 'get_retention_stats', 'get_topic_memory', 'replication_snapshot',
+    'replication_events', 'replication_status', 'get_benchmark_result'
+}
+
+@app.before_request
+def reject_writes_on_follower():
+    if follower is not None and request.endpoint not in READ_ONLY_ENDPOINTS:
+        return jsonify({"success": False, "msg": f"当前实例是只读的从节点，请向主节点{follower.leader_url}发送修改请求"}), 403
+
+@app.before_request
+def start_request_profile():
+    g.profile = profiler.profile_request()
+
+@app.teardown_request
+def finish_request_profile(exc):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profiler.finish_request(profile)
 
 # 1. 首页：渲染网页界面
 @app.route('/')
@@ -44,12 +98,60 @@ def publish_message():
     producer_id = data.get('producer_id')
     topic_name = data.get('topic_name')
     message_content = data.get('message_content')
-    # 检查生产者是否存在
-    if producer_id not in middleware.producers:
+    headers = data.get('headers')  # 可选：消息头（供订阅过滤使用）
+    if headers is not None and not isinstance(headers, dict):
+        return jsonify({"success": False, "msg": "消息头必须是JSON对象"})
+    priority = data.get('priority')  # 可选：优先级（high/normal/low或0-2），由发布方法校验
+    # 检查生产者是否存在（只查找一次，避免与删除操作竞争）
+    producer = middleware.producers.get(producer_id)
+    if not producer:
         return jsonify({"success": False, "msg": f"生产者{producer_id}不存在，请先创建"})
     # 调用生产者的发布方法
-    producer = middleware.producers[producer_id]
-    success, msg = producer.publish_message(middleware, topic_name, message_content)
+    success, msg = producer.publish_message(middleware, topic_name, message_content, headers, priority)
+    return jsonify({"success": success, "msg": msg})
+
+@app.route('/publish_batch', methods=['POST'])
+def publish_batch():
+    """批量发布：messages为[{topic_name, message_content, headers, priority}]，未指定topic_name的消息使用请求级topic_name"""
+    data = request.json
+    producer_id = data.get('producer_id')
+    default_topic = data.get('topic_name')
+    messages = data.get('messages') or []
+    producer = middleware.producers.get(producer_id)
+    if not producer:
+        return jsonify({"success": False, "msg": f"生产者{producer_id}不存在，请先创建"})
+    # 按主题分组（保持每个主题内的消息顺序），整批共用一个时间戳
+    grouped = {}
+    for item in messages:
+        if isinstance(item, dict):
+            contents, headers, priorities = grouped.setdefault(item.get('topic_name', default_topic), ([], [], []))
+            contents.append(item.get('message_content'))
+            headers.append(item.get('headers') if isinstance(item.get('headers'), dict) else None)
+            try:
+                priorities.append(parse_priority(item['priority']) if item.get('priority') is not None else None)
+            except ValueError as e:
+                return jsonify({"success": False, "msg": str(e)})
+        else:
+            contents, headers, priorities = grouped.setdefault(default_topic, ([], [], []))
+            contents.append(item)
+            headers.append(None)
+            priorities.append(None)
+    timestamp = time.time()
+    results = []
+    for topic_name, (contents, headers, priorities) in grouped.items():
+        success, msg = producer.publish_many(middleware, topic_name, contents, timestamp,
+                                             headers if any(headers) else None,
+                                             priorities if any(priority is not None for priority in priorities) else None)
+        results.append({"topic_name": topic_name, "count": len(contents), "success": success, "msg": msg})
+    success = bool(results) and all(result["success"] for result in results)
+    msg = f"批量发布完成：{len(messages)}条消息，涉及{len(results)}个主题" if success else "批量发布存在失败项"
+    return jsonify({"success": success, "msg": msg, "results": results})
+
+@app.route('/delete_producer', methods=['POST'])
+def delete_producer():
+    data = request.json
+    producer_id = data.get('producer_id')
+    success, msg = middleware.delete_producer(producer_id)
     return jsonify({"success": success, "msg": msg})
 
 # 4. 观察者接口
@@ -60,12 +162,23 @@ def create_observer():
     success, msg = middleware.create_observer(observer_id)
     return jsonify({"success": success, "msg": msg})
 
+@app.route('/delete_observer', methods=['POST'])
+def delete_observer():
+    data = request.json
+    observer_id = data.get('observer_id')
+    success, msg = middleware.delete_observer(observer_id)
+    return jsonify({"success": success, "msg": msg})
+
 @app.route('/subscribe_topic', methods=['POST'])
 def subscribe_topic():
     data = request.json
     observer_id = data.get('observer_id')
     topic_name = data.get('topic_name')
-    success, msg = middleware.observer_subscribe_topic(observer_id, topic_name)
+    from_offset = data.get('from_offset')  # 可选：持久化主题从该偏移量开始追赶历史消息
+    if from_offset is not None:
+        from_offset = int(from_offset)
+    # 可选：过滤表达式，只接收消息头满足条件的消息
+    success, msg = middleware.observer_subscribe_topic(observer_id, topic_name, from_offset, data.get('filter'))
     return jsonify({"success": success, "msg": msg})
 
 @app.route('/unsubscribe_topic', methods=['POST'])
@@ -81,32 +194,87 @@ def unsubscribe_topic():
 def get_observer_messages():
     data = request.json
     observer_id = data.get('observer_id')
-    messages = middleware.get_observer_messages(observer_id)
-    return jsonify({"messages": messages})
+    since = int(data.get('since', 0))  # 只返回该偏移量之后的新消息
+    messages, next_offset = middleware.get_observer_messages(observer_id, since)
+    return jsonify({"messages": render_messages(messages), "next_offset": next_offset})
+
+# 长轮询：没有新消息时挂起请求，直到有新消息或超时（最长30秒）
+@app.route('/poll_observer_messages', methods=['POST'])
+def poll_observer_messages():
+    data = request.json
+    observer_id = data.get('observer_id')
+    since = int(data.get('since', 0))
+    timeout = min(float(data.get('timeout', 25)), 30.0)
+    result = middleware.wait_observer_messages(observer_id, since, timeout)
+    if result is None:
+        return jsonify({"messages": [], "next_offset": 0})
+    messages, next_offset = result
+    return jsonify({"messages": render_messages(messages), "next_offset": next_offset})
 
+# SSE推送：每个事件的id为下一次读取的偏移量，断线重连时浏览器通过Last-Event-ID续传
+@app.route('/stream/<observer_id>', methods=['GET'])
+def stream_observer_messages(observer_id):
+    since = int(request.headers.get('Last-Event-ID') or request.args.get('since', 0))
+    
+    def generate():
+        offset = since
+        while True:
+            result = middleware.wait_observer_messages(observer_id, offset, timeout=15.0)
+            if result is None:
+                # 观察者已被删除，结束推送
+                yield "event: closed\ndata: {}\n\n"
+                return
+            messages, offset = result
+            if messages:
+                payload = json.dumps({"messages": render_messages(messages), "next_offset": offset}, ensure_ascii=False)
+                yield f"id: {offset}\ndata: {payload}\n\n"
+            else:
+                # 心跳注释行，防止连接被代理或浏览器判定为空闲而断开
+                yield ": keepalive\n\n"
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# 日志增量读取：since为上次返回的next_since，categories为逗号分隔的类别过滤
 @app.route('/get_message_logs', methods=['GET'])
 def get_message_logs():
-    logs = middleware.get_message_logs()
-    return jsonify({"logs": logs})
+    since = request.args.get('since', 0, type=int)
+    categories = request.args.get('categories')
+    logs, next_since = middleware.get_message_logs(since, categories.split(',') if categories else None)
+    return jsonify({"logs": logs, "next_since": next_since})
 
 # 6. 新增：获取所有实体信息接口（用于前端下拉选择）
+# 带since_version参数时只返回该版本之后的拓扑变更；否则返回按拓扑版本缓存的完整快照，
+# 支持ETag/If-None-Match（拓扑未变化时返回304）
 @app.route('/get_entities', methods=['GET'])
 def get_entities():
-    entities = middleware.get_all_entities()
-    return jsonify(entities)
+    since_version = request.args.get('since_version')
+    if since_version is not None:
+        return jsonify(middleware.get_entities_delta(int(since_version), request.args.get('instance_id')))
+    version, _, body = middleware.get_entities_snapshot()
+    etag = middleware.entity_etag(version)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, content_type='application/json')
+    response.set_etag(etag)
+    response.headers['X-Topology-Version'] = str(version)
+    response.headers['Cache-Control'] = 'no-cache'  # 浏览器每次带If-None-Match重新验证
+    return response
 
 # 7. 新增：加载配置文件接口
 @app.route('/load_config', methods=['POST'])
 def load_config():
     success, msg = middleware.load_config()
-    # 重新加载实体信息
-    entities = middleware.get_all_entities()
-    return jsonify({"success": success, "msg": msg, "entities": entities})
+    # 重新加载实体信息（按拓扑版本缓存的快照）
+    version, entities, _ = middleware.get_entities_snapshot()
+    return jsonify({"success": success, "msg": msg, "entities": entities, "version": version})
 
 # 8. 新增：保存配置文件接口
 @app.route('/save_config', methods=['POST'])
 def save_config():
-    success, msg = middleware.save_config()
+    data = request.get_json(silent=True) or {}
+    success, msg = middleware.save_config(bool(data.get('force', False)))
     return jsonify({"success": success, "msg": msg})
 
 # 9. 新增：获取观察者的订阅信息
@@ -116,192 +284,304 @@ def get_observer_subscriptions():
     observer_id = data.get('observer_id')
     observer = middleware.observers.get(observer_id)
     if not observer:
-        return jsonify({"subscriptions": []})
-    return jsonify({"subscriptions": observer.subscribed_topics})
+        return jsonify({"subscriptions": [], "filters": {}})
+    subscribed_topics = list(observer.subscribed_topics.items())
+    return jsonify({"subscriptions": [topic_name for topic_name, _ in subscribed_topics] + list(observer.subscribed_patterns),
+                    "filters": {topic_name: expression for topic_name, expression in subscribed_topics
+                                if expression is not None}})
+
+# 10. 新增：配置主题投递模式（同步/异步队列投递及背压策略）
+@app.route('/configure_topic_delivery', methods=['POST'])
+def configure_topic_delivery():
+    data = request.json
+    topic_name = data.get('topic_name')
+    async_delivery = bool(data.get('async_delivery', True))
+    max_queue_size = data.get('max_queue_size', DEFAULT_DISPATCH_QUEUE_SIZE)
+    policy = data.get('policy', BACKPRESSURE_BLOCK)
+    success, msg = middleware.configure_topic_delivery(topic_name, async_delivery, max_queue_size, policy)
+    return jsonify({"success": success, "msg": msg})
+
+# 11. 新增：获取各主题投递队列深度
+@app.route('/get_queue_depths', methods=['GET'])
+def get_queue_depths():
+    return jsonify({"queues": middleware.get_queue_depths()})
+
+# 12. 新增：开启/关闭主题持久化
+@app.route('/configure_topic_persistence', methods=['POST'])
+def configure_topic_persistence():
+    data = request.json
+    topic_name = data.get('topic_name')
+    durable = bool(data.get('durable', True))
+    success, msg = middleware.configure_topic_persistence(topic_name, durable)
+    return jsonify({"success": success, "msg": msg})
+
+# 13. 新增：将持久化主题的历史消息重放给观察者
+@app.route('/replay_topic', methods=['POST'])
+def replay_topic():
+    data = request.json
+    observer_id = data.get('observer_id')
+    topic_name = data.get('topic_name')
+    from_offset = int(data.get('from_offset', 0))
+    max_count = int(data.get('max_count', 1000))
+    success, msg, next_offset = middleware.replay_topic(observer_id, topic_name, from_offset, max_count)
+    return jsonify({"success": success, "msg": msg, "next_offset": next_offset})
+
+# 14. 新增：配置活动日志类别的采样间隔（1为全部记录，0为关闭）
+@app.route('/configure_message_log', methods=['POST'])
+def configure_message_log():
+    data = request.json
+    success, msg = middleware.configure_message_log(data.get('category'), data.get('sample_every', 1))
+    return jsonify({"success": success, "msg": msg})
+
+# 15. 吞吐率测试接口：按固定消息数测试（使用独立的中间件核心，不影响当前实体），
+# 同时返回发布到投递的延迟分位数；完整的参数矩阵与回退对比见benchmark.py suite
+# 测试在后台线程中运行，接口立即返回，结果通过/get_benchmark_result?job=throughput轮询
+def _throughput_job(message_size, producer_count, fanout, messages):
+    result = run_case('core', message_size, producer_count, fanout, 1, messages)
+    return {
+        "test_duration": result["elapsed_sec"],  # 实际测试时长（秒）
+        "total_messages": result["published"],
+        "message_size": message_size,            # 消息大小（字节）
+        "producer_count": producer_count,        # 生产者数量
+        "throughput_msg_per_sec": f"{result['throughput_msg_per_sec']:.2f} 条/秒",
+        "throughput_kb_per_sec": f"{result['throughput_kb_per_sec']:.2f} KB/秒",
+        "latency": result["latency"],
+        "peak_rss_mb": result["peak_rss_mb"]
+    }
 
-# 10. 吞吐率测试接口（改进版）
 @app.route('/test_throughput', methods=['GET'])
 def test_throughput():
-    # 获取测试参数
-    test_duration = int(request.args.get('duration', 60))  # 测试时长，默认60秒
-    message_size = int(request.args.get('size', 1024))     # 消息大小，默认1KB
-    producer_count = int(request.args.get('producers', 5)) # 生产者数量，默认5个
-    
-    # 准备：创建主题、生产者、观察者
-    topic_name = "throughput_test_topic"
-    middleware.create_topic(topic_name)
-    observers = []
-    
-    # 创建多个观察者以避免成为瓶颈
-    for i in range(3):
-        observer_id = f"test_observer_{i}"
-        middleware.create_observer(observer_id)
-        middleware.observer_subscribe_topic(observer_id, topic_name)
-        observers.append(observer_id)
-    
-    producers = []
-    for i in range(producer_count):
-        producer_id = f"test_producer_{i}"
-        middleware.create_producer(producer_id)
-        producers.append(producer_id)
-    
-    message_count = 0  # 消息计数器
-    start_time = time.time()
-    end_time = start_time + test_duration
-    
-    # 定义生产者线程函数：持续发布消息
-    def produce_messages(producer_id):
-        nonlocal message_count
-        producer = middleware.producers[producer_id]
-        while time.time() < end_time:
-            # 发布指定大小的消息
-            message_content = "a" * message_size
-            success, _ = producer.publish_message(middleware, topic_name, message_content)
-            if success:
-                message_count += 1
-            # 短暂休眠以控制发送速率
-            time.sleep(0.0001)
-    
-    # 启动生产者线程（模拟并发）
-    threads = []
-    for producer_id in producers:
-        t = threading.Thread(target=produce_messages, args=(producer_id,))
-        t.start()
-        threads.append(t)
-    
-    # 等待所有线程结束
-    for t in threads:
-        t.join()
-    
-    # 计算吞吐率
-    actual_duration = time.time() - start_time
-    throughput = message_count / actual_duration  # 消息/秒
-    
-    # 清理测试数据
-    middleware.delete_topic(topic_name)
-    for producer_id in producers:
-        if producer_id in middleware.producers:
-            del middleware.producers[producer_id]
-    for observer_id in observers:
-        if observer_id in middleware.observers:
-            del middleware.observers[observer_id]
-    
-    return jsonify({
-        "test_duration": actual_duration,  # 实际测试时长（秒）
-        "total_messages": message_count,
-        "message_size": message_size,      # 消息大小（字节）
-        "producer_count": producer_count,  # 生产者数量
-        "throughput_msg_per_sec": f"{throughput:.2f} 条/秒",
-        "throughput_kb_per_sec": f"{throughput * message_size / 1024:.2f} KB/秒"
-    })
+    message_size = int(request.args.get('size', 1024))      # 消息大小，默认1KB
+    producer_count = int(request.args.get('producers', 5))  # 生产者数量，默认5个
+    fanout = int(request.args.get('fanout', 3))             # 订阅者数量，默认3个
+    messages = int(request.args.get('messages', 20000))     # 每个生产者发布的消息数
+    success, msg = benchmark_jobs.start('throughput', _throughput_job, message_size, producer_count, fanout, messages)
+    return jsonify({"success": success, "msg": msg, "job": "throughput"})
 
-# 11. 基准测试接口（多种消息大小）- 改进版
-@app.route('/benchmark', methods=['GET'])
-def benchmark():
-    message_sizes = [100, 1024, 10240]  # 移除100KB测试，避免性能问题
+# 16. 基准测试接口（多种消息大小，后台运行，结果通过/get_benchmark_result?job=benchmark轮询）
+def _benchmark_job(messages):
     results = []
-    
-    for size in message_sizes:
+    for size in [100, 1024, 10240]:
         try:
-            # 调用吞吐率测试接口
-            test_duration = 15  # 缩短测试时间到15秒，避免长时间阻塞
-            producer_count = 2  # 减少生产者数量
-            
-            # 准备测试
-            topic_name = f"benchmark_topic_{size}"
-            middleware.create_topic(topic_name)
-            
-            observers = []
-            for i in range(2):
-                observer_id = f"benchmark_observer_{i}_{size}"
-                middleware.create_observer(observer_id)
-                middleware.observer_subscribe_topic(observer_id, topic_name)
-                observers.append(observer_id)
-            
-            producers = []
-            for i in range(producer_count):
-                producer_id = f"benchmark_producer_{i}_{size}"
-                middleware.create_producer(producer_id)
-                producers.append(producer_id)
-            
-            message_count = 0
-            start_time = time.time()
-            end_time = start_time + test_duration
-            
-            def produce_messages(producer_id):
-                nonlocal message_count
-                producer = middleware.producers[producer_id]
-                while time.time() < end_time:
-                    # 对于大消息，我们使用更有效的方式生成
-                    if size <= 1000:
-                        message_content = "b" * size
-                    else:
-                        # 对于大消息，我们使用更节省内存的方式
-                        message_content = "b" * 1000 + "..." + "b" * (size - 1003) if size > 1003 else "b" * size
-                    
-                    success, _ = producer.publish_message(middleware, topic_name, message_content)
-                    if success:
-                        message_count += 1
-                    # 根据消息大小调整休眠时间，避免系统过载
-                    sleep_time = min(0.001 * (size / 1024), 0.1)  # 最大休眠0.1秒
-                    time.sleep(sleep_time)
-            
-            threads = []
-            for producer_id in producers:
-                t = threading.Thread(target=produce_messages, args=(producer_id,))
-                t.start()
-                threads.append(t)
-            
-            # 等待所有线程结束，设置超时避免无限等待
-            for t in threads:
-                t.join(timeout=20)  # 20秒超时
-            
-            actual_duration = time.time() - start_time
-            throughput = message_count / actual_duration if actual_duration > 0 else 0
-            
+            result = run_case('core', size, 2, 2, 1, messages)
             results.append({
                 "message_size": size,
-                "total_messages": message_count,
-                "duration": actual_duration,
-                "throughput_msg_per_sec": throughput,
-                "throughput_kb_per_sec": throughput * size / 1024
+                "total_messages": result["published"],
+                "duration": result["elapsed_sec"],
+                "throughput_msg_per_sec": result["throughput_msg_per_sec"],
+                "throughput_kb_per_sec": result["throughput_kb_per_sec"],
+                "latency": result["latency"]
             })
-            
-            # 清理
-            middleware.delete_topic(topic_name)
-            for producer_id in producers:
-                if producer_id in middleware.producers:
-                    del middleware.producers[producer_id]
-            for observer_id in observers:
-                if observer_id in middleware.observers:
-                    del middleware.observers[observer_id]
-                    
         except Exception as e:
             # 如果某个测试出现异常，记录错误并继续下一个测试
-            results.append({
-                "message_size": size,
-                "error": str(e)
-            })
-            continue
-    
-    # 正确返回测试结果
-    formatted_results = []
-    for result in results:
-        if "error" in result:
-            formatted_results.append(result)
-        else:
-            formatted_results.append({
-                "message_size": result["message_size"],
-                "total_messages": result["total_messages"],
-                "duration": round(result["duration"], 2),
-                "throughput_msg_per_sec": round(result["throughput_msg_per_sec"], 2),
-                "throughput_kb_per_sec": round(result["throughput_kb_per_sec"], 2)
-            })
-    
-    return jsonify({
+            results.append({"message_size": size, "error": str(e)})
+    return {
         "test_type": "benchmark",
-        "results": formatted_results
+        "results": results
+    }
+
+@app.route('/benchmark', methods=['GET'])
+def benchmark():
+    messages = int(request.args.get('messages', 5000))
+    success, msg = benchmark_jobs.start('benchmark', _benchmark_job, messages)
+    return jsonify({"success": success, "msg": msg, "job": "benchmark"})
+
+@app.route('/get_benchmark_result', methods=['GET'])
+def get_benchmark_result():
+    """state为running时继续轮询；done时result为测试结果，failed时error为异常信息"""
+    return jsonify(benchmark_jobs.status(request.args.get('job', 'throughput')))
+
+# 17. 新增：消费组接口（组内成员竞争消费，每条消息只分配给一个成员）
+@app.route('/create_consumer_group', methods=['POST'])
+def create_consumer_group():
+    data = request.json
+    success, msg = middleware.create_consumer_group(data.get('group_id'), data.get('strategy', GROUP_ROUND_ROBIN))
+    return jsonify({"success": success, "msg": msg})
+
+@app.route('/delete_consumer_group', methods=['POST'])
+def delete_consumer_group():
+    data = request.json
+    success, msg = middleware.delete_consumer_group(data.get('group_id'))
+    return jsonify({"success": success, "msg": msg})
+
+@app.route('/join_consumer_group', methods=['POST'])
+def join_consumer_group():
+    data = request.json
+    success, msg = middleware.join_consumer_group(data.get('group_id'), data.get('observer_id'))
+    return jsonify({"success": success, "msg": msg})
+
+@app.route('/leave_consumer_group', methods=['POST'])
+def leave_consumer_group():
+    data = request.json
+    success, msg = middleware.leave_consumer_group(data.get('group_id'), data.get('observer_id'))
+    return jsonify({"success": success, "msg": msg})
+
+@app.route('/group_subscribe_topic', methods=['POST'])
+def group_subscribe_topic():
+    data = request.json
+    from_offset = data.get('from_offset')  # 可选：默认从组已提交的偏移量追赶（仅持久化主题）
+    if from_offset is not None:
+        from_offset = int(from_offset)
+    success, msg = middleware.group_subscribe_topic(data.get('group_id'), data.get('topic_name'), from_offset)
+    return jsonify({"success": success, "msg": msg})
+
+@app.route('/group_unsubscribe_topic', methods=['POST'])
+def group_unsubscribe_topic():
+    data = request.json
+    success, msg = middleware.group_unsubscribe_topic(data.get('group_id'), data.get('topic_name'))
+    return jsonify({"success": success, "msg": msg})
+
+@app.route('/commit_group_offset', methods=['POST'])
+def commit_group_offset():
+    data = request.json
+    success, msg, committed = middleware.commit_group_offset(
+        data.get('group_id'), data.get('observer_id'), data.get('topic_name'), int(data.get('offset', 0)))
+    return jsonify({"success": success, "msg": msg, "committed_offset": committed})
+
+@app.route('/get_consumer_groups', methods=['GET'])
+def get_consumer_groups():
+    return jsonify(middleware.get_consumer_groups())
+
+# 18. 新增：消息确认（至少一次投递）、拒绝与死信
+@app.route('/configure_topic_acks', methods=['POST'])
+def configure_topic_acks():
+    data = request.json
+    success, msg = middleware.configure_topic_acks(
+        data.get('topic_name'), bool(data.get('enabled', True)),
+        float(data.get('visibility_timeout', DEFAULT_VISIBILITY_TIMEOUT)),
+        int(data.get('max_attempts', DEFAULT_MAX_ATTEMPTS)),
+        data.get('dead_letter_topic'))
+    return jsonify({"success": success, "msg": msg})
+
+def _request_offsets(data):
+    # 支持单个offset或offsets数组
+    offsets = data.get('offsets')
+    if offsets is None:
+        offsets = [data.get('offset')]
+    return [int(offset) for offset in offsets if offset is not None]
+
+@app.route('/ack_messages', methods=['POST'])
+def ack_messages():
+    data = request.json
+    success, msg, count = middleware.ack_messages(
+        data.get('consumer_id') or data.get('observer_id'), data.get('topic_name'), _request_offsets(data))
+    return jsonify({"success": success, "msg": msg, "count": count})
+
+@app.route('/nack_messages', methods=['POST'])
+def nack_messages():
+    data = request.json
+    success, msg, count = middleware.nack_messages(
+        data.get('consumer_id') or data.get('observer_id'), data.get('topic_name'), _request_offsets(data),
+        bool(data.get('requeue', True)))
+    return jsonify({"success": success, "msg": msg, "count": count})
+
+@app.route('/get_ack_stats', methods=['GET'])
+def get_ack_stats():
+    return jsonify(middleware.get_ack_stats())
+
+# 19. 新增：共享内存负载池状态（槽位占用、写入数、池满时的回退数）
+@app.route('/get_payload_pool_stats', methods=['GET'])
+def get_payload_pool_stats():
+    pool = middleware.payload_pool
+    return jsonify(pool.get_stats() if pool is not None else {})
+
+# 20. 新增：运行指标（Prometheus文本格式：各主题发布/投递计数、发布与扇出耗时直方图、观察者缓冲区与积压等）
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(middleware.render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+# 21. 新增：性能剖析（在一段时间窗口内开启cProfile请求剖析与tracemalloc内存跟踪）
+@app.route('/start_profiling', methods=['POST'])
+def start_profiling():
+    data = request.json or {}
+    success, msg = profiler.start(float(data.get('duration', DEFAULT_PROFILE_DURATION)), bool(data.get('cpu', True)),
+                                  bool(data.get('memory', False)), int(data.get('sample_every', 1)))
+    return jsonify({"success": success, "msg": msg})
+
+@app.route('/stop_profiling', methods=['POST'])
+def stop_profiling():
+    success, msg = profiler.stop()
+    return jsonify({"success": success, "msg": msg})
+
+@app.route('/get_profile', methods=['GET'])
+def get_profile():
+    report = profiler.report(request.args.get('sort', 'cumulative'), int(request.args.get('limit', 30)))
+    if request.args.get('format') == 'text':
+        text = report["cpu_profile"] + '\n'.join(report["memory_top"])
+        return Response(text, content_type='text/plain; charset=utf-8')
+    return jsonify(report)
+
+# 22. 新增：主题的消息保留策略（最长保留时间、最大负载字节数、最大消息数）与各主题的内存占用
+def _optional_number(data, key, convert):
+    value = data.get(key)
+    return convert(value) if value not in (None, '', 0) else None
+
+@app.route('/configure_topic_retention', methods=['POST'])
+def configure_topic_retention():
+    data = request.json
+    success, msg = middleware.configure_topic_retention(
+        data.get('topic_name'), _optional_number(data, 'max_age', float),
+        _optional_number(data, 'max_bytes', int), _optional_number(data, 'max_messages', int))
+    return jsonify({"success": success, "msg": msg})
+
+@app.route('/get_retention_stats', methods=['GET'])
+def get_retention_stats():
+    return jsonify(middleware.get_retention_stats())
+
+@app.route('/get_topic_memory', methods=['GET'])
+def get_topic_memory():
+    return jsonify(middleware.get_topic_memory_usage())
+
+# 23. 新增：主从复制（从节点获取快照后按序号增量拉取发布与拓扑变更事件；主节点需显式开启复制日志）
+def _replication_disabled():
+    return jsonify({"success": False, "msg": "当前实例未开启主节点复制（设置环境变量MQ_REPLICATION_LEADER=1后启动）"}), 404
+
+@app.route('/replication/snapshot', methods=['GET'])
+def replication_snapshot():
+    if middleware.replication_log is None:
+        return _replication_disabled()
+    return Response(json.dumps(build_snapshot(middleware), ensure_ascii=False), content_type='application/json')
+
+@app.route('/replication/events', methods=['GET'])
+def replication_events():
+    log = middleware.replication_log
+    if log is None:
+        return _replication_disabled()
+    instance_id = request.args.get('instance_id')
+    if instance_id is not None and instance_id != middleware.instance_id:
+        # 主节点已重启，序号不再连续
+        return jsonify({"resync": True})
+    result = log.read(int(request.args.get('since', 0)),
+                      min(int(request.args.get('max', DEFAULT_REPLICATION_BATCH)), MAX_REPLICATION_BATCH),
+                      min(float(request.args.get('timeout', 0)), MAX_POLL_TIMEOUT),
+                      request.args.get('follower_id'))
+    if result is None:
+        return jsonify({"resync": True})
+    events, last_seq = result
+    return Response(json.dumps({"events": events, "last_seq": last_seq}, ensure_ascii=False),
+                    content_type='application/json')
+
+@app.route('/replication/status', methods=['GET'])
+def replication_status():
+    log = middleware.replication_log
+    return jsonify({
+        "role": "follower" if follower is not None else "leader",
+        "follower": follower.get_status() if follower is not None else None,
+        "log": log.get_stats() if log is not None else None
     })
 
+# 24. 新增：主题的默认消息优先级（异步投递时按优先级分道排队，加权轮转投递）
+@app.route('/configure_topic_priority', methods=['POST'])
+def configure_topic_priority():
+    data = request.json
+    success, msg = middleware.configure_topic_priority(data.get('topic_name'), data.get('priority', 'normal'))
+    return jsonify({"success": success, "msg": msg})
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # debug模式下reloader的父进程只监视文件、重启子进程，不处理请求：负载池与复制只在处理请求的子进程中创建，
+    # 避免父进程多启动一个从节点
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # 4KB以上的消息内容写入共享内存负载池，扇出时只传递句柄
+        middleware.payload_pool = PayloadPool()
+        start_replication()
+    app.run(debug=True, host='0.0.0.0', port=int(os.environ.get('MQ_PORT', 5000)))
\ No newline at end of file
@@ -0,0 +1,248 @@
+# async_broker.py
+# asyncio版本的中间件核心与HTTP服务：单线程事件循环处理大量并发的生产者/消费者连接
+# 用法：python async_broker.py --port 5001
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import unquote, urlsplit, parse_qs
+
+from middleware_core import MiddlewareCore, ConsumerObserver, render_messages, live_messages
+
+
+# asyncio观察者：写入新消息后唤醒在asyncio.Condition上等待的消费者
+class AsyncConsumerObserver(ConsumerObserver):
+    def __init__(self, observer_id, buffer_capacity):
+        super().__init__(observer_id, buffer_capacity)
+        self.loop = asyncio.get_running_loop()  # 观察者必须在事件循环中创建
+        self.condition = asyncio.Condition()
+        self._notify_scheduled = False          # 合并同一轮事件循环内的多次唤醒
+
+    def update(self, message, topic_name):
+        super().update(message, topic_name)
+        self._schedule_notify()
+
+    def update_batch(self, messages, topic_name):
+        super().update_batch(messages, topic_name)
+        self._schedule_notify()
+
+    def _schedule_notify(self):
+        if self._notify_scheduled:
+            return
+        self._notify_scheduled = True
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self.loop.create_task(self._notify())
+        else:
+            # 由其他线程（如异步投递线程池）写入时，切回事件循环线程唤醒
+            self.loop.call_soon_threadsafe(lambda: self.loop.create_task(self._notify()))
+
+    async def _notify(self):
+        self._notify_scheduled = False
+        async with self.condition:
+            self.condition.notify_all()
+
+
+# asyncio版本的中间件核心：复用MiddlewareCore的实体管理，发布与拉取为协程
+class AsyncMiddlewareCore(MiddlewareCore):
+    observer_class = AsyncConsumerObserver
+
+    def __init__(self, config_file='config.json', buffer_capacity=1000):
+        # 不开启线程池投递与持久化，所有操作都在事件循环线程内完成
+        super().__init__(config_file, buffer_capacity, dispatch_workers=0)
+
+    async def publish(self, producer_id, topic_name, message_content):
+        producer = self.producers.get(producer_id)
+        if not producer:
+            return False, f"生产者{producer_id}不存在，请先创建"
+        return producer.publish_message(self, topic_name, message_content)
+
+    async def publish_many(self, producer_id, topic_name, message_contents):
+        producer = self.producers.get(producer_id)
+        if not producer:
+            return False, f"生产者{producer_id}不存在，请先创建"
+        return producer.publish_many(self, topic_name, message_contents)
+
+    async def fetch(self, observer_id, since=0, timeout=0.0, limit=None):
+        """拉取偏移量>=since的消息；暂无新消息时在asyncio.Condition上最多等待timeout秒
+
+        观察者不存在时返回None
+        """
+        observer = self.observers.get(observer_id)
+        if not observer:
+            return None
+        buffer = observer.received_messages
+        if timeout > 0 and buffer.next_offset <= since:
+            try:
+                async with observer.condition:
+                    await asyncio.wait_for(observer.condition.wait_for(lambda: buffer.next_offset > since), timeout)
+            except asyncio.TimeoutError:
+                pass
+        messages, next_offset = buffer.read_since(since, limit)
+        return live_messages(messages), next_offset
+
+
+# 极简HTTP/1.1服务：支持keep-alive与JSON请求体，接口与app.py保持一致
+class AsyncBrokerServer:
+    MAX_BODY_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, core, host='0.0.0.0', port=5001):
+        self.core = core
+        self.host = host
+        self.port = port
+        self.server = None
+        self.routes = {
+            ('POST', '/create_topic'): self.create_topic,
+            ('POST', '/delete_topic'): self.delete_topic,
+            ('POST', '/create_producer'): self.create_producer,
+            ('POST', '/create_observer'): self.create_observer,
+            ('POST', '/subscribe_topic'): self.subscribe_topic,
+            ('POST', '/unsubscribe_topic'): self.unsubscribe_topic,
+            ('POST', '/publish_message'): self.publish_message,
+            ('POST', '/publish_batch'): self.publish_batch,
+            ('POST', '/get_observer_messages'): self.get_observer_messages,
+            ('POST', '/poll_observer_messages'): self.poll_observer_messages,
+            ('GET', '/get_message_logs'): self.get_message_logs,
+            ('GET', '/get_entities'): self.get_entities,
+        }
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port, backlog=4096)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > self.MAX_BODY_SIZE:
+                    await self.write_response(writer, 413, {"success": False, "msg": "请求体过大"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                status, payload = await self.dispatch(method, target, body)
+                await self.write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        handler = self.routes.get((method, unquote(url.path)))
+        if handler is None:
+            return 404, {"success": False, "msg": "接口不存在"}
+        try:
+            data = json.loads(body) if body else {}
+            data.update({key: values[-1] for key, values in parse_qs(url.query).items()})
+            return 200, await handler(data)
+        except (ValueError, TypeError, AttributeError) as e:
+            return 400, {"success": False, "msg": f"请求参数错误：{e}"}
+
+    @staticmethod
+    async def write_response(writer, status, payload, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large'}.get(status, 'OK')
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+            .encode('latin-1') + body)
+        await writer.drain()
+
+    # 接口实现
+    async def create_topic(self, data):
+        success, msg = self.core.create_topic(data.get('topic_name'))
+        return {"success": success, "msg": msg}
+
+    async def delete_topic(self, data):
+        success, msg = self.core.delete_topic(data.get('topic_name'))
+        return {"success": success, "msg": msg}
+
+    async def create_producer(self, data):
+        success, msg = self.core.create_producer(data.get('producer_id'))
+        return {"success": success, "msg": msg}
+
+    async def create_observer(self, data):
+        success, msg = self.core.create_observer(data.get('observer_id'))
+        return {"success": success, "msg": msg}
+
+    async def subscribe_topic(self, data):
+        success, msg = self.core.observer_subscribe_topic(data.get('observer_id'), data.get('topic_name'))
+        return {"success": success, "msg": msg}
+
+    async def unsubscribe_topic(self, data):
+        success, msg = self.core.observer_unsubscribe_topic(data.get('observer_id'), data.get('topic_name'))
+        return {"success": success, "msg": msg}
+
+    async def publish_message(self, data):
+        success, msg = await self.core.publish(data.get('producer_id'), data.get('topic_name'),
+                                               data.get('message_content'))
+        return {"success": success, "msg": msg}
+
+    async def publish_batch(self, data):
+        success, msg = await self.core.publish_many(data.get('producer_id'), data.get('topic_name'),
+                                                    data.get('messages') or [])
+        return {"success": success, "msg": msg}
+
+    async def get_observer_messages(self, data):
+        result = await self.core.fetch(data.get('observer_id'), int(data.get('since', 0)))
+        messages, next_offset = result or ([], 0)
+        return {"messages": render_messages(messages), "next_offset": next_offset}
+
+    async def poll_observer_messages(self, data):
+        timeout = min(float(data.get('timeout', 25)), 30.0)
+        result = await self.core.fetch(data.get('observer_id'), int(data.get('since', 0)), timeout)
+        messages, next_offset = result or ([], 0)
+        return {"messages": render_messages(messages), "next_offset": next_offset}
+
+    async def get_message_logs(self, data):
+        categories = data.get('categories')
+        logs, next_since = self.core.get_message_logs(int(data.get('since', 0)),
+                                                      categories.split(',') if categories else None)
+        return {"logs": logs, "next_since": next_since}
+
+    async def get_entities(self, data):
+        return self.core.get_all_entities()
+
+
+async def serve(host, port, load_config=False, tcp_port=None):
+    core = AsyncMiddlewareCore()
+    if load_config:
+        core.load_config()
+    server = AsyncBrokerServer(core, host, port)
+    await server.start()
+    print(f"asyncio消息中间件已启动：http://{host}:{server.port}（{time.strftime('%H:%M:%S')}）")
+    if tcp_port is not None:
+        # 二进制协议服务与HTTP服务共享同一个中间件核心
+        from wire_protocol import WireProtocolServer
+        tcp_server = WireProtocolServer(core, host, tcp_port)
+        await tcp_server.start()
+        print(f"二进制协议服务已启动：{host}:{tcp_server.port}")
+    async with server.server:
+        await server.server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="asyncio版本的简易消息中间件服务")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--load-config", action="store_true", help="启动时加载config.json")
+    parser.add_argument("--tcp-port", type=int, help="同时启动二进制TCP协议服务的端口")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.load_config, args.tcp_port))
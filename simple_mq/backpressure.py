@@ -0,0 +1,7 @@
+# backpressure.py
+# 背压策略：异步投递队列与消费组积压队列已满时阻塞等待 / 丢弃最旧消息 / 拒绝新消息
+BACKPRESSURE_BLOCK = 'block'
+BACKPRESSURE_DROP_OLDEST = 'drop_oldest'
+BACKPRESSURE_REJECT = 'reject'
+BACKPRESSURE_POLICIES = (BACKPRESSURE_BLOCK, BACKPRESSURE_DROP_OLDEST, BACKPRESSURE_REJECT)
+DEFAULT_BLOCK_TIMEOUT = 5.0       # block策略下的最长等待时间（秒），超时视为拒绝
@@ -0,0 +1,1103 @@
+# benchmark.py
+# 命令行基准测试：stress/groups直接驱动MiddlewareCore，asyncio通过asyncio服务的HTTP接口，
+# suite按参数矩阵直接或经由Flask HTTP层测试，输出延迟分位数、吞吐率与内存峰值的JSON结果
+# 用法：python benchmark.py suite --modes core http --sizes 100 1024 10240 --output results.json
+#       python benchmark.py suite --baseline results.json
+#       python benchmark.py stress --threads 1 2 4 8 --messages 20000
+#       python benchmark.py startup --topics 1000 10000 50000
+#       python benchmark.py churn --subscribers 10000 100000
+#       python benchmark.py groups --consumers 1 2 4 8 --messages 2000 --work-ms 1
+#       python benchmark.py shards --shards 1 2 4 --topics 64 --messages 200000
+#       python benchmark.py payloads --size 10240 --messages 5000 --fanout 8
+#       python benchmark.py filters --subscribers 1000 --distinct 10 --messages 5000
+#       python benchmark.py replication --messages 5000 --batch-sizes 1 500 --pipeline 1 4
+#       python benchmark.py priority --bulk 50000 --fanout 8 --alert-interval-ms 5
+#       python benchmark.py asyncio --producers 500 --consumers 2000
+import argparse
+import asyncio
+import datetime
+import http.client
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+
+from middleware_core import MiddlewareCore, ConsumerObserver
+
+
+def run_stress(producer_threads, messages_per_thread, fanout, topic_count, async_delivery=False, churn=True):
+    """多线程压力测试：多个生产者并发发布，同时另一个线程反复订阅/取消订阅、创建/删除主题
+
+    返回一轮测试的结果字典；lost为稳定订阅者少收到的消息数（正确实现应为0）
+    """
+    core = MiddlewareCore(config_file=None, buffer_capacity=1000)
+    topics = [f"stress_topic_{i}" for i in range(topic_count)]
+    for topic_name in topics:
+        core.create_topic(topic_name)
+        if async_delivery:
+            core.configure_topic_delivery(topic_name, True, 10000, 'block')
+    # 稳定订阅者：订阅全部主题，全程不变，用于校验是否丢消息
+    observers = [f"stress_observer_{i}" for i in range(fanout)]
+    for observer_id in observers:
+        core.create_observer(observer_id)
+        for topic_name in topics:
+            core.observer_subscribe_topic(observer_id, topic_name)
+    producers = [f"stress_producer_{i}" for i in range(producer_threads)]
+    for producer_id in producers:
+        core.create_producer(producer_id)
+
+    sent_counts = [0] * producer_threads
+    errors = []
+    stop_churn = threading.Event()
+
+    def produce(index, producer_id):
+        producer = core.producers[producer_id]
+        try:
+            for i in range(messages_per_thread):
+                success, _ = producer.publish_message(core, topics[i % topic_count], "x")
+                if success:
+                    sent_counts[index] += 1
+        except Exception as e:
+            errors.append(repr(e))
+
+    def churn_entities():
+        # 与发布并发的拓扑变更：临时观察者订阅/取消订阅、临时主题创建/删除
+        core.create_observer("churn_observer")
+        i = 0
+        try:
+            while not stop_churn.is_set():
+                topic_name = topics[i % topic_count]
+                core.observer_subscribe_topic("churn_observer", topic_name)
+                core.create_topic(f"churn_topic_{i}")
+                core.observer_subscribe_topic("churn_observer", f"churn_topic_{i}")
+                core.get_all_entities()
+                core.observer_unsubscribe_topic("churn_observer", topic_name)
+                core.delete_topic(f"churn_topic_{i}")
+                i += 1
+        except Exception as e:
+            errors.append(repr(e))
+
+    threads = [threading.Thread(target=produce, args=(i, p)) for i, p in enumerate(producers)]
+    churn_thread = threading.Thread(target=churn_entities) if churn else None
+    start_time = time.perf_counter()
+    if churn_thread:
+        churn_thread.start()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    expected = sum(sent_counts)
+    # 异步投递模式下等待队列排空
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if all(core.observers[o].received_messages.next_offset >= expected for o in observers):
+            break
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start_time
+    stop_churn.set()
+    if churn_thread:
+        churn_thread.join()
+    if core.dispatcher:
+        core.dispatcher.shutdown()
+
+    received = [core.observers[o].received_messages.next_offset for o in observers]
+    return {
+        "producer_threads": producer_threads,
+        "published": expected,
+        "expected_per_observer": expected,
+        "min_received": min(received),
+        "lost": sum(expected - r for r in received),
+        "errors": errors,
+        "elapsed_sec": round(elapsed, 3),
+        "throughput_msg_per_sec": round(expected / elapsed, 2) if elapsed > 0 else 0.0
+    }
+
+
+def cmd_stress(args):
+    failed = False
+    print(f"{'线程数':>6} {'发布数':>10} {'丢失数':>8} {'耗时(秒)':>10} {'吞吐率(条/秒)':>14}")
+    for thread_count in args.threads:
+        result = run_stress(thread_count, args.messages, args.fanout, args.topics, args.async_delivery, not args.no_churn)
+        print(f"{thread_count:>6} {result['published']:>10} {result['lost']:>8} "
+              f"{result['elapsed_sec']:>10} {result['throughput_msg_per_sec']:>14}")
+        for error in result["errors"]:
+            print(f"  异常：{error}")
+        if result["lost"] or result["errors"]:
+            failed = True
+    if failed:
+        print("压力测试失败：存在丢失的消息或并发异常")
+    return 1 if failed else 0
+
+
+def run_group_bench(consumer_count, message_count, work_ms, strategy='round_robin'):
+    """消费组测试：consumer_count个成员竞争消费同一主题，每条消息模拟work_ms毫秒的处理耗时
+
+    返回一轮测试的结果字典；processed应等于published（每条消息只被组内一个成员处理）
+    """
+    core = MiddlewareCore(config_file=None, buffer_capacity=max(message_count, 1))
+    core.create_topic("group_bench_topic")
+    core.create_producer("group_bench_producer")
+    core.create_consumer_group("group_bench", strategy)
+    core.group_subscribe_topic("group_bench", "group_bench_topic")
+    members = [f"group_member_{i}" for i in range(consumer_count)]
+    for observer_id in members:
+        core.create_observer(observer_id)
+        core.join_consumer_group("group_bench", observer_id)
+    processed = [0] * consumer_count
+    done = threading.Event()
+
+    def consume(index, observer_id):
+        buffer = core.observers[observer_id].received_messages
+        since = 0
+        while not done.is_set():
+            if not buffer.wait_for_messages(since, 0.05):
+                continue
+            messages, since = buffer.read_since(since)
+            for message in messages:
+                time.sleep(work_ms / 1000)
+                processed[index] += 1
+            if messages:
+                core.commit_group_offset("group_bench", observer_id, "group_bench_topic", messages[-1].offset + 1)
+
+    threads = [threading.Thread(target=consume, args=(i, o)) for i, o in enumerate(members)]
+    for t in threads:
+        t.start()
+    start_time = time.perf_counter()
+    producer = core.producers["group_bench_producer"]
+    producer.publish_many(core, "group_bench_topic", ["x"] * message_count)
+    deadline = time.time() + 300
+    while sum(processed) < message_count and time.time() < deadline:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start_time
+    done.set()
+    for t in threads:
+        t.join()
+    stats = core.get_consumer_groups()["group_bench"]
+    return {
+        "consumers": consumer_count,
+        "published": message_count,
+        "processed": sum(processed),
+        "committed_offset": stats["committed_offsets"].get("group_bench_topic", 0),
+        "elapsed_sec": round(elapsed, 3),
+        "throughput_msg_per_sec": round(sum(processed) / elapsed, 2) if elapsed > 0 else 0.0
+    }
+
+
+def cmd_groups(args):
+    failed = False
+    print(f"{'成员数':>6} {'发布数':>8} {'处理数':>8} {'已提交偏移量':>12} {'耗时(秒)':>10} {'吞吐率(条/秒)':>14}")
+    for consumer_count in args.consumers:
+        result = run_group_bench(consumer_count, args.messages, args.work_ms, args.strategy)
+        print(f"{consumer_count:>6} {result['published']:>8} {result['processed']:>8} "
+              f"{result['committed_offset']:>12} {result['elapsed_sec']:>10} {result['throughput_msg_per_sec']:>14}")
+        if result["processed"] != result["published"]:
+            failed = True
+    if failed:
+        print("消费组测试失败：处理数与发布数不一致（重复处理或丢失）")
+    return 1 if failed else 0
+
+
+def run_shard_bench(shard_count, topic_count, message_count, fanout, batch_size):
+    """分片测试：消息均匀分布在topic_count个主题上，路由器按批转发给各分片并行投递
+
+    返回一轮测试的结果字典；delivered应等于published * fanout
+    """
+    from sharded_broker import ShardedBroker
+    with ShardedBroker(shard_count, buffer_capacity=1000) as broker:
+        topics = [f"shard_topic_{i}" for i in range(topic_count)]
+        for topic_name in topics:
+            broker.create_topic(topic_name)
+        broker.create_producer("shard_producer")
+        observers = [f"shard_observer_{i}" for i in range(fanout)]
+        for observer_id in observers:
+            broker.create_observer(observer_id)
+            broker.observer_subscribe_topic(observer_id, "#")
+        items = [(topics[i % topic_count], "x") for i in range(batch_size)]
+        start_time = time.perf_counter()
+        published = 0
+        while published < message_count:
+            published += broker.publish_batch("shard_producer", items)
+        elapsed = time.perf_counter() - start_time
+        delivered = 0
+        for observer_id in observers:
+            # 只需要各分片的写入位置（累计投递条数）：偏移量超过写入位置时只返回写入位置，不传输消息内容
+            _, cursor = broker.fetch(observer_id, [1 << 62] * shard_count, 0)
+            delivered += sum(cursor)
+    return {
+        "shards": shard_count,
+        "published": published,
+        "delivered": delivered,
+        "expected_delivered": published * fanout,
+        "elapsed_sec": round(elapsed, 3),
+        "throughput_msg_per_sec": round(published / elapsed, 2) if elapsed > 0 else 0.0
+    }
+
+
+def cmd_shards(args):
+    failed = False
+    print(f"CPU核数：{os.cpu_count()}")
+    print(f"{'分片数':>6} {'发布数':>10} {'投递数':>10} {'耗时(秒)':>10} {'吞吐率(条/秒)':>14}")
+    for shard_count in args.shards:
+        result = run_shard_bench(shard_count, args.topics, args.messages, args.fanout, args.batch_size)
+        print(f"{shard_count:>6} {result['published']:>10} {result['delivered']:>10} "
+              f"{result['elapsed_sec']:>10} {result['throughput_msg_per_sec']:>14}")
+        if result["delivered"] != result["expected_delivered"]:
+            failed = True
+    if failed:
+        print("分片测试失败：投递数与预期不一致")
+    return 1 if failed else 0
+
+
+def run_payload_bench(message_size, message_count, fanout, use_pool):
+    """大消息扇出测试：对比消息内容保存在Python堆中与写入共享内存负载池时的吞吐率和堆内存峰值"""
+    import tracemalloc
+    from payload_pool import PayloadPool
+    pool = PayloadPool(slot_size=max(message_size, 4096), slot_count=1024, min_size=1) if use_pool else None
+    core = MiddlewareCore(config_file=None, buffer_capacity=1000, payload_pool=pool)
+    core.configure_message_log('publish', 0)
+    core.create_topic("payload_topic")
+    core.create_producer("payload_producer")
+    for i in range(fanout):
+        core.create_observer(f"payload_observer_{i}")
+        core.observer_subscribe_topic(f"payload_observer_{i}", "payload_topic")
+    producer = core.producers["payload_producer"]
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    for i in range(message_count):
+        # 每条消息都是新内容（模拟网络收到的请求体），只在发布时构造一次
+        producer.publish_message(core, "payload_topic", b"%08d" % i + b"x" * (message_size - 8))
+    elapsed = time.perf_counter() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {
+        "payload_pool": use_pool,
+        "published": message_count,
+        "elapsed_sec": round(elapsed, 3),
+        "throughput_msg_per_sec": round(message_count / elapsed, 2) if elapsed > 0 else 0.0,
+        "heap_peak_mb": round(peak / 1024 / 1024, 2),
+        "pool_fallback": pool.fallback_count if pool else 0
+    }
+    core.close()
+    return result
+
+
+def cmd_payloads(args):
+    print(f"消息大小：{args.size}字节，订阅者：{args.fanout}个")
+    print(f"{'负载池':>6} {'发布数':>8} {'耗时(秒)':>10} {'吞吐率(条/秒)':>14} {'堆内存峰值(MB)':>14}")
+    for use_pool in (False, True):
+        result = run_payload_bench(args.size, args.messages, args.fanout, use_pool)
+        print(f"{'是' if use_pool else '否':>6} {result['published']:>8} {result['elapsed_sec']:>10} "
+              f"{result['throughput_msg_per_sec']:>14} {result['heap_peak_mb']:>14}")
+    return 0
+
+
+def run_filter_bench(subscriber_count, distinct_filters, message_count, broker_side):
+    """订阅过滤测试：每个订阅者只关心一个地区的消息，对比在中间件按消息头过滤（订阅时指定过滤表达式）
+    与订阅整个主题后由消费者自行丢弃的吞吐率与写入缓冲区的消息数"""
+    from message_filter import compile_filter
+    # 缓冲区容纳全部消息，消费者自行过滤时不会因覆盖而少算
+    core = MiddlewareCore(config_file=None, buffer_capacity=max(1000, message_count))
+    core.configure_message_log('publish', 0)
+    core.create_topic("filter_topic")
+    core.create_producer("filter_producer")
+    regions = [f"region{i}" for i in range(distinct_filters)]
+    expressions = [f'region = "{region}" AND amount >= 100' for region in regions]
+    consumer_filters = []
+    for i in range(subscriber_count):
+        observer_id = f"filter_observer_{i}"
+        core.create_observer(observer_id)
+        expression = expressions[i % distinct_filters]
+        if broker_side:
+            core.observer_subscribe_topic(observer_id, "filter_topic", filter_expression=expression)
+        else:
+            core.observer_subscribe_topic(observer_id, "filter_topic")
+            consumer_filters.append(compile_filter(expression))
+    producer = core.producers["filter_producer"]
+    headers = [{"region": regions[i % distinct_filters], "amount": (i * 37) % 200} for i in range(message_count)]
+    start_time = time.perf_counter()
+    for i in range(message_count):
+        producer.publish_message(core, "filter_topic", "payload", headers[i])
+    elapsed = time.perf_counter() - start_time
+    buffered = sum(observer.received_messages.next_offset for observer in core.observers.values())
+    if broker_side:
+        wanted = buffered
+    else:
+        # 消费者自行过滤：逐个订阅者判断收到的每条消息
+        wanted = sum(1 for observer, message_filter in zip(core.observers.values(), consumer_filters)
+                     for message in observer.received_messages if message_filter.matches(message.headers, {}))
+    core.close()
+    return {
+        "broker_side": broker_side,
+        "elapsed_sec": round(elapsed, 3),
+        "throughput_msg_per_sec": round(message_count / elapsed, 2) if elapsed > 0 else 0.0,
+        "buffered": buffered,
+        "wanted": wanted
+    }
+
+
+def cmd_filters(args):
+    print(f"订阅者：{args.subscribers}个，不同的过滤条件：{args.distinct}个，发布：{args.messages}条")
+    print(f"{'过滤位置':>8} {'耗时(秒)':>10} {'吞吐率(条/秒)':>14} {'写入缓冲区(条)':>14} {'需要的消息(条)':>14}")
+    for broker_side in (False, True):
+        result = run_filter_bench(args.subscribers, args.distinct, args.messages, broker_side)
+        print(f"{'中间件' if broker_side else '消费者':>8} {result['elapsed_sec']:>10} {result['throughput_msg_per_sec']:>14} "
+              f"{result['buffered']:>14} {result['wanted']:>14}")
+    return 0
+
+
+def run_startup_bench(topic_count, observer_count, subscriptions_per_observer, incremental=True):
+    """启动耗时测试：对比逐个调用创建/订阅接口、从JSON批量加载、从二进制快照批量加载同一拓扑的耗时"""
+    import tempfile
+    from config_snapshot import snapshot_path, read_snapshot
+    topics = [f"region{i % 100}.topic{i}" for i in range(topic_count)]
+    subscriptions = {f"observer_{i}": [topics[(i * subscriptions_per_observer + j) % topic_count]
+                                       for j in range(subscriptions_per_observer)]
+                     for i in range(observer_count)}
+    result = {"topics": topic_count, "observers": observer_count,
+              "subscriptions": observer_count * subscriptions_per_observer}
+    with tempfile.TemporaryDirectory() as directory:
+        config_file = os.path.join(directory, "config.json")
+        with open(config_file, 'w', encoding='utf-8') as f:
+            json.dump({"topics": topics, "producers": ["producer_0"], "observers": list(subscriptions),
+                       "subscriptions": subscriptions}, f, ensure_ascii=False)
+        if incremental:
+            core = MiddlewareCore(config_file=None)
+            start_time = time.perf_counter()
+            for topic_name in topics:
+                core.create_topic(topic_name)
+            core.create_producer("producer_0")
+            for observer_id, topic_list in subscriptions.items():
+                core.create_observer(observer_id)
+                for topic_name in topic_list:
+                    core.observer_subscribe_topic(observer_id, topic_name)
+            result["incremental_sec"] = round(time.perf_counter() - start_time, 3)
+            core.close()
+        core = MiddlewareCore(config_file=config_file)
+        start_time = time.perf_counter()
+        success, msg = core.load_config()
+        result["json_sec"] = round(time.perf_counter() - start_time, 3)
+        assert success and len(core.topics) == topic_count, msg
+        core.save_config(force=True)      # 写入二进制快照
+        result["snapshot_bytes"] = os.path.getsize(snapshot_path(config_file))
+        result["json_bytes"] = os.path.getsize(config_file)
+        core.close()
+        # 只读取解析（不构建实体）的耗时
+        start_time = time.perf_counter()
+        with open(config_file, 'r', encoding='utf-8') as f:
+            json.load(f)
+        result["json_parse_sec"] = round(time.perf_counter() - start_time, 3)
+        start_time = time.perf_counter()
+        read_snapshot(snapshot_path(config_file))
+        result["snapshot_parse_sec"] = round(time.perf_counter() - start_time, 3)
+        core = MiddlewareCore(config_file=config_file)
+        start_time = time.perf_counter()
+        success, msg = core.load_config()
+        result["snapshot_sec"] = round(time.perf_counter() - start_time, 3)
+        assert success and "二进制快照" in msg and len(core.observers) == observer_count, msg
+        core.close()
+    return result
+
+
+def cmd_startup(args):
+    print(f"每个观察者订阅{args.subscriptions}个主题")
+    print(f"{'主题数':>8} {'观察者数':>8} {'订阅数':>8} {'逐个创建(秒)':>12} {'JSON加载(秒)':>12} {'快照加载(秒)':>12} "
+          f"{'JSON解析(秒)':>12} {'快照解析(秒)':>12} {'JSON(KB)':>10} {'快照(KB)':>10}")
+    for topic_count in args.topics:
+        observer_count = max(1, topic_count // args.topics_per_observer)
+        result = run_startup_bench(topic_count, observer_count, args.subscriptions, not args.skip_incremental)
+        print(f"{result['topics']:>8} {result['observers']:>8} {result['subscriptions']:>8} "
+              f"{result.get('incremental_sec', '-')!s:>12} {result['json_sec']:>12} {result['snapshot_sec']:>12} "
+              f"{result['json_parse_sec']:>12} {result['snapshot_parse_sec']:>12} "
+              f"{result['json_bytes'] // 1024:>10} {result['snapshot_bytes'] // 1024:>10}")
+    return 0
+
+
+def run_churn_bench(subscriber_count):
+    """订阅变更测试：大量观察者订阅/取消订阅同一主题后删除主题，以及单个观察者订阅大量主题后被删除
+
+    返回各阶段耗时（秒）；订阅索引为字典时各阶段耗时应与订阅者数量成线性关系
+    """
+    core = MiddlewareCore(config_file=None)
+    core.create_producer("producer_0")
+    observer_ids = [f"observer_{i}" for i in range(subscriber_count)]
+    for observer_id in observer_ids:
+        core.create_observer(observer_id)
+    result = {"subscribers": subscriber_count}
+
+    def timed(name, func):
+        start_time = time.perf_counter()
+        func()
+        result[name] = round(time.perf_counter() - start_time, 3)
+
+    # 宽主题：所有观察者订阅同一个主题
+    core.create_topic("churn.wide")
+    timed("subscribe_sec", lambda: [core.observer_subscribe_topic(o, "churn.wide") for o in observer_ids])
+    timed("publish_sec", lambda: core.producers["producer_0"].publish_message(core, "churn.wide", "churn"))
+    timed("unsubscribe_sec", lambda: [core.observer_unsubscribe_topic(o, "churn.wide") for o in observer_ids[::2]])
+    timed("delete_topic_sec", lambda: core.delete_topic("churn.wide"))
+    assert all(not core.observers[o].subscribed_topics for o in observer_ids)
+    timed("delete_observers_sec", lambda: [core.delete_observer(o) for o in observer_ids])
+    # 深观察者：一个观察者订阅大量主题
+    topics = [f"churn.deep.{i}" for i in range(subscriber_count)]
+    for topic_name in topics:
+        core.create_topic(topic_name)
+    core.create_observer("observer_deep")
+    timed("deep_subscribe_sec", lambda: [core.observer_subscribe_topic("observer_deep", t) for t in topics])
+    timed("deep_delete_observer_sec", lambda: core.delete_observer("observer_deep"))
+    assert all(not core.topics[t].observers for t in topics)
+    core.close()
+    return result
+
+
+def cmd_churn(args):
+    print("宽主题：N个观察者订阅同一主题，取消一半订阅后删除主题；深观察者：一个观察者订阅N个主题后被删除")
+    print(f"{'订阅者数':>8} {'订阅(秒)':>10} {'发布(秒)':>10} {'取消一半(秒)':>12} {'删除主题(秒)':>12} "
+          f"{'删除观察者(秒)':>14} {'深订阅(秒)':>10} {'删除深观察者(秒)':>16}")
+    for subscriber_count in args.subscribers:
+        result = run_churn_bench(subscriber_count)
+        print(f"{subscriber_count:>8} {result['subscribe_sec']:>10} {result['publish_sec']:>10} "
+              f"{result['unsubscribe_sec']:>12} {result['delete_topic_sec']:>12} "
+              f"{result['delete_observers_sec']:>14} {result['deep_subscribe_sec']:>10} "
+              f"{result['deep_delete_observer_sec']:>16}")
+    return 0
+
+
+class ClassLatencyObserver(ConsumerObserver):
+    """按消息头中的流量类别记录从发布到写入观察者缓冲区的延迟"""
+
+    def __init__(self, observer_id, buffer_capacity):
+        super().__init__(observer_id, buffer_capacity)
+        self.latencies = {}
+
+    def update(self, message, topic_name):
+        self.update_batch((message,), topic_name)
+
+    def update_batch(self, messages, topic_name):
+        super().update_batch(messages, topic_name)
+        now = time.time()
+        latencies = self.latencies
+        for message in messages:
+            latencies.setdefault(message.headers["class"], []).append(now - message.timestamp)
+
+
+# 混合负载的流量类别：(名称, 优先级)，系统警报与安全事件为需要及时处理的高优先级消息，用户活动为批量发布的大流量
+PRIORITY_CLASSES = (("系统警报", "high"), ("安全事件", "high"), ("用户活动", "low"))
+
+
+def run_priority_bench(bulk_messages, fanout, alert_interval_ms, use_priority, batch_size=100):
+    """优先级测试：系统警报、安全事件与大量用户活动事件共用一个异步投递主题（单个投递线程），
+    用户活动按批持续涌入使队列积压，系统警报与安全事件按固定间隔逐条发布；
+    use_priority为False时三类消息使用同一优先级（按到达顺序投递），作为对照"""
+    from priority_lanes import parse_priority
+    core = MiddlewareCore(config_file=None, buffer_capacity=1000, dispatch_workers=1)
+    core.observer_class = ClassLatencyObserver
+    core.configure_message_log('publish', 0)
+    core.create_topic("事件总线")
+    core.configure_topic_delivery("事件总线", True, max_queue_size=bulk_messages + 10000)
+    core.create_producer("priority_producer")
+    for i in range(fanout):
+        core.create_observer(f"priority_observer_{i}")
+        core.observer_subscribe_topic(f"priority_observer_{i}", "事件总线")
+    producer = core.producers["priority_producer"]
+    done = threading.Event()
+
+    def publish_alerts(name, priority):
+        level = parse_priority(priority) if use_priority else None
+        while not done.is_set():
+            producer.publish_message(core, "事件总线", f"{name}", {"class": name}, level)
+            done.wait(alert_interval_ms / 1000)
+
+    alert_threads = [threading.Thread(target=publish_alerts, args=item) for item in PRIORITY_CLASSES[:2]]
+    for thread in alert_threads:
+        thread.start()
+    bulk_name, bulk_priority = PRIORITY_CLASSES[2]
+    bulk_level = parse_priority(bulk_priority) if use_priority else None
+    start_time = time.perf_counter()
+    for start in range(0, bulk_messages, batch_size):
+        count = min(batch_size, bulk_messages - start)
+        producer.publish_many(core, "事件总线", ["x" * 64] * count, headers=[{"class": bulk_name}] * count,
+                              priorities=[bulk_level] * count)
+    while core.get_queue_depths()["事件总线"]["depth"]:
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - start_time
+    done.set()
+    for thread in alert_threads:
+        thread.join()
+    core.configure_topic_delivery("事件总线", False)
+    merged = {}
+    for observer in core.observers.values():
+        for name, values in observer.latencies.items():
+            merged.setdefault(name, []).extend(values)
+    core.close()
+    result = {"use_priority": use_priority, "elapsed_sec": round(elapsed, 3), "classes": {}}
+    for name, priority in PRIORITY_CLASSES:
+        values = merged.get(name, [])
+        result["classes"][name] = {"priority": priority if use_priority else "normal", "delivered": len(values),
+                                   **percentiles(values, (0.5, 0.99)),
+                                   "max_ms": round(max(values, default=0.0) * 1000, 3)}
+    return result
+
+
+def cmd_priority(args):
+    print(f"单个投递线程、{args.fanout}个订阅者；用户活动批量发布{args.bulk}条，"
+          f"系统警报与安全事件每{args.alert_interval_ms}毫秒各发布1条")
+    print(f"{'优先级分道':>10} {'类别':>8} {'优先级':>8} {'投递数':>10} {'p50(毫秒)':>12} {'p99(毫秒)':>12} "
+          f"{'最大(毫秒)':>12} {'总耗时(秒)':>10}")
+    for use_priority in (False, True):
+        result = run_priority_bench(args.bulk, args.fanout, args.alert_interval_ms, use_priority)
+        for name, stats in result["classes"].items():
+            print(f"{'是' if use_priority else '否':>10} {name:>8} {stats['priority']:>8} {stats['delivered']:>10} "
+                  f"{stats['p50_ms']:>12} {stats['p99_ms']:>12} {stats['max_ms']:>12} {result['elapsed_sec']:>10}")
+    return 0
+
+
+def _http_json(port, method, path, payload=None):
+    """向本机HTTP接口发送一个请求，返回(状态码, JSON响应)"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else None
+        connection.request(method, path, body, {'Content-Type': 'application/json'} if body else {})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def _follower_process(leader_port, batch_size, pipeline_depth, buffer_capacity, conn):
+    """从节点进程：本地的中间件协调器追随主节点，并提供只读的HTTP接口；收到结束通知后退出"""
+    import app as app_module
+    from replication import ReplicationFollower
+    core = MiddlewareCore(config_file=None, buffer_capacity=buffer_capacity)
+    core.configure_message_log('publish', 0)
+    follower = ReplicationFollower(core, f"http://127.0.0.1:{leader_port}", batch_size=batch_size,
+                                   pipeline_depth=pipeline_depth, poll_timeout=1.0)
+    server, port = _start_http_server(core)
+    app_module.follower = follower
+    follower.start()
+    conn.send(port)
+    conn.recv()
+    follower.stop()
+    server.shutdown()
+    core.close()
+
+
+def run_replication_bench(message_count, batch_size, pipeline_depth, fanout=4):
+    """主从复制测试：从节点在独立进程中运行，主节点先发布一部分消息（随快照同步），
+    从节点同步后新增订阅者（随拓扑变更事件同步），再逐条发布其余消息；
+    记录发布期间从节点的最大落后事件数/秒数，以及发布结束后追上主节点的耗时，并校验两边的消息数与实体一致"""
+    capacity = max(1000, message_count)
+    core = MiddlewareCore(config_file=None, buffer_capacity=capacity)
+    core.configure_message_log('publish', 0)
+    core.create_topic("replica_topic")
+    core.create_producer("replica_producer")
+    for i in range(fanout):
+        core.create_observer(f"replica_observer_{i}")
+        core.observer_subscribe_topic(f"replica_observer_{i}", "replica_topic")
+    producer = core.producers["replica_producer"]
+    early_count = message_count // 10
+    for i in range(early_count):
+        producer.publish_message(core, "replica_topic", f"early-{i}")
+    from replication import ReplicationLog
+    core.enable_replication(ReplicationLog())
+    server, port = _start_http_server(core)
+    context = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = context.Pipe()
+    process = context.Process(target=_follower_process,
+                              args=(port, batch_size, pipeline_depth, capacity, child_conn), daemon=True)
+    process.start()
+    follower_port = parent_conn.recv()
+    deadline = time.time() + 30
+    while _http_json(follower_port, 'GET', '/replication/status')[1]["follower"]["snapshots"] < 1:
+        if time.time() > deadline:
+            raise RuntimeError("从节点未能完成初始同步")
+        time.sleep(0.05)
+    core.create_observer("replica_late_observer")
+    core.observer_subscribe_topic("replica_late_observer", "replica_topic")
+
+    samples = []
+    stop_sampling = threading.Event()
+
+    def sample_lag():
+        while not stop_sampling.is_set():
+            status = _http_json(follower_port, 'GET', '/replication/status')[1]["follower"]
+            samples.append((status["lag_events"], status["lag_seconds"]))
+            stop_sampling.wait(0.02)
+
+    sampler = threading.Thread(target=sample_lag)
+    sampler.start()
+    start_time = time.perf_counter()
+    for i in range(message_count - early_count):
+        producer.publish_message(core, "replica_topic", f"message-{i}")
+    elapsed = time.perf_counter() - start_time
+    last_seq = core.replication_log.last_seq
+    while _http_json(follower_port, 'GET', '/replication/status')[1]["follower"]["applied_seq"] < last_seq:
+        if time.perf_counter() - start_time > 120:
+            break
+        time.sleep(0.005)
+    catch_up = time.perf_counter() - start_time - elapsed
+    stop_sampling.set()
+    sampler.join()
+
+    leader_counts = [len(core.get_observer_messages(observer_id)[0])
+                     for observer_id in [f"replica_observer_{i}" for i in range(fanout)] + ["replica_late_observer"]]
+    follower_counts = [len(_http_json(follower_port, 'POST', '/get_observer_messages',
+                                      {'observer_id': observer_id, 'since': 0})[1]["messages"])
+                       for observer_id in [f"replica_observer_{i}" for i in range(fanout)] + ["replica_late_observer"]]
+    entities_match = _http_json(follower_port, 'GET', '/get_entities')[1] == core.get_all_entities()
+    write_status, _ = _http_json(follower_port, 'POST', '/create_topic', {'topic_name': 'replica_write'})
+    parent_conn.send(None)
+    process.join(10)
+    server.shutdown()
+    core.close()
+    return {
+        "batch_size": batch_size,
+        "pipeline_depth": pipeline_depth,
+        "published": message_count,
+        "publish_sec": round(elapsed, 3),
+        "catch_up_sec": round(catch_up, 3),
+        "max_lag_events": max((lag for lag, _ in samples), default=0),
+        "max_lag_sec": max((seconds for _, seconds in samples), default=0.0),
+        "replicated_msg_per_sec": round((message_count - early_count) / (elapsed + catch_up), 2),
+        "counts_match": leader_counts == follower_counts,
+        "entities_match": entities_match,
+        "write_rejected": write_status == 403
+    }
+
+
+def cmd_replication(args):
+    failed = False
+    print(f"主节点先发布{args.messages // 10}条消息（随快照同步），从节点同步后逐条发布其余消息")
+    print(f"{'批大小':>6} {'流水线':>6} {'发布(秒)':>10} {'追上(秒)':>10} {'最大落后(事件)':>14} "
+          f"{'最大延迟(秒)':>12} {'复制吞吐(条/秒)':>16} {'一致':>4}")
+    for batch_size in args.batch_sizes:
+        for pipeline_depth in args.pipeline:
+            result = run_replication_bench(args.messages, batch_size, pipeline_depth, args.fanout)
+            consistent = result["counts_match"] and result["entities_match"] and result["write_rejected"]
+            print(f"{batch_size:>6} {pipeline_depth:>6} {result['publish_sec']:>10} {result['catch_up_sec']:>10} "
+                  f"{result['max_lag_events']:>14} {result['max_lag_sec']:>12} "
+                  f"{result['replicated_msg_per_sec']:>16} {'是' if consistent else '否':>4}")
+            if not consistent:
+                failed = True
+    if failed:
+        print("主从复制测试失败：从节点的消息数、实体与主节点不一致，或从节点接受了修改请求")
+    return 1 if failed else 0
+
+
+async def http_request(reader, writer, method, path, payload=None):
+    """在keep-alive连接上发送一个JSON请求并读取响应"""
+    body = json.dumps(payload or {}, ensure_ascii=False).encode('utf-8')
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+    await writer.drain()
+    await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return json.loads(await reader.readexactly(length))
+
+
+async def run_asyncio_bench(producer_connections, consumer_connections, messages_per_producer):
+    """启动asyncio服务，建立大量并发连接：消费者长轮询等待新消息，生产者持续发布"""
+    from async_broker import AsyncMiddlewareCore, AsyncBrokerServer
+    core = AsyncMiddlewareCore(config_file=None)
+    server = AsyncBrokerServer(core, '127.0.0.1', 0)
+    await server.start()
+    core.create_topic("async_bench_topic")
+    for i in range(producer_connections):
+        core.create_producer(f"async_producer_{i}")
+    for i in range(consumer_connections):
+        core.create_observer(f"async_consumer_{i}")
+        core.observer_subscribe_topic(f"async_consumer_{i}", "async_bench_topic")
+    expected = producer_connections * messages_per_producer
+    received = [0] * consumer_connections
+
+    async def consumer(index):
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        since = 0
+        while since < expected:
+            result = await http_request(reader, writer, 'POST', '/poll_observer_messages',
+                                        {"observer_id": f"async_consumer_{index}", "since": since, "timeout": 10})
+            received[index] += len(result["messages"])
+            since = result["next_offset"]
+        writer.close()
+
+    async def producer(index):
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+        for i in range(messages_per_producer):
+            await http_request(reader, writer, 'POST', '/publish_message',
+                               {"producer_id": f"async_producer_{index}", "topic_name": "async_bench_topic",
+                                "message_content": "x"})
+        writer.close()
+
+    consumers = [asyncio.create_task(consumer(i)) for i in range(consumer_connections)]
+    await asyncio.sleep(0.5)  # 等待消费者连接建立并进入长轮询
+    start_time = time.perf_counter()
+    await asyncio.gather(*(producer(i) for i in range(producer_connections)))
+    publish_elapsed = time.perf_counter() - start_time
+    await asyncio.wait_for(asyncio.gather(*consumers), 60)
+    elapsed = time.perf_counter() - start_time
+    server.server.close()
+    await server.server.wait_closed()
+    return {
+        "connections": producer_connections + consumer_connections,
+        "published": expected,
+        "delivered": sum(received),
+        "expected_delivered": expected * consumer_connections,
+        "publish_msg_per_sec": round(expected / publish_elapsed, 2),
+        "deliver_msg_per_sec": round(sum(received) / elapsed, 2),
+        "elapsed_sec": round(elapsed, 3)
+    }
+
+
+def cmd_asyncio(args):
+    result = asyncio.run(run_asyncio_bench(args.producers, args.consumers, args.messages))
+    print(f"并发连接数：{result['connections']}")
+    print(f"发布：{result['published']}条，{result['publish_msg_per_sec']}条/秒")
+    print(f"投递：{result['delivered']}/{result['expected_delivered']}条，{result['deliver_msg_per_sec']}条/秒")
+    print(f"总耗时：{result['elapsed_sec']}秒")
+    return 0 if result["delivered"] == result["expected_delivered"] else 1
+
+
+# 基准测试套件：每个参数组合在独立的子进程中运行，内存峰值互不影响
+class LatencyObserver(ConsumerObserver):
+    """记录每条消息从发布（消息时间戳）到写入观察者缓冲区的延迟"""
+
+    def __init__(self, observer_id, buffer_capacity):
+        super().__init__(observer_id, buffer_capacity)
+        self.latencies = []
+
+    def update(self, message, topic_name):
+        super().update(message, topic_name)
+        self.latencies.append(time.time() - message.timestamp)
+
+    def update_batch(self, messages, topic_name):
+        super().update_batch(messages, topic_name)
+        now = time.time()
+        self.latencies.extend(now - message.timestamp for message in messages)
+
+
+class BenchCore(MiddlewareCore):
+    observer_class = LatencyObserver
+
+
+def percentiles(values, quantiles=(0.5, 0.95, 0.99)):
+    """返回各分位数（毫秒）"""
+    if not values:
+        return {f"p{int(q * 100)}_ms": None for q in quantiles}
+    values = sorted(values)
+    return {f"p{int(q * 100)}_ms": round(values[int(q * (len(values) - 1))] * 1000, 3) for q in quantiles}
+
+
+def peak_rss_mb():
+    """当前进程的内存峰值（Linux下ru_maxrss单位为KB，macOS下为字节）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 2)
+
+
+def _start_http_server(core):
+    """在后台线程中启动Flask应用（使用给定的中间件核心），返回(服务器, 端口)"""
+    import logging
+    from werkzeug.serving import make_server
+    import app as app_module
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app_module.middleware.close()
+    app_module.middleware = core
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_port
+
+
+def run_case(mode='core', message_size=1024, producers=1, fanout=1, topics=1, messages_per_producer=2000,
+             async_delivery=False):
+    """运行一个参数组合：producers个生产者线程向topics个主题轮流发布，每条消息投递给fanout个观察者
+
+    mode为core时直接调用MessageProducer.publish_message，为http时经由Flask的/publish_message接口
+    """
+    core = BenchCore(config_file=None, buffer_capacity=1000)
+    topic_names = [f"bench_topic_{i}" for i in range(topics)]
+    for topic_name in topic_names:
+        core.create_topic(topic_name)
+        if async_delivery:
+            core.configure_topic_delivery(topic_name, True, 10000, 'block')
+    observers = []
+    for i in range(fanout):
+        core.create_observer(f"bench_observer_{i}")
+        for topic_name in topic_names:
+            core.observer_subscribe_topic(f"bench_observer_{i}", topic_name)
+        observers.append(core.observers[f"bench_observer_{i}"])
+    for i in range(producers):
+        core.create_producer(f"bench_producer_{i}")
+    payload = "x" * message_size  # 消息内容只构造一次
+    sent_counts = [0] * producers
+    request_latencies = [[] for _ in range(producers)]
+    server = None
+    if mode == 'http':
+        server, port = _start_http_server(core)
+
+    def produce_core(index):
+        producer = core.producers[f"bench_producer_{index}"]
+        for i in range(messages_per_producer):
+            success, _ = producer.publish_message(core, topic_names[i % topics], payload)
+            sent_counts[index] += success
+
+    def produce_http(index):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        headers = {"Content-Type": "application/json"}
+        for i in range(messages_per_producer):
+            body = json.dumps({"producer_id": f"bench_producer_{index}", "topic_name": topic_names[i % topics],
+                               "message_content": payload})
+            sent_at = time.perf_counter()
+            conn.request('POST', '/publish_message', body, headers)
+            success = json.loads(conn.getresponse().read())["success"]
+            request_latencies[index].append(time.perf_counter() - sent_at)
+            sent_counts[index] += success
+        conn.close()
+
+    threads = [threading.Thread(target=produce_http if mode == 'http' else produce_core, args=(i,))
+               for i in range(producers)]
+    start_time = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    expected = sum(sent_counts) * fanout
+    deadline = time.time() + 60
+    while sum(len(o.latencies) for o in observers) < expected and time.time() < deadline:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start_time
+    if server is not None:
+        server.shutdown()
+    core.close()
+    published = sum(sent_counts)
+    result = {
+        "mode": mode,
+        "message_size": message_size,
+        "producers": producers,
+        "fanout": fanout,
+        "topics": topics,
+        "async_delivery": async_delivery,
+        "published": published,
+        "delivered": sum(len(o.latencies) for o in observers),
+        "elapsed_sec": round(elapsed, 3),
+        "throughput_msg_per_sec": round(published / elapsed, 2) if elapsed > 0 else 0.0,
+        "throughput_kb_per_sec": round(published * message_size / 1024 / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency": percentiles([latency for o in observers for latency in o.latencies]),
+        "peak_rss_mb": peak_rss_mb()
+    }
+    if mode == 'http':
+        result["request_latency"] = percentiles([latency for values in request_latencies for latency in values])
+    return result
+
+
+def _run_case_kwargs(kwargs):
+    return run_case(**kwargs)
+
+
+# 网页触发的后台测试：请求线程只负责启动，测试在后台线程中运行，结果通过轮询获取；
+# 同一时刻只运行一个测试（多个测试同时运行会互相争抢CPU，结果失真），结果保留到该测试下一次开始
+class BenchmarkJobs:
+    def __init__(self):
+        self.running = None               # 正在运行的测试名称
+        self._jobs = {}                   # key=测试名称，value=最近一次运行的状态
+        self._lock = threading.Lock()
+
+    def start(self, name, func, *args):
+        """在后台线程中运行func(*args)，返回(是否成功, 提示)"""
+        with self._lock:
+            if self.running is not None:
+                return False, f"测试「{self.running}」正在进行中，请稍后再试"
+            self.running = name
+            self._jobs[name] = {"state": "running", "started_at": time.time(), "finished_at": None,
+                                "result": None, "error": None}
+        threading.Thread(target=self._run, args=(name, func, args), name=f"benchmark-{name}", daemon=True).start()
+        return True, f"测试「{name}」已开始"
+
+    def _run(self, name, func, args):
+        try:
+            result, error = func(*args), None
+        except Exception as e:
+            result, error = None, repr(e)
+        with self._lock:
+            self._jobs[name].update(state="failed" if error else "done", finished_at=time.time(),
+                                    result=result, error=error)
+            self.running = None
+
+    def status(self, name):
+        """测试的最近一次运行状态（state为idle/running/done/failed）"""
+        with self._lock:
+            job = self._jobs.get(name)
+            return dict(job, name=name) if job else {"name": name, "state": "idle"}
+
+
+def case_key(result):
+    return (result["mode"], result["message_size"], result["producers"], result["fanout"], result["topics"],
+            result["async_delivery"])
+
+
+def compare_results(results, baseline, tolerance):
+    """与基线结果对比，返回回退的用例列表（吞吐率下降或p99延迟上升超过tolerance比例）"""
+    baseline_by_key = {case_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        base = baseline_by_key.get(case_key(result))
+        if base is None:
+            continue
+        throughput_change = result["throughput_msg_per_sec"] / base["throughput_msg_per_sec"] - 1 \
+            if base["throughput_msg_per_sec"] else 0.0
+        p99, base_p99 = result["latency"]["p99_ms"], base["latency"]["p99_ms"]
+        p99_change = p99 / base_p99 - 1 if p99 is not None and base_p99 else 0.0
+        regressed = throughput_change < -tolerance or p99_change > tolerance
+        print(f"  {case_key(result)}：吞吐率{throughput_change:+.1%}，p99延迟{p99_change:+.1%}"
+              f"{'  <- 回退' if regressed else ''}")
+        if regressed:
+            regressions.append(case_key(result))
+    return regressions
+
+
+def cmd_suite(args):
+    cases = [dict(mode=mode, message_size=size, producers=producers, fanout=fanout, topics=topics,
+                  messages_per_producer=args.messages, async_delivery=args.async_delivery)
+             for mode, size, producers, fanout, topics in itertools.product(
+                 args.modes, args.sizes, args.producers, args.fanouts, args.topics)]
+    print(f"{'模式':>4} {'大小':>6} {'生产者':>6} {'扇出':>4} {'主题':>4} {'吞吐率(条/秒)':>14} "
+          f"{'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'内存峰值(MB)':>12}")
+    results = []
+    # 每个用例在新的子进程中运行（spawn），内存峰值与前一个用例无关
+    context = multiprocessing.get_context('spawn')
+    for case in cases:
+        if args.in_process:
+            result = run_case(**case)
+        else:
+            with context.Pool(1) as pool:
+                result = pool.apply(_run_case_kwargs, (case,))
+        results.append(result)
+        latency = result["latency"]
+        print(f"{result['mode']:>4} {result['message_size']:>6} {result['producers']:>6} {result['fanout']:>4} "
+              f"{result['topics']:>4} {result['throughput_msg_per_sec']:>14} {latency['p50_ms']!s:>9} "
+              f"{latency['p95_ms']!s:>9} {latency['p99_ms']!s:>9} {result['peak_rss_mb']:>12}")
+    report = {
+        "meta": {
+            "created_at": datetime.datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "messages_per_producer": args.messages
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入{args.output}")
+    failed = any(result["delivered"] != result["published"] * result["fanout"] for result in results)
+    if failed:
+        print("存在投递数与预期不一致的用例")
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"与基线{args.baseline}对比（容差{args.tolerance:.0%}）：")
+        if compare_results(results, baseline, args.tolerance):
+            failed = True
+    return 1 if failed else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="简易消息中间件基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    suite = subparsers.add_parser("suite", help="参数矩阵基准测试（延迟分位数、吞吐率、内存峰值，输出JSON）")
+    suite.add_argument("--modes", nargs="+", choices=["core", "http"], default=["core", "http"],
+                       help="core直接调用中间件核心，http经由Flask接口")
+    suite.add_argument("--sizes", type=int, nargs="+", default=[100, 1024, 10240], help="消息大小（字节）")
+    suite.add_argument("--producers", type=int, nargs="+", default=[1, 4], help="生产者线程数")
+    suite.add_argument("--fanouts", type=int, nargs="+", default=[1, 8], help="每条消息的订阅者数量")
+    suite.add_argument("--topics", type=int, nargs="+", default=[1], help="主题数量")
+    suite.add_argument("--messages", type=int, default=2000, help="每个生产者线程发布的消息数")
+    suite.add_argument("--async-delivery", action="store_true", help="主题使用异步投递模式")
+    suite.add_argument("--in-process", action="store_true", help="在当前进程中运行所有用例（内存峰值累计）")
+    suite.add_argument("--output", help="结果JSON文件路径")
+    suite.add_argument("--baseline", help="对比的基线结果JSON文件")
+    suite.add_argument("--tolerance", type=float, default=0.1, help="判定回退的变化比例")
+    suite.set_defaults(func=cmd_suite)
+
+    stress = subparsers.add_parser("stress", help="多线程并发压力测试（校验不丢消息并观察吞吐率随线程数的变化）")
+    stress.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8], help="生产者线程数（可多个）")
+    stress.add_argument("--messages", type=int, default=20000, help="每个生产者线程发布的消息数")
+    stress.add_argument("--fanout", type=int, default=3, help="稳定订阅者数量")
+    stress.add_argument("--topics", type=int, default=4, help="主题数量")
+    stress.add_argument("--async-delivery", action="store_true", help="主题使用异步投递模式")
+    stress.add_argument("--no-churn", action="store_true", help="关闭并发的订阅/主题变更")
+    stress.set_defaults(func=cmd_stress)
+
+    groups = subparsers.add_parser("groups", help="消费组竞争消费测试（观察吞吐率随成员数的变化）")
+    groups.add_argument("--consumers", type=int, nargs="+", default=[1, 2, 4, 8], help="组成员数（可多个）")
+    groups.add_argument("--messages", type=int, default=2000, help="发布的消息数")
+    groups.add_argument("--work-ms", type=float, default=1.0, help="每条消息模拟的处理耗时（毫秒）")
+    groups.add_argument("--strategy", choices=["round_robin", "least_loaded"], default="round_robin", help="分配策略")
+    groups.set_defaults(func=cmd_groups)
+
+    shards = subparsers.add_parser("shards", help="多进程分片测试（观察吞吐率随分片数的变化）")
+    shards.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4], help="分片进程数（可多个）")
+    shards.add_argument("--topics", type=int, default=64, help="主题数量（消息均匀分布）")
+    shards.add_argument("--messages", type=int, default=200000, help="发布的消息总数")
+    shards.add_argument("--fanout", type=int, default=4, help="订阅全部主题的观察者数量")
+    shards.add_argument("--batch-size", type=int, default=2000, help="路由器每批转发的消息数")
+    shards.set_defaults(func=cmd_shards)
+
+    payloads = subparsers.add_parser("payloads", help="大消息扇出测试（对比是否使用共享内存负载池）")
+    payloads.add_argument("--size", type=int, default=10240, help="消息大小（字节）")
+    payloads.add_argument("--messages", type=int, default=5000, help="发布的消息数")
+    payloads.add_argument("--fanout", type=int, default=8, help="订阅者数量")
+    payloads.set_defaults(func=cmd_payloads)
+
+    filters = subparsers.add_parser("filters", help="订阅过滤测试（对比中间件按消息头过滤与消费者自行丢弃）")
+    filters.add_argument("--subscribers", type=int, default=1000, help="订阅者数量")
+    filters.add_argument("--distinct", type=int, default=10, help="不同的过滤条件数（订阅者轮流使用）")
+    filters.add_argument("--messages", type=int, default=5000, help="发布的消息数")
+    filters.set_defaults(func=cmd_filters)
+
+    startup = subparsers.add_parser("startup", help="启动耗时测试（拓扑规模对加载配置耗时的影响）")
+    startup.add_argument("--topics", type=int, nargs="+", default=[1000, 10000, 50000], help="主题数量")
+    startup.add_argument("--topics-per-observer", type=int, default=2, help="观察者数量为主题数除以该值")
+    startup.add_argument("--subscriptions", type=int, default=10, help="每个观察者订阅的主题数")
+    startup.add_argument("--skip-incremental", action="store_true", help="跳过逐个创建的对照测试")
+    startup.set_defaults(func=cmd_startup)
+
+    churn = subparsers.add_parser("churn", help="订阅变更测试（订阅/取消订阅/删除耗时随订阅者数量的变化）")
+    churn.add_argument("--subscribers", type=int, nargs="+", default=[10000, 100000], help="订阅者数量（可多个）")
+    churn.set_defaults(func=cmd_churn)
+
+    replication = subparsers.add_parser("replication", help="主从复制测试（从节点在独立进程中追随主节点，观察复制延迟）")
+    replication.add_argument("--messages", type=int, default=5000, help="发布的消息数")
+    replication.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 500], help="从节点每次拉取的最大事件数")
+    replication.add_argument("--pipeline", type=int, nargs="+", default=[1, 4], help="已拉取、等待应用的批次数上限")
+    replication.add_argument("--fanout", type=int, default=4, help="订阅者数量")
+    replication.set_defaults(func=cmd_replication)
+
+    priority = subparsers.add_parser("priority", help="优先级投递测试（混合负载下各优先级的投递延迟）")
+    priority.add_argument("--bulk", type=int, default=50000, help="批量发布的用户活动消息数")
+    priority.add_argument("--fanout", type=int, default=8, help="订阅者数量")
+    priority.add_argument("--alert-interval-ms", type=float, default=5.0, help="系统警报与安全事件的发布间隔（毫秒）")
+    priority.set_defaults(func=cmd_priority)
+
+    async_bench = subparsers.add_parser("asyncio", help="asyncio服务的大量并发连接测试（单线程事件循环）")
+    async_bench.add_argument("--producers", type=int, default=200, help="生产者连接数")
+    async_bench.add_argument("--consumers", type=int, default=1000, help="长轮询消费者连接数")
+    async_bench.add_argument("--messages", type=int, default=20, help="每个生产者连接发布的消息数")
+    async_bench.set_defaults(func=cmd_asyncio)
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    sys.exit(args.func(args))
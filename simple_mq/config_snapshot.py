@@ -0,0 +1,55 @@
+# config_snapshot.py
+# 配置的二进制快照：与config.json内容相同，使用marshal序列化，加载大规模拓扑时比解析JSON快得多
+# 快照只是JSON配置的缓存：保存配置时同时写入，JSON被手工修改（比快照新）或快照不兼容时仍从JSON加载
+import marshal
+import os
+import tempfile
+
+SNAPSHOT_MAGIC = b'SMQCFG'
+SNAPSHOT_SUFFIX = '.snapshot'
+# marshal格式随Python版本变化，快照头记录写入时的格式版本，不一致时视为不兼容
+_HEADER = SNAPSHOT_MAGIC + bytes([marshal.version])
+
+
+def snapshot_path(config_file):
+    """配置文件对应的快照路径（config.json -> config.snapshot）"""
+    return os.path.splitext(config_file)[0] + SNAPSHOT_SUFFIX
+
+
+def write_snapshot(path, config):
+    """原子写入快照（临时文件+重命名）"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix='.snapshot-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER)
+            marshal.dump(config, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def read_snapshot(path):
+    """读取快照，格式不兼容或文件损坏时抛出ValueError"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(_HEADER):
+        raise ValueError("配置快照格式不兼容")
+    try:
+        config = marshal.loads(memoryview(data)[len(_HEADER):])
+    except (EOFError, TypeError) as e:
+        raise ValueError(f"配置快照已损坏：{e}") from e
+    if not isinstance(config, dict):
+        raise ValueError("配置快照已损坏")
+    return config
+
+
+def snapshot_is_fresh(config_file):
+    """快照存在且不比JSON配置旧时返回True"""
+    path = snapshot_path(config_file)
+    if not os.path.exists(path):
+        return False
+    return not os.path.exists(config_file) or os.path.getmtime(path) >= os.path.getmtime(config_file)
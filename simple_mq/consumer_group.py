@@ -0,0 +1,279 @@
+# consumer_group.py
+# 消费组：组作为一个订阅者注册到主题上，主题的每条消息只分配给组内一个成员（竞争消费）
+# 每个成员已分配但尚未提交的消息记为待处理；成员离开时待处理消息重新分配给其余成员（再均衡）
+# 成员在某个主题上的待处理消息达到上限后不再分配新消息（背压）：消息按偏移量顺序暂存在组的积压队列中，
+# 成员提交释放出空间或新成员加入时再分配；积压队列也有上限，满后按主题的背压策略阻塞等待、丢弃最旧消息或拒绝新消息
+import bisect
+import threading
+import time
+from collections import deque
+from backpressure import BACKPRESSURE_BLOCK, BACKPRESSURE_DROP_OLDEST, DEFAULT_BLOCK_TIMEOUT
+
+GROUP_ROUND_ROBIN = 'round_robin'       # 轮询分配
+GROUP_LEAST_LOADED = 'least_loaded'     # 分配给待处理消息最少的成员
+GROUP_STRATEGIES = (GROUP_ROUND_ROBIN, GROUP_LEAST_LOADED)
+DEFAULT_PENDING_CAPACITY = 1000         # 每个成员在每个主题上最多分配的待处理消息数
+DEFAULT_BACKLOG_CAPACITY = 10000        # 每个主题最多暂存的未分配消息数
+
+
+def _offset_key(message):
+    return getattr(message, 'offset', None) or 0
+
+
+class ConsumerGroup:
+    def __init__(self, group_id, strategy=GROUP_ROUND_ROBIN, pending_capacity=DEFAULT_PENDING_CAPACITY,
+                 backlog_capacity=DEFAULT_BACKLOG_CAPACITY):
+        if strategy not in GROUP_STRATEGIES:
+            raise ValueError(f"未知的分配策略：{strategy}")
+        self.group_id = group_id
+        self.observer_id = group_id           # 作为主题订阅者时的标识
+        self.strategy = strategy
+        self.pending_capacity = pending_capacity
+        self.backlog_capacity = backlog_capacity
+        self.backpressure = None              # 主题名称 -> (背压策略, 阻塞超时)，由中间件设置；None表示阻塞等待
+        self.dropped_count = 0                # 积压队列已满时按drop_oldest策略丢弃的消息数
+        self.rejected_count = 0               # 积压队列已满时被拒绝（含阻塞等待超时）的消息数
+        self.members = ()                     # 组成员（写时复制的元组）
+        self.generation = 0                   # 再均衡代数，每次成员变化递增
+        self.subscribed_topics = {}           # 组订阅的主题（与观察者相同的字典索引，由主题的注册方法维护）
+        self.subscription_lock = threading.Lock()
+        self.committed_offsets = {}           # key=主题名称，value=组已提交的偏移量（该偏移量之前的消息均已处理）
+        self._pending = {}                    # key=成员ID，value={主题名称: 已分配未提交消息的队列}
+        self._load = {}                       # key=成员ID，value=待处理消息数
+        self._delivered_next = {}             # key=主题名称，value=已分配的最大偏移量+1
+        self._backlog = {}                    # key=主题名称，value=暂未分配的消息队列（按偏移量排列）
+        self._cursor = 0                      # 轮询分配的位置
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+
+    # 成员管理
+    def add_member(self, observer):
+        """加入成员并触发再均衡（暂存的未分配消息分配给成员）；已是成员时返回False"""
+        with self._lock:
+            if any(member is observer for member in self.members):
+                return False
+            self.members = self.members + (observer,)
+            self._pending[observer.observer_id] = {}
+            self._load[observer.observer_id] = 0
+            self._rebalance_locked()
+            assigned = self._drain_backlog_locked(list(self._backlog))
+        self._deliver_assigned(assigned)
+        return True
+
+    def remove_member(self, observer):
+        """移除成员并触发再均衡：其已分配未提交的消息按偏移量顺序重新分配；不是成员时返回False"""
+        with self._lock:
+            if not any(member is observer for member in self.members):
+                return False
+            self.members = tuple(member for member in self.members if member is not observer)
+            pending = self._pending.pop(observer.observer_id, {})
+            self._load.pop(observer.observer_id, None)
+            self._rebalance_locked()
+            self._not_full.notify_all()          # 组内已无成员时阻塞等待的发布方不再等待
+        orphaned = []
+        for topic_name, messages in pending.items():
+            orphaned += [(message, topic_name) for message in messages]
+        self._redeliver(orphaned)
+        return True
+
+    def _rebalance_locked(self):
+        self.generation += 1
+        self._cursor = 0
+
+    def _redeliver(self, items):
+        # 按主题分组后批量重新分配，保持每个主题内的偏移量顺序
+        by_topic = {}
+        for message, topic_name in items:
+            by_topic.setdefault(topic_name, []).append(message)
+        for topic_name, messages in by_topic.items():
+            messages.sort(key=_offset_key)
+            # 已分配过的消息不受积压上限限制，保证不丢弃未提交的消息
+            assigned = {}
+            with self._lock:
+                self._assign_locked(messages, topic_name, assigned, bounded=False)
+            self._deliver_assigned(assigned)
+
+    # 消息分配（主题通知订阅者时调用）
+    def _has_room_locked(self, member, topic_name):
+        pending = self._pending[member.observer_id].get(topic_name)
+        return pending is None or len(pending) < self.pending_capacity
+
+    def _pick_member_locked(self, topic_name):
+        """按分配策略选出在该主题上仍有空间的成员，所有成员都已达到待处理上限时返回None"""
+        members = self.members
+        if self.strategy == GROUP_LEAST_LOADED:
+            candidates = [member for member in members if self._has_room_locked(member, topic_name)]
+            if not candidates:
+                return None
+            return min(candidates, key=lambda member: self._load[member.observer_id])
+        for _ in range(len(members)):
+            member = members[self._cursor % len(members)]
+            self._cursor += 1
+            if self._has_room_locked(member, topic_name):
+                return member
+        return None
+
+    def _assign_locked(self, messages, topic_name, assigned, bounded=True):
+        """分配消息并记为待处理，结果按成员汇总到assigned；无法分配的消息进入积压队列
+
+        bounded为True时积压队列已满按背压策略处理；同一批中阻塞等待超时一次后，其余消息直接拒绝
+        """
+        wait = True
+        for message in messages:
+            if bounded and not self._make_room_locked(topic_name, wait):
+                wait = False
+                continue
+            # 已有积压时新消息排在积压之后，保持分配顺序
+            member = None if self._backlog.get(topic_name) else self._pick_member_locked(topic_name)
+            if member is None:
+                self._hold_locked(message, topic_name)
+                continue
+            self._track_locked(member, message, topic_name)
+            batch = assigned.get(member.observer_id)
+            if batch is None:
+                batch = assigned[member.observer_id] = (member, {})
+            batch[1].setdefault(topic_name, []).append(message)
+
+    def _make_room_locked(self, topic_name, wait=True):
+        """积压队列已满时按主题的背压策略腾出空间，返回新消息能否进入；不能进入的消息计入rejected_count"""
+        backlog = self._backlog.get(topic_name)
+        if not backlog or len(backlog) < self.backlog_capacity:
+            return True
+        policy, timeout = (self.backpressure(topic_name) if self.backpressure is not None
+                           else (BACKPRESSURE_BLOCK, DEFAULT_BLOCK_TIMEOUT))
+        if policy == BACKPRESSURE_DROP_OLDEST:
+            backlog.popleft()
+            self.dropped_count += 1
+            return True
+        if policy == BACKPRESSURE_BLOCK and wait and self.members:
+            # 等待成员提交或新成员加入后积压被分配（组内没有成员时无人能腾出空间，不等待）
+            deadline = time.monotonic() + timeout
+            while len(self._backlog.get(topic_name, ())) >= self.backlog_capacity:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.members:
+                    break
+                self._not_full.wait(remaining)
+            if len(self._backlog.get(topic_name, ())) < self.backlog_capacity:
+                return True
+        self.rejected_count += 1
+        return False
+
+    def _hold_locked(self, message, topic_name):
+        backlog = self._backlog.get(topic_name)
+        if backlog is None:
+            backlog = self._backlog[topic_name] = deque()
+        if backlog and _offset_key(message) < _offset_key(backlog[-1]):
+            # 再均衡时退回的旧消息：按偏移量插入，保持积压队列有序
+            backlog.insert(bisect.bisect_right(backlog, _offset_key(message), key=_offset_key), message)
+        else:
+            backlog.append(message)
+
+    def _drain_backlog_locked(self, topic_names):
+        """把积压的消息按顺序分配给仍有空间的成员，返回按成员汇总的分配结果"""
+        assigned = {}
+        for topic_name in topic_names:
+            backlog = self._backlog.get(topic_name)
+            while backlog:
+                member = self._pick_member_locked(topic_name)
+                if member is None:
+                    break
+                message = backlog.popleft()
+                self._track_locked(member, message, topic_name)
+                batch = assigned.get(member.observer_id)
+                if batch is None:
+                    batch = assigned[member.observer_id] = (member, {})
+                batch[1].setdefault(topic_name, []).append(message)
+            if not backlog:
+                self._backlog.pop(topic_name, None)
+        if assigned:
+            self._not_full.notify_all()
+        return assigned
+
+    @staticmethod
+    def _deliver_assigned(assigned):
+        # 在组锁外写入成员的缓冲区，每个成员每个主题只做一次批量追加
+        for member, by_topic in assigned.values():
+            for topic_name, batch in by_topic.items():
+                member.update_batch(batch, topic_name)
+
+    def _track_locked(self, member, message, topic_name):
+        offset = getattr(message, 'offset', None)
+        if offset is None:
+            return
+        if offset >= self._delivered_next.get(topic_name, 0):
+            self._delivered_next[topic_name] = offset + 1
+        pending = self._pending[member.observer_id].get(topic_name)
+        if pending is None:
+            pending = self._pending[member.observer_id][topic_name] = deque()
+        before = len(pending)
+        if pending and offset < pending[-1].offset:
+            # 再均衡时重新分配的旧消息：按偏移量插入，保持待处理队列有序，提交时只需从队头弹出
+            pending.insert(bisect.bisect_right(pending, offset, key=_offset_key), message)
+        else:
+            pending.append(message)
+        self._load[member.observer_id] += len(pending) - before
+
+    def update(self, message, topic_name):
+        with self._lock:
+            if not self._make_room_locked(topic_name):
+                return
+            member = None
+            if self.members and not self._backlog.get(topic_name):
+                member = self._pick_member_locked(topic_name)
+            if member is None:
+                # 组内暂无成员或成员都已达到待处理上限
+                self._hold_locked(message, topic_name)
+                return
+            self._track_locked(member, message, topic_name)
+        member.update(message, topic_name)
+
+    def update_batch(self, messages, topic_name):
+        """整批分配后，每个成员对分到的消息只做一次批量追加"""
+        assigned = {}
+        with self._lock:
+            self._assign_locked(messages, topic_name, assigned)
+        self._deliver_assigned(assigned)
+
+    # 偏移量提交
+    def commit(self, observer_id, topic_name, offset):
+        """成员提交：该成员在主题上偏移量<offset的消息已处理完毕，返回组的已提交偏移量
+
+        组的已提交偏移量为所有成员（及积压消息）中最小的待处理偏移量，只增不减；
+        提交释放出的空间立即用于分配该主题积压的消息
+        """
+        with self._lock:
+            pending = self._pending.get(observer_id, {}).get(topic_name)
+            if pending is None and observer_id not in self._pending:
+                return None
+            while pending and pending[0].offset < offset:
+                pending.popleft()
+                self._load[observer_id] -= 1
+            assigned = self._drain_backlog_locked((topic_name,))
+            low = self._delivered_next.get(topic_name, 0)
+            for member_pending in self._pending.values():
+                messages = member_pending.get(topic_name)
+                if messages:
+                    low = min(low, messages[0].offset)
+            for message in self._backlog.get(topic_name, ()):
+                if getattr(message, 'offset', None) is not None:
+                    low = min(low, message.offset)
+                    break
+            committed = max(low, self.committed_offsets.get(topic_name, 0))
+            self.committed_offsets[topic_name] = committed
+        self._deliver_assigned(assigned)
+        return committed
+
+    def get_stats(self):
+        """获取消费组状态（成员、待处理消息数、已提交偏移量等）"""
+        with self._lock:
+            return {
+                "strategy": self.strategy,
+                "generation": self.generation,
+                "members": [member.observer_id for member in self.members],
+                "topics": list(self.subscribed_topics),
+                "pending": dict(self._load),
+                "unassigned": sum(len(backlog) for backlog in self._backlog.values()),
+                "dropped": self.dropped_count,
+                "rejected": self.rejected_count,
+                "committed_offsets": dict(self.committed_offsets)
+            }
@@ -0,0 +1,186 @@
+# message_filter.py
+# 基于消息头的订阅过滤：订阅时把过滤表达式编译为若干谓词（相等、比较范围、IN集合）的合取，
+# 谓词按(头字段, 运算符, 值)规范化，不同订阅者的过滤器中相同的谓词共用同一个键；
+# 主题投递一条消息时按谓词键缓存求值结果，每个不同的谓词只求值一次
+#
+# 表达式示例：
+#   level = "error"
+#   region IN ("cn", "us") AND amount >= 100 AND amount < 1000
+#   source != 'test' AND retry NOT IN (3, 4)
+# 值可以是数字、带引号的字符串、true/false/null或不带引号的单词（按字符串处理）；
+# 消息没有对应的头字段或类型无法比较时谓词不成立
+import operator
+import re
+
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')|
+    (?P<number>-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?(?![\w.]))|
+    (?P<op>==|!=|>=|<=|=|>|<)|
+    (?P<punct>[(),])|
+    (?P<word>[^\s()=!<>,'"]+)
+)""", re.VERBOSE)
+
+_COMPARISONS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+}
+_LITERALS = {'true': True, 'false': False, 'null': None}
+
+
+def _tokenize(expression):
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if match is None or match.end() == position:
+            raise ValueError(f"无法解析的内容：{expression[position:].strip()[:20]}")
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'string':
+            tokens.append(('value', re.sub(r'\\(.)', r'\1', text[1:-1])))
+        elif kind == 'number':
+            tokens.append(('value', float(text) if any(c in text for c in '.eE') else int(text)))
+        elif kind == 'op':
+            tokens.append(('op', '=' if text == '==' else text))
+        elif kind == 'punct':
+            tokens.append((text, text))
+        else:
+            upper = text.upper()
+            if upper in ('AND', 'IN', 'NOT'):
+                tokens.append((upper, upper))
+            else:
+                tokens.append(('word', text))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.index = 0
+
+    def peek(self):
+        return self.tokens[self.index][0] if self.index < len(self.tokens) else None
+
+    def take(self, *kinds):
+        kind = self.peek()
+        if kind not in kinds:
+            found = self.tokens[self.index][1] if kind is not None else "表达式结尾"
+            raise ValueError(f"此处应为{'/'.join(kinds)}，实际为{found}")
+        token = self.tokens[self.index]
+        self.index += 1
+        return token[1]
+
+    def value(self):
+        kind, text = self.tokens[self.index] if self.index < len(self.tokens) else (None, None)
+        if kind == 'word':
+            self.index += 1
+            return _LITERALS.get(text.lower(), text)
+        return self.take('value')
+
+    def parse(self):
+        predicates = [self.predicate()]
+        while self.peek() == 'AND':
+            self.take('AND')
+            predicates.append(self.predicate())
+        if self.peek() is not None:
+            raise ValueError(f"多余的内容：{self.tokens[self.index][1]}")
+        return predicates
+
+    def predicate(self):
+        field = self.take('word')
+        if self.peek() in ('IN', 'NOT'):
+            op = 'not in' if self.take('IN', 'NOT') == 'NOT' else 'in'
+            if op == 'not in':
+                self.take('IN')
+            self.take('(')
+            values = [self.value()]
+            while self.peek() == ',':
+                self.take(',')
+                values.append(self.value())
+            self.take(')')
+            try:
+                return field, op, frozenset(values)
+            except TypeError:
+                raise ValueError("IN集合中的值必须是数字、字符串或布尔值") from None
+        return field, self.take('op'), self.value()
+
+
+def _compile_predicate(field, op, value):
+    """谓词求值函数：headers为消息头字典（可能为None）"""
+    if op in ('in', 'not in'):
+        expected = op == 'in'
+
+        def evaluate(headers):
+            try:
+                return (headers[field] in value) is expected
+            except (KeyError, TypeError):
+                return False
+        return evaluate
+    compare = _COMPARISONS[op]
+
+    def evaluate(headers):
+        try:
+            return bool(compare(headers[field], value))
+        except (KeyError, TypeError):
+            return False
+    return evaluate
+
+
+def _format_value(value):
+    if isinstance(value, str):
+        return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    if isinstance(value, bool) or value is None:
+        return {True: 'true', False: 'false', None: 'null'}[value]
+    return repr(value)
+
+
+# 编译后的过滤器：谓词的合取；key为谓词键的集合，条件相同（书写顺序、空白不同）的过滤器key相等
+class MessageFilter:
+    __slots__ = ('expression', 'predicates', 'key')
+
+    def __init__(self, expression, predicates):
+        self.expression = expression          # 规范化后的表达式文本（保存配置时使用）
+        self.predicates = predicates          # ((谓词键, 求值函数), ...)
+        self.key = frozenset(predicate_key for predicate_key, _ in predicates)
+
+    def matches(self, headers, results):
+        """判断消息头是否满足全部谓词；results为本条消息的谓词求值缓存（谓词键 -> 结果），多个过滤器共用"""
+        for predicate_key, evaluate in self.predicates:
+            result = results.get(predicate_key)
+            if result is None:
+                result = results[predicate_key] = evaluate(headers)
+            if not result:
+                return False
+        return True
+
+    def __repr__(self):
+        return f"MessageFilter({self.expression!r})"
+
+
+def compile_filter(expression):
+    """编译过滤表达式，表达式无效时抛出ValueError；空表达式返回None（接收全部消息）"""
+    if expression is None or not str(expression).strip():
+        return None
+    parsed = _Parser(_tokenize(str(expression))).parse()
+    predicates = {}
+    for field, op, value in parsed:
+        predicate_key = (field, op, value)
+        if predicate_key not in predicates:
+            predicates[predicate_key] = _compile_predicate(field, op, value)
+    # 规范化：按谓词文本排序，等价的过滤器得到相同的表达式文本
+    texts = []
+    for field, op, value in predicates:
+        if op in ('in', 'not in'):
+            values = ', '.join(sorted(_format_value(item) for item in value))
+            texts.append(f"{field} {op.upper()} ({values})")
+        else:
+            texts.append(f"{field} {op} {_format_value(value)}")
+    order = sorted(range(len(texts)), key=texts.__getitem__)
+    items = list(predicates.items())
+    return MessageFilter(' AND '.join(texts[i] for i in order), tuple(items[i] for i in order))
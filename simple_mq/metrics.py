@@ -0,0 +1,183 @@
+# metrics.py
+# 运行指标：计数器与直方图（按标签值区分子指标），以Prometheus文本格式导出
+# 热路径上的累加按线程分片、不加锁；队列深度、缓冲区大小等状态量在抓取时由采集函数计算
+from bisect import bisect_left
+from threading import get_ident
+
+# 默认的耗时直方图分桶上界（秒）：5微秒到1秒
+DEFAULT_LATENCY_BUCKETS = (0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                           0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# 子指标按线程分片累加：每个线程只写自己的分片（以线程标识为键），热路径上无需加锁，
+# 抓取时再把各分片求和；线程结束后其标识可能被新线程复用，分片数不超过同时存在的线程数
+class _CounterChild:
+    __slots__ = ('_shards',)
+
+    def __init__(self):
+        self._shards = {}
+
+    def inc(self, amount=1):
+        try:
+            self._shards[get_ident()][0] += amount
+        except KeyError:
+            self._shards[get_ident()] = [amount]
+
+    @property
+    def value(self):
+        return sum(shard[0] for shard in list(self._shards.values()))
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', '_shards')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self._shards = {}                     # 每个分片：各桶计数（最后一个为+Inf桶）+ 总和
+
+    def observe(self, value):
+        try:
+            shard = self._shards[get_ident()]
+        except KeyError:
+            shard = self._shards[get_ident()] = [0] * (len(self.bounds) + 1) + [0.0]
+        shard[bisect_left(self.bounds, value)] += 1
+        shard[-1] += value
+
+    def snapshot(self):
+        """返回(各桶计数, 总和, 总数)"""
+        shards = list(self._shards.values())
+        counts = [sum(column) for column in zip(*(shard[:-1] for shard in shards))] or [0] * (len(self.bounds) + 1)
+        total = sum(shard[-1] for shard in shards)
+        return counts, total, sum(counts)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}                      # key=标签值元组，value=子指标
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """按标签值获取子指标（首次访问时创建）；热路径上应保存返回的子指标而不是每次查找
+
+        标签值为字符串键，dict.setdefault是原子操作，并发首次访问时所有线程得到同一个子指标
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"指标{self.name}需要{len(self.labelnames)}个标签值")
+            values = tuple(map(str, values))
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def remove(self, *values):
+        """移除一组标签值（如主题被删除时）"""
+        self._children.pop(tuple(map(str, values)), None)
+
+    def clear(self):
+        self._children.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        children = sorted(list(self._children.items()))
+        for values, child in children:
+            lines += self._render_child(list(zip(self.labelnames, values)), child)
+        return lines
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, pairs, child):
+        return [f"{self.name}{_format_labels(pairs)} {_format_value(child.value)}"]
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_child(self, pairs, child):
+        counts, total, count = child.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip((*self.buckets, float('inf')), counts):
+            cumulative += bucket_count
+            lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', _format_value(float(bound)))])} "
+                         f"{cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(pairs)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(pairs)} {count}")
+        return lines
+
+
+def render_gauge(name, documentation, samples):
+    """状态量（抓取时计算）：samples为[(标签字典, 数值)]"""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+    return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []                    # 抓取时调用的采集函数，返回Prometheus文本行
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        """导出全部指标（Prometheus文本格式）"""
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for collector in self._collectors:
+            lines += collector()
+        return '\n'.join(lines) + '\n'
@@ -1,26 +1,239 @@
 # middleware_core.py
 import json
 import os
+import tempfile
+import threading
+import itertools
+import time
+from collections import deque
 from abc import ABCMeta, abstractmethod
 import datetime
+import functools
+import gc
+from segment_log import DurableLogManager
+from topic_trie import PatternIndex, is_pattern
+from backpressure import (BACKPRESSURE_BLOCK, BACKPRESSURE_DROP_OLDEST, BACKPRESSURE_REJECT, BACKPRESSURE_POLICIES,
+                          DEFAULT_BLOCK_TIMEOUT)
+from consumer_group import ConsumerGroup, GROUP_ROUND_ROBIN, GROUP_STRATEGIES
+from ack_tracker import AckTracker, DEFAULT_VISIBILITY_TIMEOUT, DEFAULT_MAX_ATTEMPTS
+from timer_wheel import TimerWheel
+from retention import RetentionIndex, payload_size
+from message_filter import compile_filter
+from priority_lanes import PriorityLanes, DEFAULT_PRIORITY, PRIORITY_NAMES, parse_priority, priority_name
+from metrics import MetricsRegistry, render_gauge
+from config_snapshot import snapshot_path, write_snapshot, read_snapshot, snapshot_is_fresh
+
+# 每个观察者消息缓冲区的默认容量（条）
+DEFAULT_BUFFER_CAPACITY = 1000
+
+DEFAULT_DISPATCH_QUEUE_SIZE = 1000
+DEFAULT_DISPATCH_WORKERS = 4
+
+# 活动日志的事件类别：实体生命周期 / 消息发布 / 配置变更
+LOG_LIFECYCLE = 'lifecycle'
+LOG_PUBLISH = 'publish'
+LOG_CONFIG = 'config'
+LOG_CATEGORIES = (LOG_LIFECYCLE, LOG_PUBLISH, LOG_CONFIG)
+MESSAGE_LOG_CAPACITY = 100                # 活动日志保留的最近事件数
+
+# 拓扑变更记录保留的最近变更数（客户端落后更多时返回完整实体快照）
+TOPOLOGY_CHANGE_LOG_CAPACITY = 1000
+
+# 发布与扇出耗时直方图的采样间隔（每N次发布/通知记录一次耗时，计数器不采样）
+DEFAULT_LATENCY_SAMPLE_EVERY = 8
+
+# 结构化消息：所有订阅者共享同一个消息对象，仅在网页接口展示时才格式化为字符串
+class Message:
+    __slots__ = ('message_id', 'producer_id', 'topic_name', 'timestamp', 'payload', 'offset', 'expired', 'headers',
+                 'priority')
+
+    def __init__(self, message_id, producer_id, topic_name, timestamp, payload, offset=None, headers=None,
+                 priority=DEFAULT_PRIORITY):
+        self.message_id = message_id      # 全局递增的消息ID
+        self.producer_id = producer_id    # 发布消息的生产者ID
+        self.topic_name = topic_name      # 消息所属主题
+        self.timestamp = timestamp        # 发布时间（epoch秒）
+        self.payload = payload            # 消息内容（引用，不做拷贝；大消息为共享内存负载池的句柄）
+        self.offset = offset              # 消息在主题内的偏移量（主题接收消息时分配）
+        self.expired = False              # 是否已按主题的保留策略清除（内容置为None，读取时跳过）
+        self.headers = headers            # 消息头（字典，可为None），订阅时的过滤表达式按消息头判断
+        self.priority = priority          # 优先级（0高/1普通/2低），异步投递时按优先级分道排队
+
+    def format(self):
+        """格式化为「[生产者ID][时间] 内容」"""
+        current_time = datetime.datetime.fromtimestamp(self.timestamp).strftime("%H:%M:%S")
+        return f"[生产者{self.producer_id}][{current_time}] {self.payload}"
+
+    def render(self):
+        """格式化为观察者消息列表中展示的「[主题：名称] [生产者ID][时间] 内容」"""
+        return f"[主题：{self.topic_name}] {self.format()}"
+
+    def __str__(self):
+        return self.format()
+
+    def __repr__(self):
+        return f"Message(id={self.message_id}, topic={self.topic_name!r}, producer={self.producer_id!r})"
+
+# 活动日志事件：记录时只保存时间戳和格式化参数，读取时才生成展示字符串
+class LogEvent:
+    __slots__ = ('seq', 'timestamp', 'category', 'template', 'args')
+
+    def __init__(self, seq, timestamp, category, template, args):
+        self.seq = seq                    # 全局递增的事件序号（用作增量读取的游标）
+        self.timestamp = timestamp        # 记录时间（epoch秒）
+        self.category = category          # 事件类别（LOG_CATEGORIES之一）
+        self.template = template          # 日志内容，args非空时为str.format模板
+        self.args = args
+
+    def format(self):
+        """格式化为「[时间] 内容」"""
+        current_time = datetime.datetime.fromtimestamp(self.timestamp).strftime("%H:%M:%S")
+        content = self.template.format(*self.args) if self.args else self.template
+        return f"[{current_time}] {content}"
+
+def live_messages(messages):
+    """过滤掉已按保留策略清除的消息（读取位置不受影响，仍按缓冲区偏移量推进）"""
+    return [message for message in messages if type(message) is not Message or not message.expired]
+
+def render_messages(messages):
+    """将观察者缓冲区中的消息格式化为展示字符串（兼容直接投递的字符串消息）"""
+    return [message.render() if isinstance(message, Message) else message for message in messages]
+
+# 定长环形缓冲区：为每条消息分配单调递增的偏移量
+class MessageRingBuffer:
+    def __init__(self, capacity=DEFAULT_BUFFER_CAPACITY):
+        if capacity <= 0:
+            raise ValueError("缓冲区容量必须为正整数")
+        self.capacity = capacity              # 缓冲区容量（槽位数）
+        self._slots = None                    # 槽位数组（首次写入时按容量一次性分配，写满后覆盖最旧的消息）
+        self.next_offset = 0                  # 下一条消息的偏移量（即累计写入的消息数）
+        self._lock = threading.Lock()         # 多个投递线程可能同时写入同一观察者
+        self._changed = threading.Condition(self._lock)  # 写入新消息时唤醒等待中的读取方（长轮询/SSE）
+
+    @property
+    def start_offset(self):
+        """缓冲区中仍保留的最旧消息的偏移量"""
+        return max(0, self.next_offset - self.capacity)
+
+    def __len__(self):
+        return self.next_offset - self.start_offset
+
+    def __iter__(self):
+        return iter(self.read_since(0)[0])
+
+    def append(self, item):
+        """写入一条消息，缓冲区已满时覆盖最旧的消息"""
+        with self._lock:
+            if self._slots is None:
+                self._slots = [None] * self.capacity
+            self._slots[self.next_offset % self.capacity] = item
+            self.next_offset += 1
+            self._changed.notify_all()
+
+    def extend(self, items):
+        """批量写入消息：按切片整体赋值，超出容量的部分只保留最新的capacity条"""
+        items = list(items)
+        total = len(items)
+        if total > self.capacity:
+            items = items[total - self.capacity:]
+        with self._lock:
+            if self._slots is None:
+                self._slots = [None] * self.capacity
+            first = (self.next_offset + total - len(items)) % self.capacity
+            head = min(len(items), self.capacity - first)
+            self._slots[first:first + head] = items[:head]
+            self._slots[:len(items) - head] = items[head:]
+            self.next_offset += total
+            self._changed.notify_all()
+
+    def wait_for_messages(self, offset, timeout=None):
+        """阻塞等待直到有偏移量>=offset的消息写入，返回是否等到（超时返回False）"""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.next_offset > offset, timeout)
+
+    def read_since(self, offset=0, limit=None):
+        """读取偏移量>=offset的消息，返回(消息列表, 下一次读取的偏移量)
+
+        已被覆盖的消息会被跳过；offset超过当前写入位置时（如服务端重启），
+        返回当前写入位置以便调用方重新同步。
+        """
+        with self._lock:
+            end = self.next_offset
+            if offset > end:
+                return [], end
+            start = max(offset, self.start_offset)
+            if limit is not None:
+                end = min(end, start + limit)
+            if start >= end:
+                return [], end
+            first, last = start % self.capacity, end % self.capacity
+            if first < last:
+                return self._slots[first:last], end
+            # 读取区间跨越数组末尾，分两段拼接
+            return self._slots[first:] + self._slots[:last], end
 
 # 抽象观察者：定义消息接收接口
 class AbstractObserver(metaclass=ABCMeta):
-    def __init__(self, observer_id):
+    def __init__(self, observer_id, buffer_capacity=DEFAULT_BUFFER_CAPACITY):
         self.observer_id = observer_id  # 观察者唯一ID（用于网页标识）
-        self.subscribed_topics = []     # 订阅的主题列表
-        self.received_messages = []     # 接收的消息列表（用于网页展示）
+        # 订阅索引：按订阅顺序的字典（value为None），成员判断与增删均为O(1)
+        self.subscribed_topics = {}     # 订阅的主题（观察者→主题的反向索引，由主题的注册方法维护）
+        self.subscribed_patterns = {}   # 通配符订阅模式（如 orders.*、alerts.#）
+        self.received_messages = MessageRingBuffer(buffer_capacity)  # 接收的消息（定长环形缓冲区，用于网页展示）
+        self.subscription_lock = threading.Lock()  # 保护订阅列表（加锁顺序：先主题锁，后观察者锁）
     
     @abstractmethod
     def update(self, message, topic_name):
         """接收被观察者（主题）的消息并处理"""
         pass
 
+    def update_batch(self, messages, topic_name):
+        """批量接收消息（默认逐条调用update，子类可重写为批量处理）"""
+        for message in messages:
+            self.update(message, topic_name)
+
 # 抽象被观察者：定义观察者管理与通知接口
 class AbstractSubject(metaclass=ABCMeta):
     def __init__(self, topic_name):
         self.topic_name = topic_name          # 主题名称（唯一）
-        self.observers = []                   # 订阅当前主题的观察者列表
+        # 订阅者索引：key=观察者，value=消息过滤器（None表示接收全部消息），按订阅顺序，增删O(1)
+        self._subscribers = {}
+        self._snapshot = ((), (), ())         # 订阅者快照（订阅变更后置为None，下次读取时重建）
+        self.lock = threading.Lock()          # 保护订阅者索引及投递模式的修改
+        self.deleted = False                  # 主题被删除后不再接受新的订阅
+
+    @property
+    def observers(self):
+        """订阅当前主题的全部观察者（元组快照，通知时无需加锁即可遍历）"""
+        return self.subscription_snapshot()[0]
+
+    def subscription_snapshot(self):
+        """返回(全部订阅者, 不带过滤器的订阅者, ((过滤器, 订阅者元组), ...))
+
+        订阅变更只修改索引，快照在下一次读取时重建一次，大量连续的订阅/取消订阅不会反复复制；
+        过滤条件相同的订阅者归为一组，投递时每组只判断一次
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self.lock:
+                snapshot = self._snapshot
+                if snapshot is None:
+                    snapshot = self._snapshot = self._build_snapshot_locked()
+        return snapshot
+
+    def _build_snapshot_locked(self):
+        observers = tuple(self._subscribers)
+        unfiltered = []
+        groups = {}
+        for observer, message_filter in self._subscribers.items():
+            if message_filter is None:
+                unfiltered.append(observer)
+            else:
+                groups.setdefault(message_filter.key, (message_filter, []))[1].append(observer)
+        if not groups:
+            return observers, observers, ()
+        return observers, tuple(unfiltered), tuple((message_filter, tuple(members))
+                                                   for message_filter, members in groups.values())
     
     @abstractmethod
     def register_observer(self, observer):
@@ -42,161 +255,1512 @@ class AbstractSubject(metaclass=ABCMeta):
         """接收生产者的消息，触发通知逻辑"""
         pass
 
+def _priority_of(item):
+    return item.priority if type(item) is Message else DEFAULT_PRIORITY
+
+# 主题的有界投递队列（异步投递模式下使用）：按消息优先级分道，容量与背压策略按通道分别计算，
+# 低优先级消息积满自己的通道时不影响高优先级消息入队；投递线程按权重从各通道取出消息
+class TopicDispatchQueue:
+    def __init__(self, maxsize=DEFAULT_DISPATCH_QUEUE_SIZE, policy=BACKPRESSURE_BLOCK, block_timeout=DEFAULT_BLOCK_TIMEOUT):
+        if maxsize <= 0:
+            raise ValueError("队列容量必须为正整数")
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"未知的背压策略：{policy}")
+        self.maxsize = maxsize                # 每个优先级通道的容量
+        self.policy = policy                  # 队列已满时的背压策略
+        self.block_timeout = block_timeout    # block策略下的最长等待时间（秒），超时视为拒绝
+        self.dropped_count = 0                # drop_oldest策略丢弃的消息数
+        self.rejected_count = 0               # 被拒绝的消息数
+        self.scheduled = False                # 是否已交给调度线程（同一主题同一时刻只由一个线程投递，保证顺序）
+        self.closed = False                   # 主题删除或切回同步模式后关闭队列
+        self.dispatcher = None                # 负责该队列的投递线程池
+        self.topic = None                     # 队列所属的主题（阻塞等待前调度投递时使用）
+        self._items = PriorityLanes()
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+
+    def __len__(self):
+        return len(self._items)
+
+    def lane_depths(self):
+        """各优先级通道中等待投递的消息数"""
+        with self._lock:
+            return self._items.depths()
+
+    def head_priority(self):
+        """等待投递的消息中最高的优先级（队列为空时为默认优先级）"""
+        with self._lock:
+            level = self._items.head_priority()
+        return DEFAULT_PRIORITY if level is None else level
+
+    def put(self, item):
+        """入队一条消息，返回(是否接受, 是否需要调度该主题)"""
+        accepted, need_schedule = self.put_many((item,))
+        return accepted == 1, need_schedule
+
+    def put_many(self, items):
+        """在一次加锁内批量入队，逐条应用背压策略，返回(接受的消息数, 是否需要调度该主题)"""
+        accepted = 0
+        lanes = self._items
+        with self._lock:
+            for item in items:
+                if self.closed:
+                    break
+                level = _priority_of(item)
+                if lanes.lane_size(level) >= self.maxsize:
+                    if self.policy == BACKPRESSURE_REJECT:
+                        self.rejected_count += 1
+                        continue
+                    if self.policy == BACKPRESSURE_DROP_OLDEST:
+                        lanes.popleft_lane(level)
+                        self.dropped_count += 1
+                        lanes.append(item, level)
+                        accepted += 1
+                        continue
+                    # 阻塞等待前先把主题交给投递线程，否则空闲主题上超出剩余容量的批次无人消费，只能等到超时
+                    self._schedule_locked()
+                    if not self._not_full.wait_for(
+                            lambda: self.closed or lanes.lane_size(level) < self.maxsize, self.block_timeout) \
+                            or self.closed:
+                        self.rejected_count += 1
+                        continue
+                lanes.append(item, level)
+                accepted += 1
+            need_schedule = accepted > 0 and not self.scheduled
+            if accepted:
+                self.scheduled = True
+            return accepted, need_schedule
+
+    def _schedule_locked(self):
+        if not self.scheduled and self._items and self.dispatcher is not None:
+            self.scheduled = True
+            self.dispatcher.schedule(self.topic, self, self._items.head_priority())
+
+    def drain(self, max_items):
+        """按优先级加权轮转取出最多max_items条消息，并唤醒等待中的生产者"""
+        with self._lock:
+            if self.closed:
+                return []
+            batch = self._items.take(max_items)
+            if batch:
+                self._not_full.notify_all()
+            return batch
+
+    def finish_batch(self):
+        """一批消息投递完毕：队列仍有消息时返回True（需重新调度），否则释放调度标记"""
+        with self._lock:
+            if self._items and not self.closed:
+                return True
+            self.scheduled = False
+            return False
+
+    def close(self):
+        """关闭队列并返回尚未投递的消息（按优先级从高到低）"""
+        with self._lock:
+            self.closed = True
+            pending = self._items.clear()
+            self._not_full.notify_all()
+            return pending
+
+# 投递线程池：从各主题的投递队列取出消息并通知观察者
+# 待投递的主题同样按优先级分道（按主题队列中最高的消息优先级），有高优先级消息的主题先被投递线程取走
+class DispatcherPool:
+    def __init__(self, worker_count=DEFAULT_DISPATCH_WORKERS, batch_size=64):
+        self.worker_count = worker_count      # 投递线程数
+        self.batch_size = batch_size          # 每次从单个主题取出的最大消息数（避免单个主题长期占用线程）
+        self._ready_topics = PriorityLanes()  # 有待投递消息的主题
+        self._ready = threading.Condition()
+        self._stopping = False
+        self._workers = []
+        for i in range(worker_count):
+            worker = threading.Thread(target=self._run, name=f"dispatcher-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def schedule(self, topic, dispatch_queue, level=None):
+        """将有待投递消息的主题交给投递线程（绑定具体队列，主题重新配置后旧队列自然失效）
+
+        level为队列中最高的消息优先级；持有队列锁的调用方需直接传入，避免重复加锁
+        """
+        if level is None:
+            level = dispatch_queue.head_priority()
+        with self._ready:
+            self._ready_topics.append((topic, dispatch_queue), level)
+            self._ready.notify()
+
+    def _run(self):
+        while True:
+            with self._ready:
+                self._ready.wait_for(lambda: self._ready_topics or self._stopping)
+                if not self._ready_topics:
+                    break
+                task = self._ready_topics.take(1)[0]
+            topic, dispatch_queue = task
+            batch = dispatch_queue.drain(self.batch_size)
+            if batch:
+                topic.notify_observers_batch(batch)
+            if dispatch_queue.finish_batch():
+                self.schedule(topic, dispatch_queue)
+
+    def shutdown(self):
+        """投递完已调度的主题后停止所有投递线程"""
+        with self._ready:
+            self._stopping = True
+            self._ready.notify_all()
+        for worker in self._workers:
+            worker.join()
+        self._workers.clear()
+
 # 具体被观察者：消息主题
 class TopicSubject(AbstractSubject):
-    def register_observer(self, observer):
-        """注册观察者：若观察者未订阅该主题，则添加到列表"""
-        if observer not in self.observers and self.topic_name not in observer.subscribed_topics:
-            self.observers.append(observer)
-            observer.subscribed_topics.append(self.topic_name)
+    def __init__(self, topic_name):
+        super().__init__(topic_name)
+        self.dispatch_queue = None            # 异步投递队列（None表示同步投递）
+        self.log = None                       # 持久化日志（None表示仅内存投递）
+        self._next_offset = 0                 # 非持久化主题的下一个偏移量
+        self._offset_lock = threading.Lock()
+        self.pattern_index = None             # 通配符订阅索引（由中间件协调器设置）
+        self.ack_tracker = None               # 未确认投递的跟踪器（None表示投递即视为完成）
+        self._targets_cache = None            # (观察者元组, 索引版本号, 投递目标元组)
+        self.retention = None                 # 消息保留策略的时间顺序索引（None表示不清除）
+        self.replication_log = None           # 主从复制的事件日志（主节点开启复制后由中间件协调器设置）
+        self.default_priority = DEFAULT_PRIORITY  # 发布时未指定优先级的消息使用的优先级
+        self.metrics = None                   # 主题的运行指标（TopicMetrics，由中间件协调器设置）
+
+    @property
+    def next_offset(self):
+        """下一条消息将被分配的主题内偏移量"""
+        log = self.log
+        return log.next_offset if log is not None else self._next_offset
+
+    def enable_persistence(self, log):
+        """开启持久化：之后的消息先写入日志（分配偏移量）再投递"""
+        with self.lock:
+            self.log = log
+
+    def disable_persistence(self):
+        """关闭持久化：偏移量从日志末尾继续递增"""
+        with self.lock:
+            log, self.log = self.log, None
+            if log is not None:
+                self._next_offset = log.next_offset
+        return log
+
+    def _assign_offsets(self, messages):
+        """为消息分配主题内偏移量；持久化主题在投递前先写入日志（写前日志）"""
+        log = self.log
+        if log is not None:
+            log.append_many([message for message in messages if isinstance(message, Message)])
+            return
+        with self._offset_lock:
+            offset = self._next_offset
+            for message in messages:
+                if isinstance(message, Message):
+                    message.offset = offset
+                    offset += 1
+            self._next_offset = offset
+
+    @property
+    def async_delivery(self):
+        return self.dispatch_queue is not None
+
+    def enable_async_delivery(self, dispatcher, max_queue_size=DEFAULT_DISPATCH_QUEUE_SIZE, policy=BACKPRESSURE_BLOCK):
+        """切换为异步投递：发布时消息进入有界队列，由投递线程池通知观察者"""
+        new_queue = TopicDispatchQueue(max_queue_size, policy)
+        new_queue.dispatcher = dispatcher
+        new_queue.topic = self
+        with self.lock:
+            old_queue, self.dispatch_queue = self.dispatch_queue, new_queue
+        if old_queue is not None:
+            # 重新配置时，将旧队列中尚未投递的消息转入新队列
+            pending = old_queue.close()
+            if pending:
+                self._deliver_many(pending)
+
+    def disable_async_delivery(self, flush=True):
+        """切换回同步投递；flush为True时同步投递队列中剩余的消息"""
+        with self.lock:
+            old_queue, self.dispatch_queue = self.dispatch_queue, None
+        if old_queue is not None:
+            pending = old_queue.close()
+            if flush and pending:
+                self.notify_observers_batch(pending)
+
+    def get_queue_stats(self):
+        """获取投递队列状态（深度、容量、策略、丢弃/拒绝数）"""
+        dispatch_queue = self.dispatch_queue
+        if dispatch_queue is None:
+            return {"async_delivery": False, "depth": 0}
+        return {
+            "async_delivery": True,
+            "depth": len(dispatch_queue),
+            "max_queue_size": dispatch_queue.maxsize,
+            "policy": dispatch_queue.policy,
+            "dropped": dispatch_queue.dropped_count,
+            "rejected": dispatch_queue.rejected_count,
+            "lanes": dict(zip(PRIORITY_NAMES, dispatch_queue.lane_depths()))
+        }
+
+    def register_observer(self, observer, message_filter=None):
+        """注册观察者：同时加入主题与观察者两侧的索引（已订阅时更新过滤器）；返回主题是否仍有效
+
+        message_filter为编译后的过滤器（MessageFilter），观察者一侧记录其表达式文本
+        """
+        with self.lock, observer.subscription_lock:
+            if self.deleted:
+                return False
+            if observer not in self._subscribers or self._subscribers[observer] is not message_filter:
+                self._subscribers[observer] = message_filter
+                observer.subscribed_topics[self.topic_name] = \
+                    message_filter.expression if message_filter is not None else None
+                self._snapshot = None
+            return True
     
     def remove_observer(self, observer):
-        """移除观察者：若观察者已订阅该主题，则从列表中删除"""
-        if observer in self.observers and self.topic_name in observer.subscribed_topics:
-            self.observers.remove(observer)
-            observer.subscribed_topics.remove(self.topic_name)
+        """移除观察者：若观察者已订阅该主题，则从两侧的索引中删除；返回是否确实移除"""
+        with self.lock, observer.subscription_lock:
+            if observer not in self._subscribers:
+                return False
+            del self._subscribers[observer]
+            observer.subscribed_topics.pop(self.topic_name, None)
+            self._snapshot = None
+            return True
+
+    def load_observers(self, subscribers):
+        """加载配置时一次性设置订阅者{观察者: 过滤器}（主题尚未加入注册表，观察者一侧的索引由调用方维护）"""
+        self._subscribers = subscribers
+        self._snapshot = None
+
+    def subscription_filter(self, observer):
+        """观察者订阅该主题时的过滤器（未订阅或不过滤时返回None）"""
+        return self._subscribers.get(observer)
+
+    def is_subscribed(self, observer):
+        """观察者是否仍订阅该主题（精确订阅或通配符模式匹配）"""
+        return observer in self._subscribers or observer in self.delivery_targets()
+
+    def mark_deleted(self):
+        """标记主题已删除并取消所有观察者的订阅，返回原订阅者（耗时与订阅者数量成线性关系）"""
+        with self.lock:
+            self.deleted = True
+            subscribers, self._subscribers = self._subscribers, {}
+            self._snapshot = ((), (), ())
+        for observer in subscribers:
+            with observer.subscription_lock:
+                observer.subscribed_topics.pop(self.topic_name, None)
+        return tuple(subscribers)
+    
+    def delivery_targets(self):
+        """不带过滤器的投递目标：精确订阅者 + 通配符模式匹配到的订阅者（同一观察者只投递一次）
+
+        匹配结果按(观察者元组, 索引版本号)缓存，订阅关系不变时发布无需再查字典树；
+        精确订阅了该主题的观察者（包括带过滤器的）不再按通配符模式重复投递
+        """
+        observers, unfiltered, _ = self.subscription_snapshot()
+        index = self.pattern_index
+        if index is None or index.version == 0:
+            return unfiltered
+        cached = self._targets_cache
+        if cached is not None and cached[0] is observers and cached[1] == index.version:
+            return cached[2]
+        version, matched = index.match(self.topic_name)
+        exact = set(map(id, observers))
+        targets = unfiltered + tuple(observer for observer in matched if id(observer) not in exact)
+        self._targets_cache = (observers, version, targets)
+        return targets
+
+    def _filtered_targets(self, message, groups):
+        """带过滤器的订阅者中消息头满足条件的观察者；各组共用谓词求值缓存，同一谓词对本条消息只求值一次"""
+        headers = getattr(message, 'headers', None)
+        results = {}
+        matched = ()
+        for message_filter, members in groups:
+            if message_filter.matches(headers, results):
+                matched += members
+        return matched
     
     def notify_observers(self, message):
-        """通知所有观察者：调用每个观察者的update()方法传递消息"""
-        for observer in self.observers:
+        """通知所有观察者：遍历投递目标快照，调用每个观察者的update()方法传递消息"""
+        metrics = self.metrics
+        start = time.perf_counter() if metrics is not None and metrics.sampled() else None
+        tracker = self.ack_tracker
+        targets = self.delivery_targets()
+        groups = self.subscription_snapshot()[2]
+        if groups:
+            targets = targets + self._filtered_targets(message, groups)
+        for observer in targets:
+            if tracker is not None:
+                # 先登记再投递，消费者收到后立即确认也能找到记录
+                tracker.track(observer, message)
             observer.update(message, self.topic_name)
+        if metrics is not None:
+            metrics.delivered.inc(len(targets))
+            if start is not None:
+                metrics.fanout_seconds.observe(time.perf_counter() - start)
     
+    def notify_observers_batch(self, messages):
+        """批量通知：每个观察者对整批消息只做一次批量追加"""
+        metrics = self.metrics
+        start = time.perf_counter() if metrics is not None and metrics.sampled() else None
+        tracker = self.ack_tracker
+        targets = self.delivery_targets()
+        for observer in targets:
+            if tracker is not None:
+                tracker.track_many(observer, messages)
+            observer.update_batch(messages, self.topic_name)
+        delivered = len(targets) * len(messages)
+        groups = self.subscription_snapshot()[2]
+        if groups:
+            delivered += self._notify_filtered_batch(messages, groups, tracker)
+        if metrics is not None:
+            metrics.delivered.inc(delivered)
+            if start is not None:
+                metrics.fanout_seconds.observe(time.perf_counter() - start)
+
+    def _notify_filtered_batch(self, messages, groups, tracker):
+        """按过滤器分组筛选整批消息，每组成员对筛选结果只做一次批量追加；返回投递次数"""
+        batches = [[] for _ in groups]
+        for message in messages:
+            headers = getattr(message, 'headers', None)
+            results = {}
+            for batch, (message_filter, _) in zip(batches, groups):
+                if message_filter.matches(headers, results):
+                    batch.append(message)
+        delivered = 0
+        for batch, (_, members) in zip(batches, groups):
+            if not batch:
+                continue
+            for observer in members:
+                if tracker is not None:
+                    tracker.track_many(observer, batch)
+                observer.update_batch(batch, self.topic_name)
+            delivered += len(batch) * len(members)
+        return delivered
+
+    def receive_messages(self, messages):
+        """批量接收生产者消息，返回被接受的消息数
+
+        持久化主题的消息先写入日志再投递；异步队列拒绝的消息仍保留在日志中，可通过重放获取
+        """
+        if not messages:
+            return 0
+        self._assign_offsets(messages)
+        self._retain(messages)
+        self._replicate(messages)
+        return self._deliver_many(messages)
+
+    def receive_replicated(self, messages):
+        """从节点：接收主节点复制的消息，保留主节点分配的偏移量（不重新编号），返回投递的消息数
+
+        主节点上已被保留策略清除或被异步队列拒绝的消息不会复制过来，偏移量因此可能不连续；
+        主题的下一个偏移量推进到已应用的最大偏移量之后
+        """
+        if not messages:
+            return 0
+        last = max((message.offset for message in messages if message.offset is not None), default=None)
+        if last is not None:
+            with self._offset_lock:
+                if last >= self._next_offset:
+                    self._next_offset = last + 1
+        self._retain(messages)
+        self._replicate(messages)
+        return self._deliver_many(messages)
+
+    def _retain(self, messages):
+        retention = self.retention
+        if retention is not None:
+            retention.add_many([message for message in messages if isinstance(message, Message)])
+
+    def _replicate(self, messages):
+        # 一批消息只追加一个复制事件，消息对象直接引用，从节点拉取时才编码
+        replication_log = self.replication_log
+        if replication_log is not None:
+            replication_log.append_messages(self.topic_name, messages)
+
+    def _deliver_many(self, messages):
+        dispatch_queue = self.dispatch_queue
+        if dispatch_queue is None:
+            self.notify_observers_batch(messages)
+            return len(messages)
+        accepted, need_schedule = dispatch_queue.put_many(messages)
+        if need_schedule:
+            dispatch_queue.dispatcher.schedule(self, dispatch_queue)
+        if accepted < len(messages) and dispatch_queue.closed and not self.deleted:
+            # 入队时恰逢投递模式切换，剩余消息按新模式重新投递
+            return accepted + self._deliver_many(messages[accepted:])
+        return accepted
+
     def receive_message(self, message):
-        """接收生产者消息后，触发通知逻辑"""
-        self.notify_observers(message)
+        """接收生产者消息后，触发通知逻辑；返回消息是否被接受（异步队列可能拒绝）"""
+        self._assign_offsets((message,))
+        self._retain((message,))
+        self._replicate((message,))
+        return self._deliver(message)
+
+    def _deliver(self, message):
+        dispatch_queue = self.dispatch_queue
+        if dispatch_queue is None:
+            self.notify_observers(message)
+            return True
+        accepted, need_schedule = dispatch_queue.put(message)
+        if need_schedule:
+            dispatch_queue.dispatcher.schedule(self, dispatch_queue)
+        if not accepted and dispatch_queue.closed and not self.deleted:
+            # 入队时恰逢投递模式切换，按新模式重新投递
+            return self._deliver(message)
+        return accepted
 
 # 具体观察者：消息消费者
 class ConsumerObserver(AbstractObserver):
     def update(self, message, topic_name):
-        """处理消息：将消息添加到个人消息列表（用于网页展示）"""
-        message_info = f"[主题：{topic_name}] {message}"
-        self.received_messages.append(message_info)
+        """处理消息：将消息对象（共享引用）添加到个人消息缓冲区，展示时再格式化"""
+        if not isinstance(message, Message):
+            message = f"[主题：{topic_name}] {message}"
+        self.received_messages.append(message)
+
+    def update_batch(self, messages, topic_name):
+        """批量处理消息：整批一次性写入消息缓冲区"""
+        self.received_messages.extend(
+            [message if isinstance(message, Message) else f"[主题：{topic_name}] {message}" for message in messages])
 
 # 生产者：消息发布者
 class MessageProducer:
     def __init__(self, producer_id):
         self.producer_id = producer_id  # 生产者唯一ID（用于网页标识）
     
-    def publish_message(self, middleware_core, topic_name, message_content):
-        """发布消息：通过中间件协调器找到主题，传递消息"""
+    def publish_message(self, middleware_core, topic_name, message_content, headers=None, priority=None):
+        """发布消息：通过中间件协调器找到主题，传递消息；headers为消息头字典（供订阅过滤使用）
+
+        priority为优先级（high/normal/low或0-2），未指定时使用主题的默认优先级
+        """
+        success, msg, _ = self.publish(middleware_core, topic_name, message_content, headers, priority)
+        return success, msg
+
+    def publish(self, middleware_core, topic_name, message_content, headers=None, priority=None):
+        """同publish_message，返回(是否成功, 提示, 消息对象)；发布失败时消息对象为None
+
+        二进制协议据此返回消息实际分配到的偏移量
+        """
         # 1. 从中间件协调器获取主题
         topic = middleware_core.get_topic(topic_name)
         if not topic:
-            return False, f"主题「{topic_name}」不存在，请先创建主题"
-        # 2. 构造完整消息（包含生产者ID和时间）
-        current_time = datetime.datetime.now().strftime("%H:%M:%S")
-        full_message = f"[生产者{self.producer_id}][{current_time}] {message_content}"
-        # 3. 向主题发送消息
-        topic.receive_message(full_message)
-        # 4. 记录消息日志到中间件协调器
-        middleware_core.add_message_log(f"生产者{self.producer_id}向主题「{topic_name}」发布消息：{message_content}")
-        return True, f"消息发布成功：{full_message}"
+            return False, f"主题「{topic_name}」不存在，请先创建主题", None
+        if priority is None:
+            priority = topic.default_priority
+        else:
+            try:
+                priority = parse_priority(priority)
+            except ValueError as e:
+                return False, str(e), None
+        metrics = topic.metrics
+        start = time.perf_counter() if metrics is not None and metrics.sampled() else None
+        # 2. 构造消息对象（包含消息ID、生产者ID和时间戳，内容只保存引用；大消息写入共享内存负载池）
+        message = Message(middleware_core.next_message_id(), self.producer_id, topic_name, time.time(),
+                          middleware_core.store_payload(message_content), headers=headers or None, priority=priority)
+        # 3. 向主题发送消息（异步投递模式下队列已满可能被拒绝）
+        if not topic.receive_message(message):
+            if metrics is not None:
+                metrics.rejected.inc()
+            return False, f"主题「{topic_name}」投递队列已满，消息被拒绝", None
+        # 4. 记录消息日志到中间件协调器（延迟格式化，发布日志可采样或关闭）；
+        # 日志只保存消息ID、偏移量与大小，不引用消息内容，避免日志持有负载池的共享内存块
+        middleware_core.add_message_log("生产者{}向主题「{}」发布消息：消息ID {}，偏移量 {}，{}字节", LOG_PUBLISH,
+                                        self.producer_id, topic_name, message.message_id, message.offset,
+                                        payload_size(message.payload))
+        # 5. 记录发布计数与耗时（含同步投递；耗时按采样间隔记录）
+        if metrics is not None:
+            metrics.published.inc()
+            if start is not None:
+                metrics.publish_seconds.observe(time.perf_counter() - start)
+        # 提示中只包含消息ID与偏移量，不读取消息内容（大消息的内容在共享内存负载池中）
+        return True, f"消息发布成功：消息ID {message.message_id}，偏移量 {message.offset}", message
+
+    def publish_many(self, middleware_core, topic_name, message_contents, timestamp=None, headers=None,
+                     priorities=None):
+        """批量发布消息：整批只查找一次主题、生成一次时间戳、记录一条日志
+
+        headers为与message_contents等长的消息头列表（元素可为None）；
+        priorities为等长的优先级列表（元素为high/normal/low或0-2，为None时使用主题的默认优先级）
+        """
+        success, msg, _ = self.publish_batch(middleware_core, topic_name, message_contents, timestamp, headers,
+                                             priorities)
+        return success, msg
+
+    def publish_batch(self, middleware_core, topic_name, message_contents, timestamp=None, headers=None,
+                      priorities=None):
+        """同publish_many，返回(是否成功, 提示, 被接受的消息数)
+
+        异步队列拒绝部分消息时是否成功为False，但已接受的消息已经投递，二进制协议据此确认实际接受的条数
+        """
+        topic = middleware_core.get_topic(topic_name)
+        if not topic:
+            return False, f"主题「{topic_name}」不存在，请先创建主题", 0
+        if not message_contents:
+            return False, "消息列表为空", 0
+        if headers is not None and len(headers) != len(message_contents):
+            return False, "消息头列表与消息列表长度不一致", 0
+        if priorities is not None:
+            if len(priorities) != len(message_contents):
+                return False, "优先级列表与消息列表长度不一致", 0
+            try:
+                priorities = [None if priority is None else parse_priority(priority) for priority in priorities]
+            except ValueError as e:
+                return False, str(e), 0
+        if timestamp is None:
+            timestamp = time.time()
+        producer_id = self.producer_id
+        store_payload = middleware_core.store_payload
+        next_message_id = middleware_core.next_message_id
+        default_priority = topic.default_priority
+        if headers is None and priorities is None:
+            messages = [Message(next_message_id(), producer_id, topic_name, timestamp, store_payload(content),
+                                priority=default_priority)
+                        for content in message_contents]
+        else:
+            headers = headers or itertools.repeat(None)
+            priorities = priorities or itertools.repeat(None)
+            messages = [Message(next_message_id(), producer_id, topic_name, timestamp, store_payload(content),
+                                headers=message_headers or None,
+                                priority=default_priority if priority is None else priority)
+                        for content, message_headers, priority in zip(message_contents, headers, priorities)]
+        accepted = topic.receive_messages(messages)
+        total = len(message_contents)
+        metrics = topic.metrics
+        if metrics is not None:
+            metrics.published.inc(accepted)
+            if accepted < total:
+                metrics.rejected.inc(total - accepted)
+        middleware_core.add_message_log("生产者{}向主题「{}」批量发布消息：{}/{}条", LOG_PUBLISH,
+                                        self.producer_id, topic_name, accepted, total)
+        if accepted < total:
+            return False, f"批量发布部分失败：主题「{topic_name}」投递队列已满，{total - accepted}条消息被拒绝", accepted
+        return True, f"批量发布成功：{total}条消息", accepted
+
+# 主题的运行指标：创建主题时取出各指标的子指标并保存，发布与投递时无需按标签查找
+# 计数器精确累加；耗时直方图每sample_every次记录一次，未采样时不调用计时函数
+class TopicMetrics:
+    __slots__ = ('published', 'rejected', 'delivered', 'publish_seconds', 'fanout_seconds',
+                 'sample_every', '_ticks')
+
+    def __init__(self, core, topic_name):
+        self.published = core.metric_published.labels(topic_name)
+        self.rejected = core.metric_rejected.labels(topic_name)
+        self.delivered = core.metric_delivered.labels(topic_name)
+        self.publish_seconds = core.metric_publish_seconds.labels(topic_name)
+        self.fanout_seconds = core.metric_fanout_seconds.labels(topic_name)
+        self.sample_every = core.latency_sample_every
+        self._ticks = itertools.count()
+
+    def sampled(self):
+        """本次是否记录耗时"""
+        return not next(self._ticks) % self.sample_every
+
+
+def _instrumented(method):
+    """记录中间件协调器操作的调用次数（按返回的是否成功区分）与耗时"""
+    operation = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = method(self, *args, **kwargs)
+        success = result[0] if isinstance(result, tuple) and result and isinstance(result[0], bool) else True
+        self.metric_operations.labels(operation, 'ok' if success else 'error').inc()
+        self.metric_operation_seconds.labels(operation).observe(time.perf_counter() - start)
+        return result
+    return wrapper
+
 
 class MiddlewareCore:
-    def __init__(self, config_file='config.json'):
+    observer_class = ConsumerObserver     # 创建观察者时使用的类（子类可替换，如asyncio版本）
+    
+    def __init__(self, config_file='config.json', buffer_capacity=DEFAULT_BUFFER_CAPACITY,
+                 dispatch_workers=DEFAULT_DISPATCH_WORKERS, log_dir=None, log_options=None, payload_pool=None):
         self.config_file = config_file    # 配置文件路径
+        self.payload_pool = payload_pool  # 大消息的共享内存负载池（PayloadPool实例，None表示不使用）
+        # 主题持久化日志（未指定log_dir时不支持持久化）；log_options可设置segment_bytes、
+        # fsync_every_messages、fsync_interval_ms
+        self.durable_logs = DurableLogManager(log_dir, **(log_options or {})) if log_dir else None
+        self.buffer_capacity = buffer_capacity  # 每个观察者消息缓冲区的容量
+        self.dispatch_workers = dispatch_workers  # 异步投递线程数
+        self.dispatcher = None            # 异步投递线程池（首个主题开启异步投递时创建）
         self.topics = {}                  # 主题字典：key=主题名称，value=TopicSubject实例
         self.producers = {}               # 生产者字典：key=生产者ID，value=MessageProducer实例
         self.observers = {}               # 观察者字典：key=观察者ID，value=ConsumerObserver实例
-        self.message_logs = []            # 消息日志列表（用于网页展示全流程）
+        self.consumer_groups = {}         # 消费组字典：key=消费组ID，value=ConsumerGroup实例
+        self.message_logs = deque(maxlen=MESSAGE_LOG_CAPACITY)  # 活动日志事件（定长，自动淘汰最旧事件）
+        self._log_seq = 0                 # 下一条日志事件的序号
+        # 各类别的日志采样间隔：1为全部记录，N为每N条记录1条，0为关闭
+        self.log_sample_every = {category: 1 for category in LOG_CATEGORIES}
+        self._log_counters = {category: itertools.count() for category in LOG_CATEGORIES}
+        # 各注册表独立加锁（需要同时持有时按 主题→生产者→观察者→消费组 的顺序获取，避免死锁）
+        self.topics_lock = threading.RLock()
+        self.producers_lock = threading.RLock()
+        self.observers_lock = threading.RLock()
+        self.groups_lock = threading.RLock()
+        self.log_lock = threading.Lock()
+        self.config_lock = threading.Lock()   # 串行化配置的加载与保存
+        self._message_ids = itertools.count(1)  # 消息ID生成器（next()在CPython中是原子操作）
+        self.pattern_index = PatternIndex()   # 通配符订阅索引（主题字典树），所有主题共享
+        self.timer_wheel = None           # 可见性超时的时间轮（首个主题开启确认时创建）
+        self.latency_sample_every = DEFAULT_LATENCY_SAMPLE_EVERY  # 耗时直方图的采样间隔（1为每次都记录）
+        # 拓扑版本：创建/删除实体、订阅/取消订阅后递增；实体快照按版本缓存
+        self.instance_id = os.urandom(4).hex()  # 实例标识，与版本号组成ETag（重启后版本号从0开始）
+        self.topology_version = 0
+        self.config_version = 0           # 配置版本：拓扑变化及投递、持久化、确认、消费组等配置变化后递增
+        self._saved_config_version = None  # 上次保存或加载配置时的配置版本（相同则无需重新保存）
+        self._topology_changes = deque(maxlen=TOPOLOGY_CHANGE_LOG_CAPACITY)  # 最近的拓扑变更
+        self._topology_floor = 0          # 变更记录的起点版本（加载配置/清空实体后重新开始）
+        self._entities_cache = None       # (拓扑版本, 实体字典, JSON文本)
+        self.replication_log = None       # 主从复制的事件日志（首个从节点同步时开启，见replication.py）
+        self.version_lock = threading.Lock()
+        self._init_metrics()
         # 注意：不再自动加载配置文件，需要用户手动点击加载按钮
         
+    # 运行指标（/metrics接口以Prometheus文本格式导出）
+    def _init_metrics(self):
+        self.metrics = MetricsRegistry()
+        self.metric_published = self.metrics.counter(
+            'mq_messages_published_total', '主题接受的消息数', ['topic'])
+        self.metric_rejected = self.metrics.counter(
+            'mq_messages_rejected_total', '投递队列已满被拒绝的消息数', ['topic'])
+        self.metric_delivered = self.metrics.counter(
+            'mq_messages_delivered_total', '投递给订阅者的消息数（每个订阅者计一次）', ['topic'])
+        self.metric_publish_seconds = self.metrics.histogram(
+            'mq_publish_seconds', 'publish_message的耗时（同步投递时包含通知订阅者，按采样间隔记录）', ['topic'])
+        self.metric_fanout_seconds = self.metrics.histogram(
+            'mq_fanout_seconds', '一次通知全部订阅者（notify_observers）的耗时（按采样间隔记录）', ['topic'])
+        self.metric_operations = self.metrics.counter(
+            'mq_operations_total', '中间件协调器操作的调用次数', ['operation', 'result'])
+        self.metric_operation_seconds = self.metrics.histogram(
+            'mq_operation_seconds', '中间件协调器操作的耗时', ['operation'])
+        self.metrics.register_collector(self._collect_metrics)
+
+    def _collect_metrics(self):
+        """抓取时计算的状态量：实体数、活动日志大小、观察者缓冲区大小与积压、投递队列深度、保留策略统计"""
+        topics = list(self.topics.items())
+        observers = list(self.observers.items())
+        backlog = {observer_id: 0 for observer_id, _ in observers}
+        for _, topic in topics:
+            if topic.ack_tracker is not None:
+                for consumer_id, count in topic.ack_tracker.in_flight_counts().items():
+                    backlog[consumer_id] = backlog.get(consumer_id, 0) + count
+        for group in list(self.consumer_groups.values()):
+            for member_id, count in group.get_stats()["pending"].items():
+                backlog[member_id] = backlog.get(member_id, 0) + count
+        lines = render_gauge('mq_entities', '实体数量', [
+            ({'kind': 'topics'}, len(topics)), ({'kind': 'producers'}, len(self.producers)),
+            ({'kind': 'observers'}, len(observers)), ({'kind': 'consumer_groups'}, len(self.consumer_groups))])
+        lines += render_gauge('mq_message_log_events', '活动日志中保留的事件数', [({}, len(self.message_logs))])
+        lines += render_gauge('mq_observer_buffer_messages', '观察者消息缓冲区中的消息数',
+                              [({'observer': observer_id}, len(observer.received_messages))
+                               for observer_id, observer in observers])
+        lines += render_gauge('mq_consumer_backlog_messages', '订阅者已投递但未确认（或消费组成员未提交）的消息数',
+                              [({'consumer': consumer_id}, count) for consumer_id, count in sorted(backlog.items())])
+        queue_stats = [(topic_name, topic.get_queue_stats()) for topic_name, topic in topics]
+        lines += render_gauge('mq_topic_queue_depth', '主题异步投递队列中等待投递的消息数',
+                              [({'topic': topic_name}, stats["depth"]) for topic_name, stats in queue_stats])
+        lines += render_gauge('mq_topic_queue_lane_depth', '主题异步投递队列各优先级通道中等待投递的消息数',
+                              [({'topic': topic_name, 'priority': priority}, depth)
+                               for topic_name, stats in queue_stats if stats["async_delivery"]
+                               for priority, depth in stats["lanes"].items()])
+        retention = [(topic_name, topic.retention.get_stats()) for topic_name, topic in topics
+                     if topic.retention is not None]
+        if retention:
+            lines += render_gauge('mq_topic_retained_messages', '设置了保留策略的主题仍保留的消息数',
+                                  [({'topic': topic_name}, stats["retained_messages"]) for topic_name, stats in retention])
+            lines += render_gauge('mq_topic_retained_bytes', '设置了保留策略的主题仍保留的消息负载字节数',
+                                  [({'topic': topic_name}, stats["retained_bytes"]) for topic_name, stats in retention])
+            lines += render_gauge('mq_topic_expired_messages', '按保留策略清除的消息累计数（过期与超出限制）',
+                                  [({'topic': topic_name}, stats["expired"] + stats["evicted"])
+                                   for topic_name, stats in retention])
+        if self.replication_log is not None:
+            stats = self.replication_log.get_stats()
+            lines += render_gauge('mq_replication_log_events', '主节点复制日志中保留的事件数',
+                                  [({}, stats["retained_events"])])
+            lines += render_gauge('mq_replication_follower_lag_events', '主节点视角下各从节点落后的事件数（按最近一次拉取位置）',
+                                  [({'follower': follower_id}, follower["lag_events"])
+                                   for follower_id, follower in sorted(stats["followers"].items())])
+        if self.timer_wheel is not None:
+            lines += render_gauge('mq_timer_wheel_tasks', '时间轮中的定时任务数', [({}, len(self.timer_wheel))])
+        if self.payload_pool is not None:
+            lines += render_gauge('mq_payload_pool_slots_in_use', '负载池已占用的槽位数',
+                                  [({}, self.payload_pool.slots_in_use)])
+        return lines
+
+    def render_metrics(self):
+        """导出全部运行指标（Prometheus文本格式）"""
+        return self.metrics.render()
+
+    def _remove_topic_metrics(self, topic_name):
+        for metric in (self.metric_published, self.metric_rejected, self.metric_delivered,
+                       self.metric_publish_seconds, self.metric_fanout_seconds):
+            metric.remove(topic_name)
+
+    # 拓扑版本与配置版本（在实体/订阅关系修改之后递增，读取到新版本号时一定能看到对应的修改）
+    def _topology_changed(self, op, kind, entity_id, value=None, filter_expression=None):
+        """记录一次拓扑变更：op为add/remove/set，kind为topics/producers/observers/consumer_groups/subscriptions"""
+        with self.version_lock:
+            self.topology_version += 1
+            self.config_version += 1
+            change = {'version': self.topology_version, 'op': op, 'kind': kind, 'id': entity_id}
+            if value is not None:
+                change['value'] = value
+            if filter_expression is not None:
+                change['filter'] = filter_expression
+            self._topology_changes.append(change)
+            # 在版本锁内追加复制事件，从节点按与版本号相同的顺序应用拓扑变更
+            if self.replication_log is not None:
+                self.replication_log.append_topology(change)
+
+    def _subscription_changed(self, op, observer, topic_name):
+        """记录一条订阅变更（op为add/remove，value为主题名称或通配符模式）
+
+        只记录变化的这一项，订阅了大量主题的观察者每次订阅的开销与已有订阅数无关；
+        删除主题或观察者时其订阅关系随之移除，不再逐条记录
+        """
+        if self.observers.get(observer.observer_id) is observer:
+            filter_expression = observer.subscribed_topics.get(topic_name) if op == 'add' else None
+            self._topology_changed(op, 'subscriptions', observer.observer_id, topic_name, filter_expression)
+
+    def _topology_reset(self, saved=False):
+        """整体替换实体后（加载配置/清空实体）丢弃变更记录，落后的客户端重新获取完整快照"""
+        with self.version_lock:
+            self.topology_version += 1
+            self.config_version += 1
+            self._topology_changes.clear()
+            self._topology_floor = self.topology_version
+            if saved:
+                self._saved_config_version = self.config_version
+            if self.replication_log is not None:
+                self.replication_log.append_reset()
+
+    def _config_changed(self):
+        with self.version_lock:
+            self.config_version += 1
+
+    @property
+    def config_dirty(self):
+        """当前配置是否有未保存的修改"""
+        return self.config_version != self._saved_config_version
+
+    def entity_etag(self, version):
+        """实体快照的ETag（不含引号）：实例标识+拓扑版本"""
+        return f"{self.instance_id}-{version}"
+
+    def get_entities_snapshot(self):
+        """返回(拓扑版本, 实体字典, JSON文本)；拓扑未变化时直接返回缓存（调用方不应修改实体字典）"""
+        version = self.topology_version
+        cached = self._entities_cache
+        if cached is not None and cached[0] == version:
+            return cached
+        entities = self._build_entities()
+        cached = (version, entities, json.dumps(entities, ensure_ascii=False))
+        self._entities_cache = cached
+        return cached
+
+    def get_entities_delta(self, since_version, instance_id=None):
+        """返回since_version之后的拓扑变更：{instance_id, version, full: False, changes}
+
+        变更记录已不完整（客户端落后太多、中间加载过配置、版本号来自重启前的实例）时
+        返回完整快照：{instance_id, version, full: True, entities}
+        """
+        with self.version_lock:
+            version = self.topology_version
+            changes = self._topology_changes
+            complete = (instance_id is None or instance_id == self.instance_id) and \
+                self._topology_floor <= since_version <= version and \
+                (not changes or changes[0]['version'] <= since_version + 1)
+            if complete:
+                return {'instance_id': self.instance_id, 'version': version, 'full': False,
+                        'changes': [change for change in changes if change['version'] > since_version]}
+        version, entities, _ = self.get_entities_snapshot()
+        return {'instance_id': self.instance_id, 'version': version, 'full': True, 'entities': entities}
+
+    # 主从复制（主节点记录发布与拓扑变更事件，从节点的拉取与应用见replication.py）
+    def enable_replication(self, replication_log):
+        """开启复制日志（ReplicationLog实例），之后主题接受的消息与拓扑变更都追加到日志；已开启时返回现有日志"""
+        with self.topics_lock, self.version_lock:
+            if self.replication_log is None:
+                self.replication_log = replication_log
+                for topic in self.topics.values():
+                    topic.replication_log = replication_log
+            return self.replication_log
+
+    @_instrumented
+    def load_replica(self, config, topic_offsets=None):
+        """从节点：按主节点快照中的配置整体替换实体、订阅关系（含过滤条件）与保留策略
+
+        持久化、异步投递、消息确认与消费组由主节点负责，从节点不开启；
+        topic_offsets为各主题的下一个偏移量，之后复制的消息与主节点分配相同的主题内偏移量
+        """
+        with self.config_lock:
+            self._clear_all_entities()
+            topic_count, producer_count, observer_count, subscription_count = self._bulk_load_entities(config)
+            for topic_name, options in config.get('retention', {}).items():
+                if topic_name in self.topics:
+                    self.configure_topic_retention(topic_name, options.get('max_age'), options.get('max_bytes'),
+                                                   options.get('max_messages'))
+            for topic_name, offset in (topic_offsets or {}).items():
+                topic = self.topics.get(topic_name)
+                if topic is not None and topic.log is None:
+                    topic._next_offset = offset
+            self._topology_reset()
+        msg = (f"已从主节点同步{topic_count}个主题、{producer_count}个生产者、{observer_count}个观察者、"
+               f"{subscription_count}条订阅关系")
+        self.add_message_log(msg, LOG_CONFIG)
+        return True, msg
+
     # 主题管理
+    def _new_topic(self, topic_name):
+        topic = TopicSubject(topic_name)
+        topic.pattern_index = self.pattern_index
+        topic.metrics = TopicMetrics(self, topic_name)
+        topic.replication_log = self.replication_log
+        return topic
+    
+    @_instrumented
     def create_topic(self, topic_name):
-        """创建主题：若主题不存在则新建"""
-        if topic_name not in self.topics:
-            self.topics[topic_name] = TopicSubject(topic_name)
-            self.add_message_log(f"创建主题：「{topic_name}」")
-            return True, f"主题「{topic_name}」创建成功"
-        return False, f"主题「{topic_name}」已存在"
+        """创建主题：若主题不存在则新建（主题名按"."分层，层级不能是通配符"*"或"#"）"""
+        if is_pattern(topic_name):
+            return False, f"主题名称「{topic_name}」不能包含通配符层级"
+        with self.topics_lock:
+            if topic_name in self.topics:
+                return False, f"主题「{topic_name}」已存在"
+            self.topics[topic_name] = self._new_topic(topic_name)
+        self._topology_changed('add', 'topics', topic_name)
+        self.add_message_log(f"创建主题：「{topic_name}」")
+        return True, f"主题「{topic_name}」创建成功"
     
+    @_instrumented
     def delete_topic(self, topic_name):
         """删除主题：若主题存在则删除，同时取消所有观察者的订阅"""
-        if topic_name in self.topics:
-            topic = self.topics.pop(topic_name)
-            # 取消该主题的所有观察者订阅
-            for observer in list(topic.observers):  # 使用list()避免在迭代时修改列表
-                topic.remove_observer(observer)
-            self.add_message_log(f"删除主题：「{topic_name}」")
-            return True, f"主题「{topic_name}」删除成功"
-        return False, f"主题「{topic_name}」不存在"
+        with self.topics_lock:
+            topic = self.topics.pop(topic_name, None)
+        if topic is None:
+            return False, f"主题「{topic_name}」不存在"
+        # 取消该主题的所有观察者订阅，并丢弃尚未投递的消息
+        topic.mark_deleted()
+        topic.disable_async_delivery(flush=False)
+        # 关闭持久化日志（日志文件保留在磁盘上，重新创建同名主题并开启持久化后可继续使用）
+        if topic.disable_persistence() is not None:
+            self.durable_logs.close_log(topic_name)
+        if topic.ack_tracker is not None:
+            topic.ack_tracker.close()
+        if topic.retention is not None:
+            topic.retention.close()
+        self._remove_topic_metrics(topic_name)
+        self._topology_changed('remove', 'topics', topic_name)
+        self.add_message_log(f"删除主题：「{topic_name}」")
+        return True, f"主题「{topic_name}」删除成功"
     
     def get_topic(self, topic_name):
         """获取主题实例"""
         return self.topics.get(topic_name)
     
+    @_instrumented
+    def configure_topic_delivery(self, topic_name, async_delivery=True,
+                                 max_queue_size=DEFAULT_DISPATCH_QUEUE_SIZE, policy=BACKPRESSURE_BLOCK):
+        """配置主题的投递模式：同步投递，或带背压策略的异步队列投递"""
+        topic = self.topics.get(topic_name)
+        if not topic:
+            return False, f"主题「{topic_name}」不存在，请先创建主题"
+        if not async_delivery:
+            topic.disable_async_delivery()
+            self._config_changed()
+            self.add_message_log(f"主题「{topic_name}」切换为同步投递", LOG_CONFIG)
+            return True, f"主题「{topic_name}」已切换为同步投递"
+        if self.dispatch_workers <= 0:
+            # 没有投递线程时队列中的消息永远不会被投递（如asyncio服务，所有操作都在事件循环线程内完成）
+            return False, "当前中间件未启用投递线程（dispatch_workers=0），不支持异步投递"
+        if policy not in BACKPRESSURE_POLICIES:
+            return False, f"未知的背压策略：{policy}，可选：{'/'.join(BACKPRESSURE_POLICIES)}"
+        if not isinstance(max_queue_size, int) or max_queue_size <= 0:
+            return False, "队列容量必须为正整数"
+        with self.topics_lock:
+            if self.dispatcher is None:
+                self.dispatcher = DispatcherPool(self.dispatch_workers)
+        topic.enable_async_delivery(self.dispatcher, max_queue_size, policy)
+        self._config_changed()
+        self.add_message_log(f"主题「{topic_name}」切换为异步投递（队列容量{max_queue_size}，背压策略{policy}）", LOG_CONFIG)
+        return True, f"主题「{topic_name}」已切换为异步投递"
+    
+    def get_queue_depths(self):
+        """获取所有主题的投递队列状态"""
+        return {topic_name: topic.get_queue_stats() for topic_name, topic in list(self.topics.items())}
+    
+    @_instrumented
+    def configure_topic_priority(self, topic_name, priority):
+        """设置主题的默认消息优先级（high/normal/low或0-2）：发布时未指定优先级的消息使用该优先级
+
+        优先级只影响异步投递时的排队顺序：主题队列按优先级分道，投递线程按权重轮转取出，
+        投递线程池也优先处理有高优先级消息的主题；同步投递时消息在发布时立即送达，没有排队
+        """
+        topic = self.topics.get(topic_name)
+        if not topic:
+            return False, f"主题「{topic_name}」不存在，请先创建主题"
+        try:
+            level = parse_priority(priority)
+        except ValueError as e:
+            return False, str(e)
+        topic.default_priority = level
+        self._config_changed()
+        self.add_message_log(f"主题「{topic_name}」的默认消息优先级设置为{priority_name(level)}", LOG_CONFIG)
+        return True, f"主题「{topic_name}」的默认消息优先级设置为{priority_name(level)}"
+    
+    # 消息确认与死信
+    @_instrumented
+    def configure_topic_acks(self, topic_name, enabled=True, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT,
+                             max_attempts=DEFAULT_MAX_ATTEMPTS, dead_letter_topic=None):
+        """开启/关闭主题的至少一次投递：订阅者需确认消息，超时未确认则重新投递，超过最大次数转入死信主题
+
+        死信主题默认为「dlq.主题名称」，不存在时自动创建
+        """
+        topic = self.topics.get(topic_name)
+        if not topic:
+            return False, f"主题「{topic_name}」不存在，请先创建主题"
+        if not enabled:
+            tracker, topic.ack_tracker = topic.ack_tracker, None
+            if tracker is not None:
+                tracker.close()
+            self._config_changed()
+            self.add_message_log(f"主题「{topic_name}」关闭消息确认", LOG_CONFIG)
+            return True, f"主题「{topic_name}」已关闭消息确认"
+        if not isinstance(visibility_timeout, (int, float)) or visibility_timeout <= 0:
+            return False, "可见性超时必须为正数"
+        if not isinstance(max_attempts, int) or max_attempts < 1:
+            return False, "最大投递次数必须为正整数"
+        dead_letter_topic = dead_letter_topic or f"dlq.{topic_name}"
+        if dead_letter_topic == topic_name:
+            return False, "死信主题不能是主题本身"
+        if dead_letter_topic not in self.topics:
+            success, msg = self.create_topic(dead_letter_topic)
+            if not success and dead_letter_topic not in self.topics:
+                return False, msg
+        tracker = AckTracker(topic, self._ensure_timer_wheel(), self._dead_letter, visibility_timeout, max_attempts,
+                             dead_letter_topic)
+        old_tracker, topic.ack_tracker = topic.ack_tracker, tracker
+        if old_tracker is not None:
+            old_tracker.close()
+        self._config_changed()
+        self.add_message_log(f"主题「{topic_name}」开启消息确认（可见性超时{visibility_timeout}秒，"
+                             f"最多投递{max_attempts}次，死信主题「{dead_letter_topic}」）", LOG_CONFIG)
+        return True, f"主题「{topic_name}」已开启消息确认"
+    
+    @_instrumented
+    def ack_messages(self, consumer_id, topic_name, offsets):
+        """确认消息已处理（consumer_id为观察者ID或消费组ID），返回(是否成功, 提示, 确认条数)"""
+        topic = self.topics.get(topic_name)
+        if not topic or topic.ack_tracker is None:
+            return False, f"主题「{topic_name}」不存在或未开启消息确认", 0
+        tracker = topic.ack_tracker
+        acked = sum(1 for offset in offsets if tracker.ack(consumer_id, offset))
+        return True, f"确认{acked}条消息", acked
+    
+    @_instrumented
+    def nack_messages(self, consumer_id, topic_name, offsets, requeue=True):
+        """拒绝消息：requeue为True时立即重新投递，否则转入死信主题；返回(是否成功, 提示, 处理条数)"""
+        topic = self.topics.get(topic_name)
+        if not topic or topic.ack_tracker is None:
+            return False, f"主题「{topic_name}」不存在或未开启消息确认", 0
+        tracker = topic.ack_tracker
+        count = sum(1 for offset in offsets if tracker.nack(consumer_id, offset, requeue))
+        return True, f"拒绝{count}条消息（{'重新投递' if requeue else '转入死信主题'}）", count
+    
+    def _ensure_timer_wheel(self):
+        """可见性超时与消息过期共用的时间轮（首次使用时创建并启动推进线程）"""
+        with self.topics_lock:
+            if self.timer_wheel is None:
+                self.timer_wheel = TimerWheel()
+                self.timer_wheel.start()
+            return self.timer_wheel
+
+    def _dead_letter(self, tracker, entry):
+        """将多次投递仍未确认的消息发布到死信主题（保留原生产者与内容）"""
+        message = entry.message
+        if message.expired:
+            return
+        topic = self.topics.get(tracker.dead_letter_topic)
+        if topic is None:
+            self.add_message_log(f"死信主题「{tracker.dead_letter_topic}」不存在，丢弃主题「{message.topic_name}」"
+                                 f"偏移量{message.offset}的消息")
+            return
+        topic.receive_message(Message(self.next_message_id(), message.producer_id, topic.topic_name,
+                                      time.time(), message.payload, headers=message.headers,
+                                      priority=message.priority))
+        self.add_message_log(f"主题「{message.topic_name}」偏移量{message.offset}的消息投递给{entry.consumer.observer_id}"
+                             f"{entry.attempts}次未确认，转入死信主题「{topic.topic_name}」")
+    
+    def get_ack_stats(self):
+        """获取开启消息确认的主题的未确认/确认/重新投递/死信计数"""
+        return {topic_name: topic.ack_tracker.get_stats() for topic_name, topic in list(self.topics.items())
+                if topic.ack_tracker is not None}
+    
+    # 消息保留策略
+    @_instrumented
+    def configure_topic_retention(self, topic_name, max_age=None, max_bytes=None, max_messages=None):
+        """设置主题的保留策略：最长保留时间（秒）、最大负载总字节数、最大消息数，None表示不限；全部为None时关闭
+
+        超出限制或过期的消息按发布顺序从最旧的开始清除内容，各观察者读取时跳过
+        """
+        topic = self.topics.get(topic_name)
+        if not topic:
+            return False, f"主题「{topic_name}」不存在，请先创建主题"
+        if max_age is None and max_bytes is None and max_messages is None:
+            retention, topic.retention = topic.retention, None
+            if retention is not None:
+                retention.close()
+            self._config_changed()
+            self.add_message_log(f"主题「{topic_name}」关闭消息保留策略", LOG_CONFIG)
+            return True, f"主题「{topic_name}」已关闭消息保留策略"
+        if max_age is not None and (not isinstance(max_age, (int, float)) or max_age <= 0):
+            return False, "最长保留时间必须为正数"
+        for value, name in ((max_bytes, "最大字节数"), (max_messages, "最大消息数")):
+            if value is not None and (not isinstance(value, int) or value <= 0):
+                return False, f"{name}必须为正整数"
+        with topic.lock:
+            retention = topic.retention
+            if retention is None:
+                topic.retention = RetentionIndex(topic_name, self._ensure_timer_wheel(),
+                                                 max_age, max_bytes, max_messages)
+        if retention is not None:
+            retention.configure(max_age, max_bytes, max_messages)
+        self._config_changed()
+        limits = "，".join(text for value, text in ((max_age, f"最长保留{max_age}秒"), (max_bytes, f"最多{max_bytes}字节"),
+                                                     (max_messages, f"最多{max_messages}条")) if value is not None)
+        self.add_message_log(f"主题「{topic_name}」设置消息保留策略（{limits}）", LOG_CONFIG)
+        return True, f"主题「{topic_name}」已设置消息保留策略"
+
+    def get_retention_stats(self):
+        """获取设置了保留策略的主题的限制、保留的消息数与字节数、已清除的消息数"""
+        return {topic_name: topic.retention.get_stats() for topic_name, topic in list(self.topics.items())
+                if topic.retention is not None}
+
+    def get_topic_memory_usage(self):
+        """各主题消息占用的内存：仍保留在观察者缓冲区中的消息数与负载字节数（同一消息对象只计一次）
+
+        设置了保留策略的主题直接读取保留索引的统计；其余主题需要遍历所有观察者的缓冲区，仅用于按需查询
+        """
+        usage = {}
+        indexed = set()
+        for topic_name, topic in list(self.topics.items()):
+            retention = topic.retention
+            if retention is not None:
+                stats = retention.get_stats()
+                usage[topic_name] = {"messages": stats["retained_messages"], "bytes": stats["retained_bytes"],
+                                     "retention": True}
+                indexed.add(topic_name)
+            else:
+                usage[topic_name] = {"messages": 0, "bytes": 0, "retention": False}
+        seen = set()
+        for observer in list(self.observers.values()):
+            for message in observer.received_messages.read_since(0)[0]:
+                if type(message) is not Message or message.expired or message.topic_name in indexed:
+                    continue
+                entry = usage.get(message.topic_name)
+                if entry is None or id(message) in seen:
+                    continue
+                seen.add(id(message))
+                entry["messages"] += 1
+                entry["bytes"] += payload_size(message.payload)
+        return usage
+    
+    # 消息持久化与重放
+    @_instrumented
+    def configure_topic_persistence(self, topic_name, durable=True):
+        """开启/关闭主题的持久化：开启后消息在投递前追加写入该主题的分段日志"""
+        topic = self.topics.get(topic_name)
+        if not topic:
+            return False, f"主题「{topic_name}」不存在，请先创建主题"
+        if self.durable_logs is None:
+            return False, "未配置持久化日志目录，无法开启持久化"
+        if durable:
+            if topic.log is None:
+                topic.enable_persistence(self.durable_logs.open_log(topic_name, topic.next_offset))
+            self._config_changed()
+            self.add_message_log(f"主题「{topic_name}」开启持久化", LOG_CONFIG)
+            return True, f"主题「{topic_name}」已开启持久化"
+        if topic.disable_persistence() is not None:
+            self.durable_logs.close_log(topic_name)
+        self._config_changed()
+        self.add_message_log(f"主题「{topic_name}」关闭持久化", LOG_CONFIG)
+        return True, f"主题「{topic_name}」已关闭持久化"
+    
+    def read_topic_log(self, topic_name, from_offset=0, max_count=1000):
+        """读取持久化主题从from_offset开始的历史消息，返回(是否成功, 提示, 消息列表, 下一次读取的偏移量)"""
+        topic = self.topics.get(topic_name)
+        if not topic:
+            return False, f"主题「{topic_name}」不存在，请先创建主题", [], from_offset
+        log = topic.log
+        if log is None:
+            return False, f"主题「{topic_name}」未开启持久化", [], from_offset
+        messages = [Message(record["message_id"], record["producer_id"], topic_name,
+                            record["timestamp"], record["payload"], offset, record["headers"], record["priority"])
+                    for offset, record in log.read(from_offset, max_count)]
+        next_offset = messages[-1].offset + 1 if messages else max(from_offset, log.start_offset)
+        return True, f"读取到{len(messages)}条历史消息", messages, next_offset
+    
+    @_instrumented
+    def replay_topic(self, observer_id, topic_name, from_offset=0, max_count=1000):
+        """将持久化主题从from_offset开始的历史消息重放给观察者，返回(是否成功, 提示, 下一次重放的偏移量)"""
+        observer = self.observers.get(observer_id)
+        if not observer:
+            return False, f"观察者{observer_id}不存在，请先创建观察者", from_offset
+        success, msg, messages, next_offset = self.read_topic_log(topic_name, from_offset, max_count)
+        if not success:
+            return False, msg, from_offset
+        topic = self.topics.get(topic_name)
+        message_filter = topic.subscription_filter(observer) if topic is not None else None
+        if message_filter is not None:
+            # 带过滤器的订阅只重放满足条件的消息
+            results = [{} for _ in messages]
+            messages = [message for message, cache in zip(messages, results)
+                        if message_filter.matches(message.headers, cache)]
+        if messages:
+            observer.update_batch(messages, topic_name)
+        self.add_message_log(f"向观察者{observer_id}重放主题「{topic_name}」的{len(messages)}条历史消息（偏移量{from_offset}起）")
+        return True, f"重放{len(messages)}条历史消息", next_offset
+    
+    def next_message_id(self):
+        """分配全局递增的消息ID"""
+        return next(self._message_ids)
+    
+    def store_payload(self, message_content):
+        """大消息写入共享内存负载池并返回句柄，之后的扇出只传递句柄；未配置负载池时原样返回"""
+        pool = self.payload_pool
+        return pool.store(message_content) if pool is not None else message_content
+    
     # 生产者管理
+    @_instrumented
     def create_producer(self, producer_id):
         """创建生产者：若生产者ID不存在则新建"""
-        if producer_id not in self.producers:
+        with self.producers_lock:
+            if producer_id in self.producers:
+                return False, f"生产者{producer_id}已存在"
             self.producers[producer_id] = MessageProducer(producer_id)
-            self.add_message_log(f"创建生产者：生产者{producer_id}")
-            return True, f"生产者{producer_id}创建成功"
-        return False, f"生产者{producer_id}已存在"
+        self._topology_changed('add', 'producers', producer_id)
+        self.add_message_log(f"创建生产者：生产者{producer_id}")
+        return True, f"生产者{producer_id}创建成功"
+    
+    @_instrumented
+    def delete_producer(self, producer_id):
+        """删除生产者"""
+        with self.producers_lock:
+            if self.producers.pop(producer_id, None) is None:
+                return False, f"生产者{producer_id}不存在"
+        self._topology_changed('remove', 'producers', producer_id)
+        self.add_message_log(f"删除生产者：生产者{producer_id}")
+        return True, f"生产者{producer_id}删除成功"
     
     # 观察者管理
+    @_instrumented
     def create_observer(self, observer_id):
         """创建观察者：若观察者ID不存在则新建"""
-        if observer_id not in self.observers:
-            self.observers[observer_id] = ConsumerObserver(observer_id)
-            self.add_message_log(f"创建观察者：观察者{observer_id}")
-            return True, f"观察者{observer_id}创建成功"
-        return False, f"观察者{observer_id}已存在"
-    
-    def observer_subscribe_topic(self, observer_id, topic_name):
-        """观察者订阅主题：找到观察者和主题，调用主题的注册方法"""
+        with self.observers_lock:
+            if observer_id in self.observers:
+                return False, f"观察者{observer_id}已存在"
+            self.observers[observer_id] = self.observer_class(observer_id, self.buffer_capacity)
+        self._topology_changed('add', 'observers', observer_id)
+        self.add_message_log(f"创建观察者：观察者{observer_id}")
+        return True, f"观察者{observer_id}创建成功"
+    
+    @_instrumented
+    def delete_observer(self, observer_id):
+        """删除观察者：同时取消其全部订阅"""
+        with self.observers_lock:
+            observer = self.observers.pop(observer_id, None)
+        if observer is None:
+            return False, f"观察者{observer_id}不存在"
+        for topic_name in list(observer.subscribed_topics):
+            topic = self.topics.get(topic_name)
+            if topic:
+                topic.remove_observer(observer)
+        for pattern in list(observer.subscribed_patterns):
+            self._unsubscribe_pattern(observer, pattern)
+        # 退出所有消费组，其待处理消息分配给组内其余成员
+        for group in list(self.consumer_groups.values()):
+            if group.remove_member(observer):
+                self.add_message_log(f"消费组「{group.group_id}」成员观察者{observer_id}退出，再均衡（第{group.generation}代）")
+        self._topology_changed('remove', 'observers', observer_id)
+        self.add_message_log(f"删除观察者：观察者{observer_id}")
+        return True, f"观察者{observer_id}删除成功"
+    
+    @_instrumented
+    def observer_subscribe_topic(self, observer_id, topic_name, from_offset=None, filter_expression=None):
+        """观察者订阅主题：找到观察者和主题，调用主题的注册方法
+
+        指定from_offset时（仅持久化主题），订阅后先重放该偏移量到当前末尾的历史消息，实现追赶；
+        topic_name含通配符层级时（如 orders.*、alerts.#）按模式订阅，之后新建的匹配主题同样生效；
+        指定filter_expression时（如 level IN ("error", "critical") AND amount >= 100）只接收消息头满足条件的消息，
+        表达式在订阅时编译一次，已订阅时更新为新的过滤条件
+        """
+        try:
+            message_filter = compile_filter(filter_expression)
+        except ValueError as e:
+            return False, f"过滤表达式无效：{e}"
         observer = self.observers.get(observer_id)
+        if observer and is_pattern(topic_name):
+            if message_filter is not None:
+                return False, "通配符模式订阅不支持过滤表达式"
+            return self._subscribe_pattern(observer, topic_name)
         topic = self.topics.get(topic_name)
         if not observer:
             return False, f"观察者{observer_id}不存在，请先创建观察者"
         if not topic:
             return False, f"主题「{topic_name}」不存在，请先创建主题"
-        # 调用主题的注册方法
-        topic.register_observer(observer)
-        self.add_message_log(f"观察者{observer_id}订阅主题「{topic_name}」")
+        # 调用主题的注册方法（主题可能恰好被其他线程删除）
+        if not topic.register_observer(observer, message_filter):
+            return False, f"主题「{topic_name}」不存在，请先创建主题"
+        self._subscription_changed('add', observer, topic_name)
+        if message_filter is not None:
+            self.add_message_log(f"观察者{observer_id}订阅主题「{topic_name}」（过滤条件：{message_filter.expression}）")
+        else:
+            self.add_message_log(f"观察者{observer_id}订阅主题「{topic_name}」")
+        if from_offset is not None and topic.log is not None:
+            # 先注册再重放：重放截止到注册时刻的日志末尾，之后的消息由正常投递送达
+            end_offset = topic.log.next_offset
+            offset = from_offset
+            while offset < end_offset:
+                success, _, next_offset = self.replay_topic(observer_id, topic_name, offset, end_offset - offset)
+                if not success or next_offset <= offset:
+                    break
+                offset = next_offset
         return True, f"观察者{observer_id}订阅主题「{topic_name}」成功"
     
+    @_instrumented
     def observer_unsubscribe_topic(self, observer_id, topic_name):
         """观察者取消订阅主题：找到观察者和主题，调用主题的移除方法"""
         observer = self.observers.get(observer_id)
+        if observer and is_pattern(topic_name):
+            if not self._unsubscribe_pattern(observer, topic_name):
+                return False, f"观察者{observer_id}未订阅模式「{topic_name}」"
+            self._subscription_changed('remove', observer, topic_name)
+            self.add_message_log(f"观察者{observer_id}取消订阅模式「{topic_name}」")
+            return True, f"观察者{observer_id}取消订阅模式「{topic_name}」成功"
         topic = self.topics.get(topic_name)
         if not observer or not topic:
             return False, "观察者或主题不存在"
         # 调用主题的移除方法
-        topic.remove_observer(observer)
+        if topic.remove_observer(observer):
+            self._subscription_changed('remove', observer, topic_name)
         self.add_message_log(f"观察者{observer_id}取消订阅主题「{topic_name}」")
         return True, f"观察者{observer_id}取消订阅主题「{topic_name}」成功"
     
+    def _subscribe_pattern(self, observer, pattern):
+        """通配符订阅：加入模式字典树，各主题在下一次投递时重新解析匹配的订阅者"""
+        with observer.subscription_lock:
+            if pattern in observer.subscribed_patterns:
+                return True, f"观察者{observer.observer_id}已订阅模式「{pattern}」"
+            if self.observers.get(observer.observer_id) is not observer:
+                return False, f"观察者{observer.observer_id}不存在，请先创建观察者"
+            self.pattern_index.subscribe(pattern, observer)
+            observer.subscribed_patterns[pattern] = None
+        self._subscription_changed('add', observer, pattern)
+        self.add_message_log(f"观察者{observer.observer_id}订阅模式「{pattern}」")
+        return True, f"观察者{observer.observer_id}订阅模式「{pattern}」成功"
+    
+    def _unsubscribe_pattern(self, observer, pattern):
+        with observer.subscription_lock:
+            if pattern not in observer.subscribed_patterns:
+                return False
+            del observer.subscribed_patterns[pattern]
+            self.pattern_index.unsubscribe(pattern, observer)
+            return True
+    
+    # 消费组管理
+    @_instrumented
+    def create_consumer_group(self, group_id, strategy=GROUP_ROUND_ROBIN):
+        """创建消费组：组内成员竞争消费所订阅主题的消息（每条消息只分配给一个成员）"""
+        if strategy not in GROUP_STRATEGIES:
+            return False, f"未知的分配策略：{strategy}，可选：{'/'.join(GROUP_STRATEGIES)}"
+        with self.groups_lock:
+            if group_id in self.consumer_groups:
+                return False, f"消费组「{group_id}」已存在"
+            group = self.consumer_groups[group_id] = ConsumerGroup(group_id, strategy, self.buffer_capacity)
+            group.backpressure = self.topic_backpressure
+        self._topology_changed('add', 'consumer_groups', group_id)
+        self.add_message_log(f"创建消费组：「{group_id}」（分配策略{strategy}）")
+        return True, f"消费组「{group_id}」创建成功"
+    
+    def topic_backpressure(self, topic_name):
+        """主题的(背压策略, 阻塞超时)：异步投递的主题取其投递队列的设置，同步投递的主题为阻塞等待"""
+        topic = self.topics.get(topic_name)
+        dispatch_queue = topic.dispatch_queue if topic is not None else None
+        if dispatch_queue is None:
+            return BACKPRESSURE_BLOCK, DEFAULT_BLOCK_TIMEOUT
+        return dispatch_queue.policy, dispatch_queue.block_timeout
+    
+    @_instrumented
+    def delete_consumer_group(self, group_id):
+        """删除消费组：同时取消组对所有主题的订阅（成员观察者保留）"""
+        with self.groups_lock:
+            group = self.consumer_groups.pop(group_id, None)
+        if group is None:
+            return False, f"消费组「{group_id}」不存在"
+        for topic_name in list(group.subscribed_topics):
+            topic = self.topics.get(topic_name)
+            if topic:
+                topic.remove_observer(group)
+        self._topology_changed('remove', 'consumer_groups', group_id)
+        self.add_message_log(f"删除消费组：「{group_id}」")
+        return True, f"消费组「{group_id}」删除成功"
+    
+    @_instrumented
+    def join_consumer_group(self, group_id, observer_id):
+        """观察者加入消费组，触发再均衡"""
+        group = self.consumer_groups.get(group_id)
+        observer = self.observers.get(observer_id)
+        if not group:
+            return False, f"消费组「{group_id}」不存在，请先创建消费组"
+        if not observer:
+            return False, f"观察者{observer_id}不存在，请先创建观察者"
+        if not group.add_member(observer):
+            return False, f"观察者{observer_id}已是消费组「{group_id}」的成员"
+        self._config_changed()
+        self.add_message_log(f"观察者{observer_id}加入消费组「{group_id}」，再均衡（第{group.generation}代）")
+        return True, f"观察者{observer_id}加入消费组「{group_id}」成功"
+    
+    @_instrumented
+    def leave_consumer_group(self, group_id, observer_id):
+        """观察者退出消费组，触发再均衡（其待处理消息分配给其余成员）"""
+        group = self.consumer_groups.get(group_id)
+        observer = self.observers.get(observer_id)
+        if not group or not observer:
+            return False, "消费组或观察者不存在"
+        if not group.remove_member(observer):
+            return False, f"观察者{observer_id}不是消费组「{group_id}」的成员"
+        self._config_changed()
+        self.add_message_log(f"观察者{observer_id}退出消费组「{group_id}」，再均衡（第{group.generation}代）")
+        return True, f"观察者{observer_id}退出消费组「{group_id}」成功"
+    
+    @_instrumented
+    def group_subscribe_topic(self, group_id, topic_name, from_offset=None):
+        """消费组订阅主题；持久化主题从from_offset（默认为组已提交的偏移量）开始追赶历史消息"""
+        group = self.consumer_groups.get(group_id)
+        topic = self.topics.get(topic_name)
+        if not group:
+            return False, f"消费组「{group_id}」不存在，请先创建消费组"
+        if not topic or not topic.register_observer(group):
+            return False, f"主题「{topic_name}」不存在，请先创建主题"
+        self._config_changed()
+        self.add_message_log(f"消费组「{group_id}」订阅主题「{topic_name}」")
+        if from_offset is None:
+            from_offset = group.committed_offsets.get(topic_name)
+        if from_offset is not None and topic.log is not None:
+            end_offset = topic.log.next_offset
+            offset = from_offset
+            while offset < end_offset:
+                success, _, messages, next_offset = self.read_topic_log(topic_name, offset, end_offset - offset)
+                if not success or next_offset <= offset:
+                    break
+                group.update_batch(messages, topic_name)
+                offset = next_offset
+        return True, f"消费组「{group_id}」订阅主题「{topic_name}」成功"
+    
+    @_instrumented
+    def group_unsubscribe_topic(self, group_id, topic_name):
+        """消费组取消订阅主题"""
+        group = self.consumer_groups.get(group_id)
+        topic = self.topics.get(topic_name)
+        if not group or not topic:
+            return False, "消费组或主题不存在"
+        topic.remove_observer(group)
+        self._config_changed()
+        self.add_message_log(f"消费组「{group_id}」取消订阅主题「{topic_name}」")
+        return True, f"消费组「{group_id}」取消订阅主题「{topic_name}」成功"
+    
+    @_instrumented
+    def commit_group_offset(self, group_id, observer_id, topic_name, offset):
+        """成员提交处理进度（主题内偏移量<offset的已分配消息处理完毕），返回(是否成功, 提示, 组的已提交偏移量)"""
+        group = self.consumer_groups.get(group_id)
+        if not group:
+            return False, f"消费组「{group_id}」不存在", None
+        committed = group.commit(observer_id, topic_name, offset)
+        if committed is None:
+            return False, f"观察者{observer_id}不是消费组「{group_id}」的成员", None
+        self._config_changed()
+        return True, f"消费组「{group_id}」主题「{topic_name}」已提交偏移量：{committed}", committed
+    
+    def get_consumer_groups(self):
+        """获取所有消费组的状态"""
+        return {group_id: group.get_stats() for group_id, group in list(self.consumer_groups.items())}
+    
     # 消息日志管理
-    def add_message_log(self, log_content):
-        """添加消息日志（包含时间）"""
-        current_time = datetime.datetime.now().strftime("%H:%M:%S")
-        full_log = f"[{current_time}] {log_content}"
-        self.message_logs.append(full_log)
-        # 限制日志数量（仅保留最近100条，避免内存溢出）
-        if len(self.message_logs) > 100:
-            self.message_logs.pop(0)
-    
-    def get_message_logs(self):
-        """获取所有消息日志（用于网页展示）"""
-        return self.message_logs
+    def add_message_log(self, log_content, category=LOG_LIFECYCLE, *args):
+        """添加日志事件：只记录时间戳与参数，读取时才格式化；按类别的采样设置丢弃事件"""
+        every = self.log_sample_every.get(category, 1)
+        if every != 1 and (every <= 0 or next(self._log_counters[category]) % every):
+            return
+        timestamp = time.time()
+        with self.log_lock:
+            self.message_logs.append(LogEvent(self._log_seq, timestamp, category, log_content, args))
+            self._log_seq += 1
+    
+    @_instrumented
+    def configure_message_log(self, category, sample_every=1):
+        """设置某类日志的采样间隔：1为全部记录，N为每N条记录1条，0为关闭"""
+        if category not in LOG_CATEGORIES:
+            return False, f"未知的日志类别：{category}，可选：{'/'.join(LOG_CATEGORIES)}"
+        if not isinstance(sample_every, int) or sample_every < 0:
+            return False, "采样间隔必须为非负整数"
+        self.log_sample_every[category] = sample_every
+        self._config_changed()
+        if sample_every == 0:
+            return True, f"已关闭「{category}」类日志"
+        return True, f"「{category}」类日志采样间隔设置为{sample_every}"
+    
+    def get_message_logs(self, since=0, categories=None):
+        """获取序号>=since的日志（用于网页展示），返回(日志字符串列表, 下一次读取的序号)
+
+        categories不为空时只返回这些类别的日志；since超过当前序号时（如服务端重启）返回当前序号以便重新同步
+        """
+        with self.log_lock:
+            events = list(self.message_logs)
+            next_seq = self._log_seq
+        if since > next_seq:
+            return [], next_seq
+        if events and since > events[0].seq:
+            events = events[since - events[0].seq:]
+        return [event.format() for event in events
+                if categories is None or event.category in categories], next_seq
     
     # 观察者消息获取（用于网页展示）
-    def get_observer_messages(self, observer_id):
-        """获取指定观察者接收的消息"""
+    def get_observer_messages(self, observer_id, since=0, limit=None):
+        """获取指定观察者偏移量>=since的消息，返回(消息列表, 下一次读取的偏移量)
+
+        返回的是消息对象，需要展示时调用render_messages()格式化
+        """
+        observer = self.observers.get(observer_id)
+        if not observer:
+            return [], 0
+        messages, next_offset = observer.received_messages.read_since(since, limit)
+        return live_messages(messages), next_offset
+    
+    def wait_observer_messages(self, observer_id, since=0, timeout=30.0, limit=None):
+        """长轮询：若暂无偏移量>=since的新消息，最多等待timeout秒；观察者不存在时返回None"""
         observer = self.observers.get(observer_id)
         if not observer:
-            return []
-        return observer.received_messages
+            return None
+        observer.received_messages.wait_for_messages(since, timeout)
+        messages, next_offset = observer.received_messages.read_since(since, limit)
+        return live_messages(messages), next_offset
     
     # 配置文件管理
-    def save_config(self):
-        """保存当前状态到配置文件"""
-        # 构建订阅关系
+    @_instrumented
+    def save_config(self, force=False):
+        """保存当前状态到配置文件：配置自上次保存/加载后未变化且文件存在时跳过（force为True时总是保存）"""
+        with self.config_lock:
+            if not force and not self.config_dirty and os.path.exists(self.config_file):
+                return True, "配置未变化，无需保存"
+            return self._save_config()
+    
+    def export_config(self):
+        """当前状态的配置字典（与保存到配置文件的内容相同）"""
+        # 构建订阅关系（遍历注册表快照，避免其他线程修改时迭代出错）
         subscriptions = {}
-        for observer_id, observer in self.observers.items():
-            if observer.subscribed_topics:
-                subscriptions[observer_id] = observer.subscribed_topics
+        for observer_id, observer in list(self.observers.items()):
+            if observer.subscribed_topics or observer.subscribed_patterns:
+                subscriptions[observer_id] = list(observer.subscribed_topics) + list(observer.subscribed_patterns)
         
         config = {
             'topics': list(self.topics.keys()),
@@ -204,98 +1768,299 @@ class MiddlewareCore:
             'observers': list(self.observers.keys()),
             'subscriptions': subscriptions
         }
-        
+        # 带过滤器的订阅记录其表达式（订阅关系本身仍在subscriptions中）
+        subscription_filters = {}
+        for observer_id, observer in list(self.observers.items()):
+            filters = {topic_name: expression for topic_name, expression in list(observer.subscribed_topics.items())
+                       if expression is not None}
+            if filters:
+                subscription_filters[observer_id] = filters
+        if subscription_filters:
+            config['subscription_filters'] = subscription_filters
+        # 仅记录开启了异步投递的主题
+        delivery = {}
+        for topic_name, topic in list(self.topics.items()):
+            stats = topic.get_queue_stats()
+            if stats["async_delivery"]:
+                delivery[topic_name] = {'max_queue_size': stats["max_queue_size"], 'policy': stats["policy"]}
+        if delivery:
+            config['delivery'] = delivery
+        # 仅记录非默认的主题优先级
+        priorities = {topic_name: priority_name(topic.default_priority) for topic_name, topic in list(self.topics.items())
+                      if topic.default_priority != DEFAULT_PRIORITY}
+        if priorities:
+            config['priorities'] = priorities
+        durable_topics = [topic_name for topic_name, topic in list(self.topics.items()) if topic.log is not None]
+        if durable_topics:
+            config['durable_topics'] = durable_topics
+        consumer_groups = {}
+        for group_id, group in list(self.consumer_groups.items()):
+            stats = group.get_stats()
+            consumer_groups[group_id] = {
+                'strategy': stats["strategy"],
+                'members': stats["members"],
+                'topics': stats["topics"],
+                'committed_offsets': stats["committed_offsets"]
+            }
+        if consumer_groups:
+            config['consumer_groups'] = consumer_groups
+        acks = {topic_name: {'visibility_timeout': stats["visibility_timeout"], 'max_attempts': stats["max_attempts"],
+                             'dead_letter_topic': stats["dead_letter_topic"]}
+                for topic_name, stats in self.get_ack_stats().items()}
+        if acks:
+            config['acks'] = acks
+        retention = {topic_name: {key: stats[key] for key in ('max_age', 'max_bytes', 'max_messages')
+                                  if stats[key] is not None}
+                     for topic_name, stats in self.get_retention_stats().items()}
+        if retention:
+            config['retention'] = retention
+        # 仅记录非默认的日志采样设置
+        message_log = {category: every for category, every in self.log_sample_every.items() if every != 1}
+        if message_log:
+            config['message_log'] = message_log
+        return config
+    
+    def _save_config(self):
+        config_version = self.config_version  # 先记录版本号：保存期间发生的修改仍标记为未保存
+        config = self.export_config()
         try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
-            self.add_message_log("配置已保存到文件")
+            self._write_config_atomic(config)
+            # 同时写入二进制快照（在JSON之后写入，修改时间不早于JSON），下次加载时优先读取
+            write_snapshot(snapshot_path(self.config_file), config)
+            self._saved_config_version = config_version
+            self.add_message_log("配置已保存到文件", LOG_CONFIG)
             return True, "配置保存成功"
         except Exception as e:
             error_msg = f"保存配置文件失败：{str(e)}"
-            self.add_message_log(error_msg)
+            self.add_message_log(error_msg, LOG_CONFIG)
             return False, error_msg
     
+    def _write_config_atomic(self, config):
+        """先写入同目录的临时文件并刷盘，再原子替换配置文件（写入中途失败不会留下不完整的配置）"""
+        directory = os.path.dirname(os.path.abspath(self.config_file))
+        fd, temp_path = tempfile.mkstemp(prefix='.config-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(config, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.config_file)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    
+    @_instrumented
     def load_config(self):
         """从配置文件加载预设配置"""
-        if not os.path.exists(self.config_file):
+        with self.config_lock:
+            return self._load_config()
+    
+    def _read_config(self):
+        """读取配置，返回(配置字典, 来源)：二进制快照不比JSON旧时优先读取快照，不兼容或损坏时回退到JSON"""
+        if snapshot_is_fresh(self.config_file):
+            try:
+                return read_snapshot(snapshot_path(self.config_file)), "二进制快照"
+            except (OSError, ValueError):
+                pass
+        with open(self.config_file, 'r', encoding='utf-8') as f:
+            return json.load(f), "JSON"
+    
+    def _load_config(self):
+        if not os.path.exists(self.config_file) and not os.path.exists(snapshot_path(self.config_file)):
             msg = "配置文件不存在"
-            self.add_message_log(msg)
+            self.add_message_log(msg, LOG_CONFIG)
             return False, msg
             
         try:
-            with open(self.config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
+            start_time = time.perf_counter()
+            config, source = self._read_config()
             
             # 清除现有数据
             self._clear_all_entities()
             
-            # 加载预设主题
-            topics = config.get('topics', [])
-            for topic_name in topics:
-                if topic_name not in self.topics:
-                    self.topics[topic_name] = TopicSubject(topic_name)
-                    self.add_message_log(f"从配置文件加载主题：「{topic_name}」")
+            # 日志采样设置（未配置的类别全部记录）
+            message_log = config.get('message_log', {})
+            for category in LOG_CATEGORIES:
+                self.configure_message_log(category, message_log.get(category, 1))
             
-            # 加载预设生产者
-            producers = config.get('producers', [])
-            for producer_id in producers:
-                if producer_id not in self.producers:
-                    self.producers[producer_id] = MessageProducer(producer_id)
-                    self.add_message_log(f"从配置文件加载生产者：生产者{producer_id}")
+            # 批量加载主题、生产者、观察者与订阅关系：一次遍历构建注册表，
+            # 每个主题的订阅者元组只生成一次，整个过程只记录一条汇总日志
+            topic_count, producer_count, observer_count, subscription_count = self._bulk_load_entities(config)
             
-            # 加载预设观察者
-            observers = config.get('observers', [])
-            for observer_id in observers:
-                if observer_id not in self.observers:
-                    self.observers[observer_id] = ConsumerObserver(observer_id)
-                    self.add_message_log(f"从配置文件加载观察者：观察者{observer_id}")
+            # 加载持久化主题（需在投递之前恢复日志，偏移量从日志末尾继续）
+            for topic_name in config.get('durable_topics', []):
+                if topic_name in self.topics and self.durable_logs is not None:
+                    self.configure_topic_persistence(topic_name, True)
             
-            # 加载订阅关系
-            subscriptions = config.get('subscriptions', {})
-            for observer_id, topic_list in subscriptions.items():
-                if observer_id in self.observers:
-                    observer = self.observers[observer_id]
-                    for topic_name in topic_list:
-                        if topic_name in self.topics:
-                            topic = self.topics[topic_name]
-                            # 检查是否已经订阅
-                            if topic_name not in observer.subscribed_topics:
-                                topic.register_observer(observer)
-                                self.add_message_log(f"从配置文件加载订阅关系：观察者{observer_id}订阅主题「{topic_name}」")
+            # 加载主题投递模式（未配置的主题保持同步投递）
+            delivery = config.get('delivery', {})
+            for topic_name, options in delivery.items():
+                if topic_name in self.topics:
+                    self.configure_topic_delivery(
+                        topic_name, True,
+                        options.get('max_queue_size', DEFAULT_DISPATCH_QUEUE_SIZE),
+                        options.get('policy', BACKPRESSURE_BLOCK))
             
-            msg = "配置加载成功"
-            self.add_message_log(msg)
+            # 加载主题的默认消息优先级
+            for topic_name, priority in config.get('priorities', {}).items():
+                if topic_name in self.topics:
+                    self.configure_topic_priority(topic_name, priority)
+            
+            # 加载消息确认设置
+            for topic_name, options in config.get('acks', {}).items():
+                if topic_name in self.topics:
+                    self.configure_topic_acks(
+                        topic_name, True,
+                        options.get('visibility_timeout', DEFAULT_VISIBILITY_TIMEOUT),
+                        options.get('max_attempts', DEFAULT_MAX_ATTEMPTS),
+                        options.get('dead_letter_topic'))
+            
+            # 加载消息保留策略
+            for topic_name, options in config.get('retention', {}).items():
+                if topic_name in self.topics:
+                    self.configure_topic_retention(topic_name, options.get('max_age'), options.get('max_bytes'),
+                                                   options.get('max_messages'))
+            
+            # 加载消费组（在持久化主题恢复之后，订阅时从已提交的偏移量追赶历史消息）
+            for group_id, options in config.get('consumer_groups', {}).items():
+                success, _ = self.create_consumer_group(group_id, options.get('strategy', GROUP_ROUND_ROBIN))
+                if not success:
+                    continue
+                group = self.consumer_groups[group_id]
+                group.committed_offsets.update(options.get('committed_offsets', {}))
+                for observer_id in options.get('members', []):
+                    if observer_id in self.observers:
+                        self.join_consumer_group(group_id, observer_id)
+                for topic_name in options.get('topics', []):
+                    if topic_name in self.topics:
+                        self.group_subscribe_topic(group_id, topic_name)
+            
+            msg = (f"配置加载成功（{source}，{topic_count}个主题、{producer_count}个生产者、{observer_count}个观察者、"
+                   f"{subscription_count}条订阅关系，耗时{time.perf_counter() - start_time:.3f}秒）")
+            self._topology_reset(saved=True)
+            self.add_message_log(msg, LOG_CONFIG)
             return True, msg
         except Exception as e:
+            self._topology_reset()
             error_msg = f"加载配置文件失败：{str(e)}"
-            self.add_message_log(error_msg)
+            self.add_message_log(error_msg, LOG_CONFIG)
             return False, error_msg
     
+    def _bulk_load_entities(self, config):
+        """按配置一次性构建主题、生产者、观察者注册表与订阅关系，返回各自的数量
+
+        调用前注册表已清空；每个观察者的订阅列表按集合去重，每个主题的订阅者元组在最后整体生成。
+        构建期间暂停循环垃圾回收：大量新建的长期对象会反复触发分代回收，而这些对象都不是垃圾
+        """
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._build_entities_from_config(config)
+        finally:
+            if gc_enabled:
+                gc.enable()
+    
+    def _build_entities_from_config(self, config):
+        topics = {}
+        for topic_name in config.get('topics', []):
+            if topic_name not in topics and not is_pattern(topic_name):
+                topics[topic_name] = self._new_topic(topic_name)
+        producers = {producer_id: MessageProducer(producer_id) for producer_id in config.get('producers', [])}
+        observers = {}
+        for observer_id in config.get('observers', []):
+            if observer_id not in observers:
+                observers[observer_id] = self.observer_class(observer_id, self.buffer_capacity)
+        subscribers = {}                  # key=主题名称，value={订阅该主题的观察者: 过滤器}
+        subscription_count = 0
+        all_filters = config.get('subscription_filters', {})
+        compiled = {}                     # 相同的过滤表达式只编译一次
+        for observer_id, topic_list in config.get('subscriptions', {}).items():
+            observer = observers.get(observer_id)
+            if observer is None:
+                continue
+            filters = all_filters.get(observer_id, {})
+            subscribed_topics, subscribed_patterns = observer.subscribed_topics, observer.subscribed_patterns
+            for topic_name in topic_list:
+                if topic_name in subscribed_topics or topic_name in subscribed_patterns:
+                    continue
+                if is_pattern(topic_name):
+                    self.pattern_index.subscribe(topic_name, observer)
+                    subscribed_patterns[topic_name] = None
+                elif topic_name in topics:
+                    expression = filters.get(topic_name)
+                    message_filter = None
+                    if expression is not None:
+                        if expression not in compiled:
+                            compiled[expression] = compile_filter(expression)
+                        message_filter = compiled[expression]
+                    subscribers.setdefault(topic_name, {})[observer] = message_filter
+                    subscribed_topics[topic_name] = message_filter.expression if message_filter is not None else None
+                else:
+                    continue
+                subscription_count += 1
+        for topic_name, topic_observers in subscribers.items():
+            topics[topic_name].load_observers(topic_observers)
+        with self.topics_lock, self.producers_lock, self.observers_lock:
+            self.topics.update(topics)
+            self.producers.update(producers)
+            self.observers.update(observers)
+        return len(topics), len(producers), len(observers), subscription_count
+    
     def _clear_all_entities(self):
         """清除所有实体"""
+        # 在锁内整体换出注册表，其他线程之后只会看到空注册表
+        with self.topics_lock, self.producers_lock, self.observers_lock, self.groups_lock:
+            old_topics = self.topics
+            old_observers = self.observers
+            self.topics = {}
+            self.producers = {}
+            self.observers = {}
+            self.consumer_groups = {}
+        for observer in old_observers.values():
+            for pattern in list(observer.subscribed_patterns):
+                self._unsubscribe_pattern(observer, pattern)
         # 清除主题（需要先取消所有订阅关系）
-        for topic_name, topic in self.topics.items():
-            # 取消所有观察者的订阅
-            for observer in list(topic.observers):
-                topic.remove_observer(observer)
-        
-        # 清空所有字典
-        self.topics.clear()
-        self.producers.clear()
-        self.observers.clear()
+        for topic_name, topic in old_topics.items():
+            topic.mark_deleted()
+            topic.disable_async_delivery(flush=False)
+            if topic.disable_persistence() is not None:
+                self.durable_logs.close_log(topic_name)
+            if topic.ack_tracker is not None:
+                topic.ack_tracker.close()
+            if topic.retention is not None:
+                topic.retention.close()
+            self._remove_topic_metrics(topic_name)
+        self._topology_reset()
         
         self.add_message_log("已清除所有现有实体")
     
+    def close(self):
+        """停止投递线程与时间轮线程，将持久化日志刷盘关闭并释放负载池（进程退出前调用）"""
+        if self.dispatcher is not None:
+            self.dispatcher.shutdown()
+            self.dispatcher = None
+        if self.durable_logs is not None:
+            self.durable_logs.close()
+        if self.timer_wheel is not None:
+            self.timer_wheel.stop()
+            self.timer_wheel = None
+        if self.payload_pool is not None:
+            self.payload_pool.close()
+    
     def get_all_entities(self):
-        """获取所有实体信息用于前端下拉选择"""
+        """获取所有实体信息用于前端下拉选择（按拓扑版本缓存的快照，调用方不应修改）"""
+        return self.get_entities_snapshot()[1]
+    
+    def _build_entities(self):
         # 获取订阅关系
         subscriptions = {}
-        for observer_id, observer in self.observers.items():
-            subscriptions[observer_id] = observer.subscribed_topics
+        for observer_id, observer in list(self.observers.items()):
+            subscriptions[observer_id] = list(observer.subscribed_topics) + list(observer.subscribed_patterns)
         
         return {
             'topics': list(self.topics.keys()),
             'producers': list(self.producers.keys()),
             'observers': list(self.observers.keys()),
-            'subscriptions': subscriptions
+            'subscriptions': subscriptions,
+            'consumer_groups': list(self.consumer_groups.keys())
         }
\ No newline at end of file
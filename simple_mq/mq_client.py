@@ -0,0 +1,139 @@
+# mq_client.py
+# 二进制TCP协议的Python客户端（协议定义见wire_protocol.py）
+#
+# 示例：
+#   with MQClient('127.0.0.1', 5002) as client:
+#       client.create_topic('订单处理')
+#       client.create_producer('网站服务器1')
+#       client.publish('网站服务器1', '订单处理', '新订单')
+#       client.publish_pipelined('网站服务器1', '订单处理', ['a', 'b', 'c'])
+#       messages, next_offset = client.fetch('订单处理服务', wait_ms=5000)
+#       client.ack('订单处理服务', '订单处理', [message['offset'] for message in messages])
+#
+# 单个客户端对象不是线程安全的，多线程请各自创建连接
+import itertools
+import socket
+
+from wire_protocol import (
+    FRAME_HEADER, I64, U32, U64, BodyReader, ProtocolError, decode_messages, encode_frame, pack_payload, pack_str,
+    OP_ACK, OP_ACK_MESSAGES, OP_CREATE_OBSERVER, OP_CREATE_PRODUCER, OP_CREATE_TOPIC, OP_ERROR, OP_FETCH, OP_MESSAGES,
+    OP_PUBLISH, OP_PUBLISH_BATCH, OP_SUBSCRIBE, OP_UNSUBSCRIBE,
+)
+
+
+class MQClient:
+    def __init__(self, host='127.0.0.1', port=5002, timeout=30.0):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self.sock.makefile('rb')
+        self._request_ids = itertools.count(1)
+        self._replies = {}       # 已收到但尚未被取走的响应：请求ID -> (操作码, 帧体)
+        self._outgoing = []      # 流水线模式下尚未发送的请求帧
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._reader.close()
+        self.sock.close()
+
+    # 底层收发
+    def send(self, opcode, body=b'', flush=True):
+        """发送一个请求帧并返回请求ID；flush为False时暂存，等待下一次flush()合并发送"""
+        request_id = next(self._request_ids) & 0xFFFFFFFF
+        self._outgoing.append(encode_frame(opcode, request_id, body))
+        if flush:
+            self.flush()
+        return request_id
+
+    def flush(self):
+        if self._outgoing:
+            self.sock.sendall(b''.join(self._outgoing))
+            self._outgoing.clear()
+
+    def _read_frame(self):
+        header = self._reader.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            raise ConnectionError("连接已关闭")
+        length, opcode, request_id = FRAME_HEADER.unpack(header)
+        body = self._reader.read(length) if length else b''
+        if len(body) < length:
+            raise ConnectionError("连接已关闭")
+        return opcode, request_id, body
+
+    def receive(self, request_id):
+        """等待指定请求的响应，返回(操作码, 帧体)；服务端返回错误时抛出ProtocolError"""
+        self.flush()
+        while request_id not in self._replies:
+            opcode, reply_id, body = self._read_frame()
+            self._replies[reply_id] = (opcode, body)
+        opcode, body = self._replies.pop(request_id)
+        if opcode == OP_ERROR:
+            raise ProtocolError(BodyReader(body).read_str())
+        return opcode, body
+
+    def _call(self, opcode, body):
+        reply_opcode, reply_body = self.receive(self.send(opcode, body))
+        if reply_opcode == OP_ACK:
+            return I64.unpack(reply_body)[0]
+        return reply_body
+
+    # 实体管理
+    def create_topic(self, topic_name):
+        return self._call(OP_CREATE_TOPIC, pack_str(topic_name))
+
+    def create_producer(self, producer_id):
+        return self._call(OP_CREATE_PRODUCER, pack_str(producer_id))
+
+    def create_observer(self, observer_id):
+        return self._call(OP_CREATE_OBSERVER, pack_str(observer_id))
+
+    def subscribe(self, observer_id, topic_name):
+        return self._call(OP_SUBSCRIBE, pack_str(observer_id) + pack_str(topic_name))
+
+    def unsubscribe(self, observer_id, topic_name):
+        return self._call(OP_UNSUBSCRIBE, pack_str(observer_id) + pack_str(topic_name))
+
+    # 发布
+    def publish(self, producer_id, topic_name, payload):
+        """发布一条消息并等待确认，返回主题内偏移量（无则为-1）"""
+        return self._call(OP_PUBLISH, pack_str(producer_id) + pack_str(topic_name) + pack_payload(payload))
+
+    def publish_batch(self, producer_id, topic_name, payloads):
+        """一个帧内批量发布，返回服务端接受的条数（投递队列已满时可能少于len(payloads)）"""
+        body = [pack_str(producer_id), pack_str(topic_name), U32.pack(len(payloads))]
+        body += [pack_payload(payload) for payload in payloads]
+        return self._call(OP_PUBLISH_BATCH, b''.join(body))
+
+    def publish_pipelined(self, producer_id, topic_name, payloads, window=256):
+        """流水线发布：最多window个请求同时在途，不必逐条等待确认；返回各条消息的偏移量"""
+        prefix = pack_str(producer_id) + pack_str(topic_name)
+        in_flight, offsets = [], []
+        for payload in payloads:
+            in_flight.append(self.send(OP_PUBLISH, prefix + pack_payload(payload), flush=False))
+            if len(in_flight) >= window:
+                offsets += [I64.unpack(self.receive(request_id)[1])[0] for request_id in in_flight]
+                in_flight.clear()
+        offsets += [I64.unpack(self.receive(request_id)[1])[0] for request_id in in_flight]
+        return offsets
+
+    # 消费
+    def fetch(self, observer_id, since=0, max_count=1000, wait_ms=0):
+        """拉取偏移量>=since的消息；wait_ms>0时服务端在没有新消息时最多等待该毫秒数
+
+        返回(消息字典列表, 下一次拉取的偏移量)
+        """
+        body = pack_str(observer_id) + U64.pack(since) + U32.pack(max_count) + U32.pack(wait_ms)
+        opcode, reply_body = self.receive(self.send(OP_FETCH, body))
+        if opcode != OP_MESSAGES:
+            raise ProtocolError(f"意外的响应操作码：{opcode:#x}")
+        return decode_messages(reply_body)
+
+    def ack(self, consumer_id, topic_name, offsets):
+        """确认已处理的消息（consumer_id为观察者ID或消费组ID，主题需开启消息确认），返回确认条数"""
+        body = [pack_str(consumer_id), pack_str(topic_name), U32.pack(len(offsets))]
+        body += [U64.pack(offset) for offset in offsets]
+        return self._call(OP_ACK_MESSAGES, b''.join(body))
@@ -0,0 +1,126 @@
+# payload_pool.py
+# 大消息的共享内存负载池：消息内容只写入一次共享内存槽位，消息对象与订阅者只持有句柄
+# 槽位的引用计数即句柄对象的引用计数：最后一个持有该消息的缓冲区/跟踪器释放后槽位自动归还
+# 其他进程可以按(共享内存名称, 起始位置, 长度)直接读取内容，无需经过管道复制
+import threading
+from collections import deque
+from multiprocessing import shared_memory
+
+DEFAULT_SLOT_SIZE = 64 * 1024     # 槽位大小（字节），超过的负载不进入负载池
+DEFAULT_SLOT_COUNT = 1024         # 槽位数量
+DEFAULT_MIN_SIZE = 4 * 1024       # 小于该长度的负载直接保存在消息对象中
+
+
+def _restore_payload(data, is_text):
+    return data.decode('utf-8') if is_text else data
+
+
+# 负载句柄：消息对象的payload字段；展示、编码时按需从共享内存读取
+class PayloadHandle:
+    __slots__ = ('pool', 'slot', 'length', 'is_text')
+
+    def __init__(self, pool, slot, length, is_text):
+        self.pool = pool
+        self.slot = slot              # 槽位序号
+        self.length = length          # 内容长度（字节）
+        self.is_text = is_text        # 原始负载是否为字符串
+
+    def view(self):
+        """共享内存中内容的只读视图（零拷贝）"""
+        start = self.slot * self.pool.slot_size
+        return self.pool.buf[start:start + self.length].toreadonly()
+
+    def tobytes(self):
+        return self.view().tobytes()
+
+    def location(self):
+        """供其他进程直接读取的(共享内存名称, 起始位置, 长度)"""
+        return self.pool.name, self.slot * self.pool.slot_size, self.length
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return self.tobytes().decode('utf-8', errors='replace')
+
+    def __format__(self, format_spec):
+        return format(str(self), format_spec)
+
+    def __reduce__(self):
+        # 跨进程传递（如分片模式的拉取结果）时还原为普通字符串/字节
+        return _restore_payload, (self.tobytes(), self.is_text)
+
+    def __del__(self):
+        self.pool.release(self.slot)
+
+
+class PayloadPool:
+    def __init__(self, slot_size=DEFAULT_SLOT_SIZE, slot_count=DEFAULT_SLOT_COUNT, min_size=DEFAULT_MIN_SIZE):
+        if slot_size <= 0 or slot_count <= 0:
+            raise ValueError("槽位大小和数量必须为正整数")
+        self.slot_size = slot_size
+        self.slot_count = slot_count
+        self.min_size = min_size
+        self.shm = shared_memory.SharedMemory(create=True, size=slot_size * slot_count)
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+        # 空闲槽位：deque的append/popleft是原子操作，句柄在任意线程被回收时归还槽位无需加锁
+        self._free = deque(range(slot_count))
+        self.stored_count = 0         # 写入负载池的消息数
+        self.fallback_count = 0       # 负载池已满而直接保存在消息对象中的消息数
+        self.closed = False
+        self._close_lock = threading.Lock()
+
+    @property
+    def slots_in_use(self):
+        return self.slot_count - len(self._free)
+
+    def store(self, payload):
+        """将负载写入一个空闲槽位并返回句柄；长度不在[min_size, slot_size]内或负载池已满时原样返回"""
+        if isinstance(payload, str):
+            if len(payload) < self.min_size:
+                return payload
+            data, is_text = payload.encode('utf-8'), True
+        elif isinstance(payload, (bytes, bytearray, memoryview)):
+            data, is_text = payload, False
+        else:
+            return payload
+        length = len(data)
+        if length < self.min_size or length > self.slot_size or self.closed:
+            return payload
+        try:
+            slot = self._free.popleft()
+        except IndexError:
+            self.fallback_count += 1
+            return payload
+        start = slot * self.slot_size
+        self.buf[start:start + length] = data
+        self.stored_count += 1
+        return PayloadHandle(self, slot, length, is_text)
+
+    def release(self, slot):
+        if not self.closed:
+            self._free.append(slot)
+
+    def get_stats(self):
+        return {
+            "slot_size": self.slot_size,
+            "slot_count": self.slot_count,
+            "slots_in_use": self.slots_in_use,
+            "stored": self.stored_count,
+            "fallback": self.fallback_count
+        }
+
+    def close(self):
+        """释放共享内存（仍被引用的句柄之后不可再读取）"""
+        with self._close_lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.buf = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # 仍有导出的视图，映射随进程退出释放
+            pass
+        self.shm.unlink()
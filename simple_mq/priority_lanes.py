@@ -0,0 +1,98 @@
+# priority_lanes.py
+# 消息优先级与按优先级分道的队列：每个优先级一个FIFO通道，取出时按权重在各通道间加权轮转
+# （每轮高优先级通道最多取出8条、普通4条、低1条），高优先级消息先投递，低优先级通道在每一轮中
+# 都保有自己的份额，不会被持续涌入的高优先级消息饿死；某个通道为空时其份额让给其他通道
+# 同一优先级内保持发布顺序，不同优先级之间不保证顺序
+from collections import deque
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_LEVELS = (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW)
+PRIORITY_NAMES = ('high', 'normal', 'low')
+DEFAULT_PRIORITY = PRIORITY_NORMAL
+DEFAULT_PRIORITY_WEIGHTS = (8, 4, 1)      # 各通道每轮最多取出的条数
+
+
+def parse_priority(value):
+    """优先级可以是名称（high/normal/low）或数值（0-2，越小越优先），无效时抛出ValueError"""
+    if isinstance(value, str) and value.strip().lower() in PRIORITY_NAMES:
+        return PRIORITY_NAMES.index(value.strip().lower())
+    if isinstance(value, int) and not isinstance(value, bool) and value in PRIORITY_LEVELS:
+        return value
+    raise ValueError(f"无效的优先级：{value}（可选 high/normal/low 或 0-2）")
+
+
+def priority_name(level):
+    return PRIORITY_NAMES[level]
+
+
+# 按优先级分道的FIFO队列（不加锁，由调用方保证互斥）
+class PriorityLanes:
+    def __init__(self, weights=DEFAULT_PRIORITY_WEIGHTS):
+        if len(weights) != len(PRIORITY_LEVELS) or any(weight <= 0 for weight in weights):
+            raise ValueError("每个优先级的权重必须为正整数")
+        self.weights = tuple(weights)
+        self._lanes = tuple(deque() for _ in PRIORITY_LEVELS)
+        self._quota = list(self.weights)  # 本轮各通道剩余的份额
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def depths(self):
+        """各优先级通道中的条数"""
+        return [len(lane) for lane in self._lanes]
+
+    def lane_size(self, level):
+        return len(self._lanes[level])
+
+    def head_priority(self):
+        """最高的非空通道的优先级，队列为空时返回None"""
+        for level, lane in enumerate(self._lanes):
+            if lane:
+                return level
+        return None
+
+    def append(self, item, level=DEFAULT_PRIORITY):
+        self._lanes[level].append(item)
+        self._size += 1
+
+    def popleft_lane(self, level):
+        """从指定通道取出最早的一条（如丢弃最旧消息时）"""
+        item = self._lanes[level].popleft()
+        self._size -= 1
+        return item
+
+    def take(self, max_items):
+        """按加权轮转取出最多max_items条；份额在多次调用之间延续，每次只取1条时同样按权重轮转"""
+        batch = []
+        lanes, quota = self._lanes, self._quota
+        while len(batch) < max_items and self._size > len(batch):
+            progressed = False
+            for level, lane in enumerate(lanes):
+                if not lane or not quota[level]:
+                    continue
+                count = min(quota[level], len(lane), max_items - len(batch))
+                batch.extend([lane.popleft() for _ in range(count)])
+                quota[level] -= count
+                progressed = True
+                if len(batch) >= max_items:
+                    break
+            if not progressed:
+                # 有剩余份额的通道都已取空：开始新的一轮
+                quota[:] = self.weights
+        self._size -= len(batch)
+        return batch
+
+    def clear(self):
+        """取出全部条目（按优先级从高到低、同一优先级按入队顺序）"""
+        items = [item for lane in self._lanes for item in lane]
+        for lane in self._lanes:
+            lane.clear()
+        self._size = 0
+        self._quota[:] = self.weights
+        return items
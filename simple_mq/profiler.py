@@ -0,0 +1,146 @@
+# profiler.py
+# 按时间窗口开启的性能剖析：窗口内按采样间隔对请求做cProfile剖析（cProfile只跟踪当前线程，
+# 因此在请求线程内剖析，结束后合并统计；同一时刻只剖析一个请求，其余并发请求跳过——
+# Python 3.12起同时启用两个cProfile会抛出ValueError），同时用tracemalloc对比窗口开始以来的内存分配
+# 窗口结束后停止剖析，结果保留到下一次开启
+import cProfile
+import io
+import itertools
+import pstats
+import threading
+import time
+import tracemalloc
+
+DEFAULT_PROFILE_DURATION = 30.0     # 默认剖析窗口（秒）
+MAX_PROFILE_DURATION = 600.0        # 最长剖析窗口（秒）
+PROFILE_SORT_KEYS = ('cumulative', 'tottime', 'calls')
+MEMORY_TOP_LINES = 30               # 内存分配差异保留的代码行数
+
+
+class ProfilerSession:
+    def __init__(self):
+        self.cpu = False                  # 是否对请求做cProfile剖析
+        self.memory = False               # 是否跟踪内存分配
+        self.sample_every = 1             # 每N个请求剖析1个
+        self.started_at = None            # 窗口开始时间（时间戳）
+        self.profiled_requests = 0        # 已剖析的请求数
+        self._ends_at = 0.0               # 窗口结束时间（monotonic）
+        self._counter = itertools.count()
+        self._stats = None                # 合并后的cProfile统计（pstats.Stats）
+        self._snapshot = None             # 窗口开始时的tracemalloc快照
+        self._started_tracemalloc = False  # tracemalloc是否由本次剖析开启（结束时需关闭）
+        self._memory_top = []
+        self._timer = None
+        self._lock = threading.Lock()
+        self._profiling = threading.Lock()  # 持有时表示有请求正在被剖析
+
+    @property
+    def active(self):
+        return time.monotonic() < self._ends_at
+
+    def start(self, duration=DEFAULT_PROFILE_DURATION, cpu=True, memory=False, sample_every=1):
+        """开启剖析窗口，返回(是否成功, 提示)"""
+        if not cpu and not memory:
+            return False, "cProfile与tracemalloc至少开启一项"
+        if not 0 < duration <= MAX_PROFILE_DURATION:
+            return False, f"剖析时长必须在0到{MAX_PROFILE_DURATION:.0f}秒之间"
+        if not isinstance(sample_every, int) or sample_every < 1:
+            return False, "采样间隔必须为正整数"
+        with self._lock:
+            if self.active:
+                return False, "剖析正在进行中"
+            self.cpu, self.memory, self.sample_every = cpu, memory, sample_every
+            self.profiled_requests = 0
+            self._counter = itertools.count()
+            self._stats = None
+            self._memory_top = []
+            if memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self._started_tracemalloc = True
+                self._snapshot = tracemalloc.take_snapshot()
+            self.started_at = time.time()
+            self._ends_at = time.monotonic() + duration
+            self._timer = threading.Timer(duration, self._finish)
+            self._timer.daemon = True
+            self._timer.start()
+        return True, f"已开启性能剖析，持续{duration}秒"
+
+    def stop(self):
+        """提前结束剖析窗口"""
+        timer = self._timer
+        if timer is not None:
+            timer.cancel()
+        self._finish()
+        return True, "性能剖析已停止"
+
+    def _finish(self):
+        with self._lock:
+            self._ends_at = 0.0
+            self._timer = None
+            snapshot, self._snapshot = self._snapshot, None
+            if snapshot is not None and tracemalloc.is_tracing():
+                self._memory_top = self._memory_diff(snapshot)
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+
+    @staticmethod
+    def _memory_diff(snapshot):
+        stats = tracemalloc.take_snapshot().compare_to(snapshot, 'lineno')
+        return [str(stat) for stat in stats[:MEMORY_TOP_LINES]]
+
+    # 请求剖析（在请求所在线程中成对调用）
+    def profile_request(self):
+        """请求开始时调用：窗口内按采样间隔返回已开启的cProfile实例，否则返回None
+
+        已有请求正在被剖析时不等待，直接跳过本次请求
+        """
+        if not self.cpu or not self.active or next(self._counter) % self.sample_every:
+            return None
+        if not self._profiling.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 其他剖析工具（如外部的cProfile/调试器）已在运行
+            self._profiling.release()
+            return None
+        return profile
+
+    def finish_request(self, profile):
+        """请求结束时调用：停止剖析并合并到统计结果"""
+        profile.disable()
+        self._profiling.release()
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self.profiled_requests += 1
+
+    def report(self, sort='cumulative', limit=30):
+        """剖析结果：cProfile按sort排序的前limit个函数，以及窗口开始以来内存分配增长最多的代码行"""
+        if sort not in PROFILE_SORT_KEYS:
+            sort = 'cumulative'
+        with self._lock:
+            cpu_profile = ''
+            if self._stats is not None:
+                stream = io.StringIO()
+                self._stats.stream = stream
+                self._stats.sort_stats(sort).print_stats(limit)
+                cpu_profile = stream.getvalue()
+            # 窗口进行中时计算当前的内存分配差异
+            memory_top = self._memory_diff(self._snapshot) if self._snapshot is not None else list(self._memory_top)
+            return {
+                "active": self.active,
+                "started_at": self.started_at,
+                "remaining_seconds": round(max(0.0, self._ends_at - time.monotonic()), 1),
+                "cpu": self.cpu,
+                "memory": self.memory,
+                "sample_every": self.sample_every,
+                "profiled_requests": self.profiled_requests,
+                "cpu_profile": cpu_profile,
+                "memory_top": memory_top
+            }
@@ -0,0 +1,389 @@
+# replication.py
+# 主从复制：从节点追随主节点的发布与拓扑变更流，提供只读的消息读取与实体查询，分担仪表盘轮询的负载
+#
+# 主节点：以MQ_REPLICATION_LEADER=1启动app.py时开启复制日志（默认关闭，未开启时复制接口返回404），之后主题每接受一批消息、每发生一次拓扑变更各追加一个事件
+# （消息对象直接引用，拉取时才编码）；日志定长，从节点落后超过日志容量或主节点重新加载配置时重新获取快照
+# 从节点：先获取快照（实体、订阅关系与过滤条件、保留策略、主题偏移量与各观察者缓冲区中的消息），
+# 再从快照的序号起按批长轮询拉取事件；拉取线程与应用线程之间是有界队列（流水线），
+# 应用当前批次的同时下一批的请求已经发出
+#
+# 从节点按相同的顺序应用事件，消息保留主节点分配的主题内偏移量（不重新编号）；观察者缓冲区的偏移量是各实例本地的，
+# 客户端应始终向同一实例续读。消费组的成员分配与消息确认由主节点负责，从节点不镜像
+#
+# 主节点接口（app.py）：GET /replication/snapshot、GET /replication/events?since=序号&max=条数&timeout=秒
+# 从节点：设置环境变量MQ_REPLICATE_FROM=主节点地址后启动app.py
+import base64
+import http.client
+import itertools
+import json
+import queue
+import threading
+import time
+from collections import deque
+from urllib.parse import urlencode, urlsplit
+
+from middleware_core import Message
+from priority_lanes import DEFAULT_PRIORITY
+from metrics import render_gauge
+
+DEFAULT_REPLICATION_LOG_CAPACITY = 10000  # 主节点复制日志保留的最近事件数（一批消息为一个事件）
+DEFAULT_REPLICATION_BATCH = 500           # 从节点每次拉取的最大事件数
+MAX_REPLICATION_BATCH = 5000
+DEFAULT_PIPELINE_DEPTH = 4                # 已拉取、等待应用的批次数上限
+DEFAULT_POLL_TIMEOUT = 10.0               # 长轮询等待新事件的最长时间（秒）
+MAX_POLL_TIMEOUT = 30.0
+RETRY_INTERVAL = 1.0                      # 连接主节点失败后的重试间隔（秒）
+
+EVENT_MESSAGES = 'messages'
+EVENT_TOPOLOGY = 'topology'
+EVENT_RESET = 'reset'                     # 主节点整体替换了实体（加载配置/清空实体），从节点需重新获取快照
+
+# 从节点镜像的配置项（其余配置项由主节点负责）
+REPLICATED_CONFIG_KEYS = ('topics', 'producers', 'observers', 'subscriptions', 'subscription_filters', 'retention')
+
+
+def _encode_payload(payload):
+    """返回(可JSON序列化的内容, 是否为Base64编码的二进制内容)"""
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        return base64.b64encode(payload).decode('ascii'), 1
+    tobytes = getattr(payload, 'tobytes', None)
+    if tobytes is not None:               # 共享内存负载池的句柄
+        data = tobytes()
+        if payload.is_text:
+            return data.decode('utf-8'), 0
+        return base64.b64encode(data).decode('ascii'), 1
+    return payload, 0
+
+
+def encode_message(message):
+    """消息编码为JSON数组：[消息ID, 生产者ID, 主题, 时间戳, 偏移量, 内容, 消息头, 是否为二进制, 优先级]"""
+    payload, binary = _encode_payload(message.payload)
+    return [message.message_id, message.producer_id, message.topic_name, message.timestamp, message.offset,
+            payload, message.headers, binary, message.priority]
+
+
+def decode_message(record, store_payload):
+    message_id, producer_id, topic_name, timestamp, offset, payload, headers, binary = record[:8]
+    # 旧版本主节点的记录没有优先级
+    priority = record[8] if len(record) > 8 else DEFAULT_PRIORITY
+    if binary:
+        payload = base64.b64decode(payload)
+    return Message(message_id, producer_id, topic_name, timestamp, store_payload(payload), offset, headers,
+                   priority)
+
+
+def encode_event(entry):
+    seq, timestamp, kind, data = entry
+    event = {'seq': seq, 'time': timestamp, 'type': kind}
+    if kind == EVENT_MESSAGES:
+        topic_name, messages = data
+        event['topic'] = topic_name
+        # 拉取前已按保留策略清除的消息不再复制
+        event['messages'] = [encode_message(message) for message in messages
+                             if type(message) is Message and not message.expired]
+    elif kind == EVENT_TOPOLOGY:
+        event['change'] = data
+    return event
+
+
+# 主节点的复制日志：序号连续递增的定长事件队列，从节点按序号增量拉取
+class ReplicationLog:
+    def __init__(self, capacity=DEFAULT_REPLICATION_LOG_CAPACITY):
+        self.capacity = capacity
+        self._events = deque(maxlen=capacity)  # (序号, 记录时间, 事件类型, 数据)
+        self.last_seq = 0                       # 最后一个事件的序号
+        self.followers = {}                     # 从节点ID -> (最近一次拉取的起始序号, 拉取时间)
+        self._changed = threading.Condition(threading.Lock())
+
+    def _append(self, kind, data):
+        with self._changed:
+            self.last_seq += 1
+            self._events.append((self.last_seq, time.time(), kind, data))
+            self._changed.notify_all()
+
+    def append_messages(self, topic_name, messages):
+        self._append(EVENT_MESSAGES, (topic_name, messages))
+
+    def append_topology(self, change):
+        self._append(EVENT_TOPOLOGY, change)
+
+    def append_reset(self):
+        self._append(EVENT_RESET, None)
+
+    def read(self, since, max_events=DEFAULT_REPLICATION_BATCH, timeout=None, follower_id=None):
+        """读取序号大于since的至多max_events个事件，返回(已编码的事件列表, 最新序号)
+
+        暂无新事件时最多等待timeout秒；since之后的事件已被淘汰（或序号来自重启前的主节点）时返回None，
+        从节点需要重新获取快照
+        """
+        with self._changed:
+            if follower_id is not None:
+                self.followers[follower_id] = (since, time.time())
+            if timeout and self.last_seq == since:
+                self._changed.wait_for(lambda: self.last_seq > since, timeout)
+            events = self._events
+            first_seq = events[0][0] if events else self.last_seq + 1
+            if since > self.last_seq or since + 1 < first_seq:
+                return None
+            start = since + 1 - first_seq
+            batch = list(itertools.islice(events, start, start + max_events))
+            last_seq = self.last_seq
+        return [encode_event(entry) for entry in batch], last_seq
+
+    def get_stats(self):
+        now = time.time()
+        with self._changed:
+            last_seq = self.last_seq
+            return {
+                "capacity": self.capacity,
+                "last_seq": last_seq,
+                "first_seq": self._events[0][0] if self._events else last_seq + 1,
+                "retained_events": len(self._events),
+                "followers": {follower_id: {"fetched_seq": since, "lag_events": max(0, last_seq - since),
+                                            "last_fetch_ago": round(now - fetched_at, 3)}
+                              for follower_id, (since, fetched_at) in self.followers.items()}
+            }
+
+
+def build_snapshot(core):
+    """主节点：生成从节点的初始快照（须先开启复制日志）
+
+    先记录日志序号再读取状态：读取期间发生的变更之后还会以事件的形式送达，重复应用拓扑变更是幂等的，
+    重复的消息由从节点按end_seq之前的消息ID跳过。快照时刻仍在异步投递队列中的消息不在快照内
+    """
+    log = core.replication_log
+    seq = log.last_seq
+    config = core.export_config()
+    config = {key: config[key] for key in REPLICATED_CONFIG_KEYS if key in config}
+    offsets = {topic_name: topic.next_offset for topic_name, topic in list(core.topics.items())}
+    messages = {}                          # 多个观察者缓冲区中的同一条消息只编码一次
+    buffers = {}
+    for observer_id, observer in list(core.observers.items()):
+        message_ids = []
+        for message in observer.received_messages:
+            if type(message) is Message and not message.expired:
+                if message.message_id not in messages:
+                    messages[message.message_id] = encode_message(message)
+                message_ids.append(message.message_id)
+        if message_ids:
+            buffers[observer_id] = message_ids
+    return {'instance_id': core.instance_id, 'seq': seq, 'end_seq': log.last_seq, 'config': config,
+            'offsets': offsets, 'messages': list(messages.values()), 'buffers': buffers}
+
+
+# 从节点：拉取线程长轮询主节点，应用线程按序应用到本地的中间件协调器
+class ReplicationFollower:
+    def __init__(self, core, leader_url, follower_id=None, batch_size=DEFAULT_REPLICATION_BATCH,
+                 pipeline_depth=DEFAULT_PIPELINE_DEPTH, poll_timeout=DEFAULT_POLL_TIMEOUT):
+        self.core = core
+        self.leader_url = leader_url if '//' in leader_url else 'http://' + leader_url
+        parts = urlsplit(self.leader_url)
+        self._host, self._port, self._base_path = parts.hostname, parts.port or 80, parts.path.rstrip('/')
+        self.follower_id = follower_id or f"follower-{core.instance_id}"
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        self.leader_instance = None           # 快照来源的主节点实例标识（主节点重启后重新同步）
+        self.applied_seq = 0                  # 已应用的最后一个事件序号
+        self.leader_seq = 0                   # 最近一次拉取时主节点的最新序号
+        self.applied_events = 0
+        self.applied_messages = 0
+        self.skipped_messages = 0             # 主题在从节点上不存在而跳过的消息数
+        self.snapshots = 0                    # 获取快照的次数（首次同步、落后过多或主节点重新加载配置）
+        self.connected = False
+        self.last_error = None
+        self._batches = queue.Queue(maxsize=pipeline_depth)  # 已拉取、等待应用的批次
+        self._pending = deque()               # 队列中各批次首个事件在主节点的记录时间（计算延迟秒数）
+        self._applied_time = None             # 已应用的最后一个事件在主节点的记录时间
+        self._dedup = None                    # (去重截止序号, 快照中的消息ID集合)
+        self._stop = threading.Event()
+        self._threads = []
+        core.metrics.register_collector(self._collect_metrics)
+
+    def start(self):
+        for target, name in ((self._fetch_loop, 'replication-fetch'), (self._apply_loop, 'replication-apply')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """停止复制（拉取线程可能仍在长轮询中，最多等待一个轮询周期）"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(self.poll_timeout + 1)
+        self._threads.clear()
+
+    # 拉取线程
+    def _request(self, connection, path, params):
+        connection.request('GET', f"{self._base_path}{path}?{urlencode(params)}")
+        response = connection.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise ConnectionError(f"主节点返回HTTP {response.status}")
+        return json.loads(body)
+
+    def _enqueue(self, kind, data, first_time=None):
+        while not self._stop.is_set():
+            try:
+                self._batches.put((kind, data), timeout=0.5)
+            except queue.Full:
+                continue
+            if first_time is not None:
+                self._pending.append(first_time)
+            return
+
+    def _fetch_loop(self):
+        connection = None
+        since = None                          # None表示需要获取快照
+        while not self._stop.is_set():
+            try:
+                if connection is None:
+                    connection = http.client.HTTPConnection(self._host, self._port, timeout=self.poll_timeout + 10)
+                if since is None:
+                    snapshot = self._request(connection, '/replication/snapshot', {'follower_id': self.follower_id})
+                    self.connected, self.last_error = True, None
+                    self._enqueue('snapshot', snapshot)
+                    since, instance_id = snapshot['seq'], snapshot['instance_id']
+                    self.leader_seq = snapshot['end_seq']
+                    continue
+                reply = self._request(connection, '/replication/events', {
+                    'since': since, 'max': self.batch_size, 'timeout': self.poll_timeout,
+                    'instance_id': instance_id, 'follower_id': self.follower_id})
+                self.connected, self.last_error = True, None
+                if reply.get('resync'):
+                    since = None
+                    continue
+                self.leader_seq = reply['last_seq']
+                events = reply['events']
+                # 主节点整体替换了实体：先应用之前的事件，再重新获取快照
+                for index, event in enumerate(events):
+                    if event['type'] == EVENT_RESET:
+                        events, since = events[:index], None
+                        break
+                if events:
+                    self._enqueue('events', events, events[0]['time'])
+                    if since is not None:
+                        since = events[-1]['seq']
+            except (OSError, http.client.HTTPException, ValueError, KeyError) as e:
+                self.connected, self.last_error = False, str(e)
+                if connection is not None:
+                    connection.close()
+                    connection = None
+                self._stop.wait(RETRY_INTERVAL)
+        if connection is not None:
+            connection.close()
+
+    # 应用线程
+    def _apply_loop(self):
+        while not self._stop.is_set():
+            try:
+                kind, data = self._batches.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                if kind == 'snapshot':
+                    self._apply_snapshot(data)
+                else:
+                    self._apply_events(data)
+            except Exception as e:
+                self.last_error = f"应用复制事件失败：{e}"
+            finally:
+                if kind != 'snapshot' and self._pending:
+                    self._pending.popleft()
+
+    def _apply_snapshot(self, snapshot):
+        core = self.core
+        core.load_replica(snapshot['config'], snapshot['offsets'])
+        store_payload = core.store_payload
+        messages = {record[0]: decode_message(record, store_payload) for record in snapshot['messages']}
+        for observer_id, message_ids in snapshot['buffers'].items():
+            observer = core.observers.get(observer_id)
+            if observer is not None:
+                observer.received_messages.extend([messages[message_id] for message_id in message_ids])
+        self._dedup = (snapshot['end_seq'], set(messages)) if snapshot['end_seq'] > snapshot['seq'] else None
+        self.leader_instance = snapshot['instance_id']
+        self.applied_seq = snapshot['seq']
+        self.snapshots += 1
+
+    def _apply_events(self, events):
+        for event in events:
+            kind = event['type']
+            if kind == EVENT_MESSAGES:
+                self._apply_messages(event)
+            elif kind == EVENT_TOPOLOGY:
+                self._apply_change(event['change'])
+            self.applied_seq = event['seq']
+            self._applied_time = event['time']
+        self.applied_events += len(events)
+
+    def _apply_messages(self, event):
+        topic = self.core.topics.get(event['topic'])
+        records = event['messages']
+        if topic is None:
+            self.skipped_messages += len(records)
+            return
+        dedup = self._dedup
+        if dedup is not None:
+            if event['seq'] > dedup[0]:
+                self._dedup = None
+            else:
+                records = [record for record in records if record[0] not in dedup[1]]
+        if records:
+            store_payload = self.core.store_payload
+            topic.receive_replicated([decode_message(record, store_payload) for record in records])
+            self.applied_messages += len(records)
+
+    def _apply_change(self, change):
+        """按主节点的拓扑变更调用本地的同名操作（已存在/不存在时操作失败即可，重复应用是幂等的）"""
+        core, op, kind, entity_id = self.core, change['op'], change['kind'], change['id']
+        if kind == 'topics':
+            (core.create_topic if op == 'add' else core.delete_topic)(entity_id)
+        elif kind == 'producers':
+            (core.create_producer if op == 'add' else core.delete_producer)(entity_id)
+        elif kind == 'observers':
+            (core.create_observer if op == 'add' else core.delete_observer)(entity_id)
+        elif kind == 'subscriptions':
+            if op == 'add':
+                core.observer_subscribe_topic(entity_id, change['value'], filter_expression=change.get('filter'))
+            else:
+                core.observer_unsubscribe_topic(entity_id, change['value'])
+
+    # 复制延迟
+    def lag(self):
+        """返回(落后的事件数, 延迟秒数)：延迟为最早未应用的事件在主节点记录至今的时间，已追上时为0"""
+        lag_events = max(0, self.leader_seq - self.applied_seq)
+        if lag_events == 0:
+            return 0, 0.0
+        pending = self._pending
+        oldest = pending[0] if pending else self._applied_time
+        return lag_events, max(0.0, time.time() - oldest) if oldest is not None else 0.0
+
+    def get_status(self):
+        lag_events, lag_seconds = self.lag()
+        return {
+            "leader": self.leader_url,
+            "leader_instance": self.leader_instance,
+            "follower_id": self.follower_id,
+            "connected": self.connected,
+            "last_error": self.last_error,
+            "applied_seq": self.applied_seq,
+            "leader_seq": self.leader_seq,
+            "lag_events": lag_events,
+            "lag_seconds": round(lag_seconds, 3),
+            "pending_batches": self._batches.qsize(),
+            "applied_events": self.applied_events,
+            "applied_messages": self.applied_messages,
+            "skipped_messages": self.skipped_messages,
+            "snapshots": self.snapshots
+        }
+
+    def _collect_metrics(self):
+        lag_events, lag_seconds = self.lag()
+        labels = {'leader': self.leader_url}
+        lines = render_gauge('mq_replication_lag_events', '从节点落后主节点的事件数', [(labels, lag_events)])
+        lines += render_gauge('mq_replication_lag_seconds', '从节点最早未应用的事件在主节点记录至今的秒数（已追上时为0）',
+                              [(labels, round(lag_seconds, 6))])
+        lines += render_gauge('mq_replication_applied_messages', '从节点已应用的复制消息数',
+                              [(labels, self.applied_messages)])
+        lines += render_gauge('mq_replication_connected', '从节点与主节点的连接是否正常（1/0）',
+                              [(labels, int(self.connected))])
+        return lines
@@ -0,0 +1,143 @@
+# retention.py
+# 主题的消息保留策略：最长保留时间、最大负载总字节数、最大消息数
+# 主题接受的消息按发布顺序（即时间顺序）进入索引队列，超出限制或过期时从队头弹出并清除消息内容，
+# 清除的代价只与过期消息数有关，不需要扫描各观察者的缓冲区；缓冲区中只剩已过期的空消息对象，
+# 读取时被跳过，之后随环形缓冲区写满被覆盖
+import threading
+import time
+from collections import deque
+
+
+def payload_size(payload):
+    """消息内容的字节数（字符串按UTF-8编码计算，负载池句柄为共享内存中的长度）"""
+    if isinstance(payload, str):
+        return len(payload) if payload.isascii() else len(payload.encode('utf-8'))
+    try:
+        return len(payload)
+    except TypeError:
+        return 0
+
+
+class RetentionIndex:
+    def __init__(self, topic_name, timer_wheel, max_age=None, max_bytes=None, max_messages=None):
+        self.topic_name = topic_name
+        self.timer_wheel = timer_wheel        # 按最长保留时间清除时使用的时间轮
+        self.max_age = None                   # 最长保留时间（秒），None表示不限
+        self.max_bytes = None                 # 保留消息的最大负载总字节数
+        self.max_messages = None              # 保留的最大消息数
+        self._entries = deque()               # (消息, 字节数)，按发布顺序排列
+        self.retained_bytes = 0
+        self.expired_count = 0                # 超过最长保留时间被清除的消息数
+        self.evicted_count = 0                # 超过字节数/消息数限制被清除的消息数
+        self._timer_scheduled = False         # 时间轮中是否已登记队头消息的过期任务
+        self._lock = threading.Lock()         # 加锁顺序：先索引锁，后时间轮锁；时间轮回调在锁外执行
+        self._on_timer = self.on_timer        # 绑定方法只创建一次，登记定时任务时复用
+        self.configure(max_age, max_bytes, max_messages)
+
+    @property
+    def enabled(self):
+        return self.max_age is not None or self.max_bytes is not None or self.max_messages is not None
+
+    def configure(self, max_age=None, max_bytes=None, max_messages=None):
+        """修改保留限制（None表示不限），立即按新限制清除已保留的消息
+
+        已登记的过期任务按旧的最长保留时间计算，修改后取消并按新限制重新登记
+        """
+        if max_age is not None and max_age <= 0:
+            raise ValueError("最长保留时间必须为正数")
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError("最大字节数必须为正整数")
+        if max_messages is not None and max_messages <= 0:
+            raise ValueError("最大消息数必须为正整数")
+        with self._lock:
+            self.max_age, self.max_bytes, self.max_messages = max_age, max_bytes, max_messages
+            self._evict_locked()
+            self._purge_expired_locked(time.time())
+            self._timer_scheduled = False
+            delay = self._next_timer_locked()
+            # 在索引锁内取消/重新登记（时间轮按键替换旧任务），避免与并发的add_many交错
+            if delay is None:
+                self.timer_wheel.cancel(self)
+            else:
+                self.timer_wheel.schedule(self, delay, self._on_timer)
+
+    def add_many(self, messages):
+        """记录主题接受的消息（按偏移量顺序），超出字节数/消息数限制时清除最旧的消息"""
+        with self._lock:
+            for message in messages:
+                size = payload_size(message.payload)
+                self._entries.append((message, size))
+                self.retained_bytes += size
+            self._evict_locked()
+            delay = self._next_timer_locked()
+        if delay is not None:
+            self.timer_wheel.schedule(self, delay, self._on_timer)
+
+    def _evict_locked(self):
+        entries = self._entries
+        max_messages, max_bytes = self.max_messages, self.max_bytes
+        while entries and ((max_messages is not None and len(entries) > max_messages) or
+                           (max_bytes is not None and self.retained_bytes > max_bytes)):
+            self._expire_locked(*entries.popleft())
+            self.evicted_count += 1
+
+    def _purge_expired_locked(self, now):
+        if self.max_age is None:
+            return 0
+        entries = self._entries
+        cutoff = now - self.max_age
+        count = 0
+        while entries and entries[0][0].timestamp <= cutoff:
+            self._expire_locked(*entries.popleft())
+            count += 1
+        self.expired_count += count
+        return count
+
+    def _expire_locked(self, message, size):
+        # 清除内容：缓冲区与消费组中的引用只剩消息对象本身，大消息的负载池槽位随句柄释放而归还
+        message.expired = True
+        message.payload = None
+        self.retained_bytes -= size
+
+    def _next_timer_locked(self):
+        """队头消息的过期任务尚未登记时返回距离过期的秒数，否则返回None"""
+        if self.max_age is None or self._timer_scheduled or not self._entries:
+            return None
+        self._timer_scheduled = True
+        return max(0.0, self._entries[0][0].timestamp + self.max_age - time.time())
+
+    def on_timer(self, _key):
+        """时间轮回调：清除已过期的消息，再为新的队头消息登记过期任务"""
+        with self._lock:
+            self._timer_scheduled = False
+            self._purge_expired_locked(time.time())
+            delay = self._next_timer_locked()
+        if delay is not None:
+            self.timer_wheel.schedule(self, delay, self._on_timer)
+
+    def purge_expired(self):
+        """立即清除已过期的消息，返回清除条数"""
+        with self._lock:
+            return self._purge_expired_locked(time.time())
+
+    def close(self):
+        """关闭保留策略：取消过期任务，已保留的消息不再跟踪（内容保留，随缓冲区覆盖释放）"""
+        self.timer_wheel.cancel(self)
+        with self._lock:
+            self._entries.clear()
+            self.retained_bytes = 0
+            self._timer_scheduled = False
+
+    def get_stats(self):
+        with self._lock:
+            oldest = self._entries[0][0].timestamp if self._entries else None
+            return {
+                "max_age": self.max_age,
+                "max_bytes": self.max_bytes,
+                "max_messages": self.max_messages,
+                "retained_messages": len(self._entries),
+                "retained_bytes": self.retained_bytes,
+                "oldest_timestamp": oldest,
+                "expired": self.expired_count,
+                "evicted": self.evicted_count
+            }
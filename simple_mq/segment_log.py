@@ -0,0 +1,327 @@
+# segment_log.py
+# 主题消息的追加式持久化日志：长度前缀记录 + 滚动分段文件 + 偏移量索引
+import base64
+import bisect
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from urllib.parse import quote
+from priority_lanes import DEFAULT_PRIORITY
+
+# 记录头：负载长度(4字节) + CRC32校验(4字节)，大端序
+RECORD_HEADER = struct.Struct('>II')
+# 索引项：记录在日志文件中的起始位置(8字节)；第n项对应偏移量 base_offset+n
+INDEX_ENTRY = struct.Struct('>Q')
+
+DEFAULT_SEGMENT_BYTES = 16 * 1024 * 1024
+DEFAULT_FSYNC_EVERY_MESSAGES = 1000
+DEFAULT_FSYNC_INTERVAL_MS = 200
+
+
+def _encode_payload(payload):
+    """返回(可JSON序列化的内容, 是否为Base64编码的二进制内容)"""
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        return base64.b64encode(payload).decode('ascii'), True
+    tobytes = getattr(payload, 'tobytes', None)
+    if tobytes is not None:               # 共享内存负载池的句柄
+        data = tobytes()
+        if payload.is_text:
+            return data.decode('utf-8'), False
+        return base64.b64encode(data).decode('ascii'), True
+    return payload, False
+
+
+def encode_message(message):
+    """将消息对象编码为日志记录负载（主题与偏移量由日志自身确定，不重复存储；消息头、非默认优先级只在存在时写入）
+
+    二进制内容按Base64写入并记录"b"标记，读取时还原为bytes
+    """
+    payload, binary = _encode_payload(message.payload)
+    record = {
+        "i": message.message_id,
+        "p": message.producer_id,
+        "t": message.timestamp,
+        "d": payload
+    }
+    if binary:
+        record["b"] = 1
+    if getattr(message, 'headers', None):
+        record["h"] = message.headers
+    priority = getattr(message, 'priority', DEFAULT_PRIORITY)
+    if priority != DEFAULT_PRIORITY:
+        record["r"] = priority
+    return json.dumps(record, ensure_ascii=False, default=str).encode('utf-8')
+
+
+def decode_record(data):
+    """解码日志记录负载，返回字典(message_id, producer_id, timestamp, payload, headers, priority)"""
+    record = json.loads(data.decode('utf-8'))
+    payload = base64.b64decode(record["d"]) if record.get("b") else record["d"]
+    return {
+        "message_id": record["i"],
+        "producer_id": record["p"],
+        "timestamp": record["t"],
+        "payload": payload,
+        "headers": record.get("h"),
+        "priority": record.get("r", DEFAULT_PRIORITY)
+    }
+
+
+# 日志分段：一个.log数据文件和一个.index索引文件，文件名为该分段的起始偏移量
+class LogSegment:
+    def __init__(self, directory, base_offset, writable=True):
+        self.base_offset = base_offset
+        name = f"{base_offset:020d}"
+        self.log_path = os.path.join(directory, name + '.log')
+        self.index_path = os.path.join(directory, name + '.index')
+        self._log_file = None
+        self._index_file = None
+        if writable:
+            self._log_file = open(self.log_path, 'ab')
+            self._index_file = open(self.index_path, 'ab')
+            self.size = self._log_file.tell()
+            self.record_count = self._index_file.tell() // INDEX_ENTRY.size
+        else:
+            # 已封存的分段只读，不占用文件句柄
+            self.size = os.path.getsize(self.log_path)
+            self.record_count = os.path.getsize(self.index_path) // INDEX_ENTRY.size
+
+    @property
+    def next_offset(self):
+        return self.base_offset + self.record_count
+
+    def recover(self):
+        """校验分段尾部：截断写入不完整的记录（进程异常退出时可能出现）"""
+        valid_count, valid_size = 0, 0
+        if self.size and self.record_count:
+            with open(self.log_path, 'rb') as log_file, open(self.index_path, 'rb') as index_file:
+                index_data = index_file.read(self.record_count * INDEX_ENTRY.size)
+                for n in range(self.record_count):
+                    position = INDEX_ENTRY.unpack_from(index_data, n * INDEX_ENTRY.size)[0]
+                    if position != valid_size or position + RECORD_HEADER.size > self.size:
+                        break
+                    log_file.seek(position)
+                    length, checksum = RECORD_HEADER.unpack(log_file.read(RECORD_HEADER.size))
+                    payload = log_file.read(length)
+                    if len(payload) != length or zlib.crc32(payload) != checksum:
+                        break
+                    valid_count, valid_size = n + 1, position + RECORD_HEADER.size + length
+        index_size = self._index_file.tell()
+        if valid_count != self.record_count or valid_size != self.size or index_size != valid_count * INDEX_ENTRY.size:
+            self._log_file.truncate(valid_size)
+            self._index_file.truncate(valid_count * INDEX_ENTRY.size)
+            self.size, self.record_count = valid_size, valid_count
+
+    def append(self, payload):
+        """追加一条记录（写入操作系统缓冲，由SegmentLog决定何时fsync）"""
+        self._index_file.write(INDEX_ENTRY.pack(self.size))
+        self._log_file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+        self._log_file.write(payload)
+        self.size += RECORD_HEADER.size + len(payload)
+        self.record_count += 1
+
+    def flush(self, fsync=False):
+        if self._log_file is None:
+            return
+        self._log_file.flush()
+        self._index_file.flush()
+        if fsync:
+            os.fsync(self._log_file.fileno())
+            os.fsync(self._index_file.fileno())
+
+    def read(self, from_offset, max_count, record_count, size):
+        """用mmap读取[from_offset, from_offset+max_count)范围内的记录负载，不把整个分段读入内存
+
+        record_count/size为调用方在锁内取得的快照，只读取已写入操作系统的部分
+        """
+        start = from_offset - self.base_offset
+        end = min(record_count, start + max_count)
+        if start < 0 or start >= end or not size:
+            return []
+        payloads = []
+        with open(self.index_path, 'rb') as index_file, open(self.log_path, 'rb') as log_file:
+            with mmap.mmap(index_file.fileno(), end * INDEX_ENTRY.size, access=mmap.ACCESS_READ) as index_map, \
+                    mmap.mmap(log_file.fileno(), size, access=mmap.ACCESS_READ) as log_map:
+                for n in range(start, end):
+                    position = INDEX_ENTRY.unpack_from(index_map, n * INDEX_ENTRY.size)[0]
+                    length, _ = RECORD_HEADER.unpack_from(log_map, position)
+                    data_start = position + RECORD_HEADER.size
+                    payloads.append(log_map[data_start:data_start + length])
+        return payloads
+
+    def close(self):
+        """fsync并关闭文件句柄，之后分段只读"""
+        if self._log_file is None:
+            return
+        self.flush(fsync=True)
+        self._log_file.close()
+        self._index_file.close()
+        self._log_file = self._index_file = None
+
+
+# 单个主题的分段日志
+class SegmentLog:
+    def __init__(self, directory, start_offset=0, segment_bytes=DEFAULT_SEGMENT_BYTES,
+                 fsync_every_messages=DEFAULT_FSYNC_EVERY_MESSAGES, fsync_interval_ms=DEFAULT_FSYNC_INTERVAL_MS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes                # 单个分段的最大字节数，超过后滚动到新分段
+        self.fsync_every_messages = fsync_every_messages  # 累计多少条未同步的记录后fsync
+        self.fsync_interval_ms = fsync_interval_ms        # 距上次fsync超过多少毫秒后fsync
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        base_offsets = sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith('.log'))
+        # 已存在的分段只以追加方式打开最后一个，其余分段只读
+        self._segments = [LogSegment(directory, base, writable=False) for base in base_offsets[:-1]]
+        self._segments.append(LogSegment(directory, base_offsets[-1] if base_offsets else start_offset))
+        self._base_offsets = [segment.base_offset for segment in self._segments]
+        self._segments[-1].recover()
+
+    @property
+    def start_offset(self):
+        return self._segments[0].base_offset
+
+    @property
+    def next_offset(self):
+        return self._segments[-1].next_offset
+
+    def advance_to(self, offset):
+        """将下一条记录的偏移量推进到offset（关闭持久化期间主题继续在内存中分配了偏移量）
+
+        从offset开始一个新分段，[原末尾, offset)之间的偏移量在日志中没有记录，读取时跳过；
+        活动分段为空时直接替换为新分段
+        """
+        with self._lock:
+            active = self._segments[-1]
+            if offset <= active.next_offset:
+                return
+            active.close()
+            if not active.record_count:
+                os.remove(active.log_path)
+                os.remove(active.index_path)
+                self._segments.pop()
+                self._base_offsets.pop()
+            self._segments.append(LogSegment(self.directory, offset))
+            self._base_offsets.append(offset)
+
+    def append(self, message):
+        """写入一条消息并为其分配偏移量（写前日志：调用方在投递给观察者之前写入）"""
+        return self.append_many((message,))
+
+    def append_many(self, messages):
+        """在一次加锁内批量写入，偏移量连续分配；返回首条消息的偏移量"""
+        with self._lock:
+            first_offset = self.next_offset
+            for message in messages:
+                active = self._segments[-1]
+                if active.size >= self.segment_bytes and active.record_count:
+                    active.close()
+                    active = LogSegment(self.directory, active.next_offset)
+                    self._segments.append(active)
+                    self._base_offsets.append(active.base_offset)
+                message.offset = active.next_offset
+                active.append(encode_message(message))
+            self._unsynced += len(messages)
+            self._maybe_sync()
+            return first_offset
+
+    def _maybe_sync(self):
+        now = time.monotonic()
+        if self._unsynced >= self.fsync_every_messages or (now - self._last_sync) * 1000 >= self.fsync_interval_ms:
+            self._segments[-1].flush(fsync=True)
+            self._unsynced = 0
+            self._last_sync = now
+
+    def sync(self):
+        """立即将未同步的记录fsync到磁盘（定时刷盘线程与关闭时调用）"""
+        with self._lock:
+            if self._unsynced:
+                self._segments[-1].flush(fsync=True)
+                self._unsynced = 0
+                self._last_sync = time.monotonic()
+
+    def read(self, from_offset, max_count=1000):
+        """读取从from_offset开始的最多max_count条记录，返回[(偏移量, 记录字典)]；分段之间的空缺偏移量被跳过"""
+        with self._lock:
+            # 活动分段可能仍有数据在进程缓冲区中，读取前先写入操作系统
+            self._segments[-1].flush()
+            from_offset = max(from_offset, self.start_offset)
+            index = bisect.bisect_right(self._base_offsets, from_offset) - 1
+            segments = [(segment, segment.record_count, segment.size) for segment in self._segments[max(index, 0):]]
+        records = []
+        offset = from_offset
+        for segment, record_count, size in segments:
+            if len(records) >= max_count:
+                break
+            offset = max(offset, segment.base_offset)
+            for payload in segment.read(offset, max_count - len(records), record_count, size):
+                records.append((offset, decode_record(payload)))
+                offset += 1
+        return records
+
+    def close(self):
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+
+
+# 持久化日志管理器：每个主题一个目录，并负责按时间间隔刷盘
+class DurableLogManager:
+    def __init__(self, log_dir, segment_bytes=DEFAULT_SEGMENT_BYTES,
+                 fsync_every_messages=DEFAULT_FSYNC_EVERY_MESSAGES, fsync_interval_ms=DEFAULT_FSYNC_INTERVAL_MS):
+        self.log_dir = log_dir
+        self.segment_bytes = segment_bytes
+        self.fsync_every_messages = fsync_every_messages
+        self.fsync_interval_ms = fsync_interval_ms
+        self._logs = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = None              # 定时刷盘线程（打开第一个主题日志时启动）
+
+    def topic_directory(self, topic_name):
+        return os.path.join(self.log_dir, quote(topic_name, safe=''))
+
+    def open_log(self, topic_name, start_offset=0):
+        """打开（或创建）主题日志，返回的日志从不早于start_offset的偏移量继续写入
+
+        已有日志的末尾晚于start_offset时从日志末尾继续；早于start_offset时（关闭持久化后主题又发布过消息）
+        从start_offset开始新的分段，保证偏移量不会倒退
+        """
+        with self._lock:
+            log = self._logs.get(topic_name)
+            if log is None:
+                log = SegmentLog(self.topic_directory(topic_name), start_offset, self.segment_bytes,
+                                 self.fsync_every_messages, self.fsync_interval_ms)
+                self._logs[topic_name] = log
+            log.advance_to(start_offset)
+            if self._flusher is None:
+                # 发布停止后，缓冲中的记录仍需在fsync_interval_ms内落盘
+                self._flusher = threading.Thread(target=self._flush_loop, name="segment-log-flusher", daemon=True)
+                self._flusher.start()
+            return log
+
+    def close_log(self, topic_name):
+        with self._lock:
+            log = self._logs.pop(topic_name, None)
+        if log:
+            log.close()
+
+    def _flush_loop(self):
+        interval = max(self.fsync_interval_ms, 1) / 1000
+        while not self._stop.wait(interval):
+            with self._lock:
+                logs = list(self._logs.values())
+            for log in logs:
+                log.sync()
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            logs, self._logs = list(self._logs.values()), {}
+        for log in logs:
+            log.close()
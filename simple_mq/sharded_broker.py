@@ -0,0 +1,236 @@
+# sharded_broker.py
+# 多进程分片模式：主题按名称哈希分配到N个工作进程，每个进程拥有独立的MiddlewareCore分片，
+# 各分片的投递互不共享GIL；路由器通过管道把发布、订阅、拉取请求转发给主题所在的分片
+#
+# 示例：
+#   with ShardedBroker(shard_count=4) as broker:
+#       broker.create_topic('订单处理')
+#       broker.create_producer('网站服务器1')
+#       broker.create_observer('订单处理服务')
+#       broker.observer_subscribe_topic('订单处理服务', '订单处理')
+#       broker.publish('网站服务器1', '订单处理', '新订单')
+#       messages, cursor = broker.fetch('订单处理服务')
+#
+# 生产者和观察者在所有分片上都存在；观察者在各分片上的缓冲区偏移量各自独立，
+# 因此fetch使用每个分片一个偏移量的游标列表
+# 消息ID由各分片独立生成、在分片之间会重复，fetch返回的消息ID统一改写为「分片序号:分片内ID」
+import multiprocessing
+import os
+import zlib
+
+from middleware_core import MiddlewareCore, DEFAULT_BUFFER_CAPACITY
+from topic_trie import is_pattern
+
+
+def shard_index(topic_name, shard_count):
+    """主题所在的分片（CRC32哈希，与进程无关，重启后分配不变）"""
+    return zlib.crc32(topic_name.encode('utf-8')) % shard_count
+
+
+# 分片进程内执行的操作：除中间件核心的公开方法外，发布与拉取需要经过生产者/观察者对象
+def _shard_publish(core, producer_id, topic_name, message_content):
+    producer = core.producers.get(producer_id)
+    if not producer:
+        return False, f"生产者{producer_id}不存在，请先创建"
+    return producer.publish_message(core, topic_name, message_content)
+
+
+def _shard_publish_many(core, producer_id, topic_name, message_contents):
+    producer = core.producers.get(producer_id)
+    if not producer:
+        return False, f"生产者{producer_id}不存在，请先创建"
+    return producer.publish_many(core, topic_name, message_contents)
+
+
+def _shard_publish_batch(core, producer_id, items):
+    """items为[(主题名称, 消息内容列表)]，返回接受的消息总数"""
+    producer = core.producers.get(producer_id)
+    if not producer:
+        return 0
+    accepted = 0
+    for topic_name, message_contents in items:
+        accepted += producer.publish_batch(core, topic_name, message_contents)[2]
+    return accepted
+
+
+SHARD_HANDLERS = {
+    'publish': _shard_publish,
+    'publish_many': _shard_publish_many,
+    'publish_batch': _shard_publish_batch,
+}
+SHARD_CORE_METHODS = {
+    'create_topic', 'delete_topic', 'create_producer', 'delete_producer', 'create_observer', 'delete_observer',
+    'observer_subscribe_topic', 'observer_unsubscribe_topic', 'get_observer_messages', 'get_all_entities',
+    'configure_topic_delivery', 'configure_topic_persistence', 'configure_message_log', 'get_queue_depths',
+}
+
+
+def _shard_main(conn, shard_id, buffer_capacity, log_dir):
+    """分片进程主循环：逐个处理路由器发来的(操作名, 参数)请求，返回(是否正常, 结果)"""
+    core = MiddlewareCore(config_file=None, buffer_capacity=buffer_capacity,
+                          log_dir=os.path.join(log_dir, f"shard_{shard_id}") if log_dir else None)
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+            method, args = request
+            try:
+                if method in SHARD_HANDLERS:
+                    result = SHARD_HANDLERS[method](core, *args)
+                elif method in SHARD_CORE_METHODS:
+                    result = getattr(core, method)(*args)
+                else:
+                    raise ValueError(f"分片不支持的操作：{method}")
+                conn.send((True, result))
+            except Exception as e:
+                conn.send((False, repr(e)))
+    finally:
+        core.close()
+        conn.close()
+
+
+class ShardedBroker:
+    def __init__(self, shard_count=None, buffer_capacity=DEFAULT_BUFFER_CAPACITY, log_dir=None):
+        self.shard_count = shard_count or os.cpu_count() or 1
+        self._connections = []
+        self._processes = []
+        for shard_id in range(self.shard_count):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_shard_main, name=f"mq-shard-{shard_id}",
+                                              args=(child_conn, shard_id, buffer_capacity, log_dir), daemon=True)
+            process.start()
+            child_conn.close()
+            self._connections.append(parent_conn)
+            self._processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """通知所有分片进程退出（各分片关闭自己的持久化日志）"""
+        for conn in self._connections:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join(5)
+        for conn in self._connections:
+            conn.close()
+        self._connections.clear()
+        self._processes.clear()
+
+    # 请求转发（路由器对象不是线程安全的，多线程请加锁或各自创建路由器）
+    def _call_many(self, requests):
+        """requests为[(分片序号, 操作名, 参数元组)]：先全部发出，再按顺序接收，各分片并行处理
+
+        某个分片执行失败时仍会读完所有已发出请求的回复再抛出异常，否则未读取的回复会留在管道中，
+        后续请求读到的将是上一次请求的结果
+        """
+        for shard, method, args in requests:
+            self._connections[shard].send((method, args))
+        results = []
+        error = None
+        for shard, _, _ in requests:
+            ok, result = self._connections[shard].recv()
+            if not ok and error is None:
+                error = RuntimeError(f"分片{shard}执行失败：{result}")
+            results.append(result)
+        if error is not None:
+            raise error
+        return results
+
+    def _call(self, shard, method, *args):
+        return self._call_many([(shard, method, args)])[0]
+
+    def _broadcast(self, method, *args):
+        return self._call_many([(shard, method, args) for shard in range(self.shard_count)])
+
+    def shard_for(self, topic_name):
+        return shard_index(topic_name, self.shard_count)
+
+    # 实体管理（与MiddlewareCore的方法同名，返回(是否成功, 提示)）
+    def create_topic(self, topic_name):
+        return self._call(self.shard_for(topic_name), 'create_topic', topic_name)
+
+    def delete_topic(self, topic_name):
+        return self._call(self.shard_for(topic_name), 'delete_topic', topic_name)
+
+    def create_producer(self, producer_id):
+        return self._broadcast('create_producer', producer_id)[0]
+
+    def delete_producer(self, producer_id):
+        return self._broadcast('delete_producer', producer_id)[0]
+
+    def create_observer(self, observer_id):
+        return self._broadcast('create_observer', observer_id)[0]
+
+    def delete_observer(self, observer_id):
+        return self._broadcast('delete_observer', observer_id)[0]
+
+    def observer_subscribe_topic(self, observer_id, topic_name):
+        """订阅主题；通配符模式需要在所有分片上订阅"""
+        if is_pattern(topic_name):
+            return self._broadcast('observer_subscribe_topic', observer_id, topic_name)[0]
+        return self._call(self.shard_for(topic_name), 'observer_subscribe_topic', observer_id, topic_name)
+
+    def observer_unsubscribe_topic(self, observer_id, topic_name):
+        if is_pattern(topic_name):
+            return self._broadcast('observer_unsubscribe_topic', observer_id, topic_name)[0]
+        return self._call(self.shard_for(topic_name), 'observer_unsubscribe_topic', observer_id, topic_name)
+
+    # 发布
+    def publish(self, producer_id, topic_name, message_content):
+        return self._call(self.shard_for(topic_name), 'publish', producer_id, topic_name, message_content)
+
+    def publish_many(self, producer_id, topic_name, message_contents):
+        return self._call(self.shard_for(topic_name), 'publish_many', producer_id, topic_name,
+                          list(message_contents))
+
+    def publish_batch(self, producer_id, items):
+        """批量发布多个主题的消息：items为[(主题名称, 消息内容)]，按分片分组后并行转发，返回接受条数"""
+        by_shard = {}
+        for topic_name, message_content in items:
+            topics = by_shard.setdefault(self.shard_for(topic_name), {})
+            topics.setdefault(topic_name, []).append(message_content)
+        return sum(self._call_many([(shard, 'publish_batch', (producer_id, list(topics.items())))
+                                    for shard, topics in by_shard.items()]))
+
+    # 消费
+    def fetch(self, observer_id, cursor=None, limit=None):
+        """从所有分片拉取观察者的新消息，返回(消息列表, 新游标)
+
+        cursor为每个分片一个偏移量的列表（None表示从头读取），消息按发布时间合并排序；
+        各分片的消息ID会重复，返回的消息ID改写为「分片序号:分片内ID」以便全局区分
+        """
+        cursor = list(cursor) if cursor else [0] * self.shard_count
+        results = self._call_many([(shard, 'get_observer_messages', (observer_id, cursor[shard], limit))
+                                   for shard in range(self.shard_count)])
+        messages = []
+        for shard, (shard_messages, next_offset) in enumerate(results):
+            for message in shard_messages:
+                message.message_id = f"{shard}:{message.message_id}"
+            messages += shard_messages
+            cursor[shard] = next_offset
+        messages.sort(key=lambda message: getattr(message, 'timestamp', 0))
+        return messages, cursor
+
+    def get_all_entities(self):
+        """合并各分片的实体信息（订阅关系为各分片订阅的并集）"""
+        entities = self._broadcast('get_all_entities')
+        merged = dict(entities[0])
+        merged['topics'] = [topic for shard_entities in entities for topic in shard_entities['topics']]
+        subscriptions = {}
+        for shard_entities in entities:
+            for observer_id, topics in shard_entities['subscriptions'].items():
+                subscriptions.setdefault(observer_id, [])
+                subscriptions[observer_id] += [t for t in topics if t not in subscriptions[observer_id]]
+        merged['subscriptions'] = subscriptions
+        return merged
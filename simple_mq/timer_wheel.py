@@ -0,0 +1,81 @@
+# timer_wheel.py
+# 哈希时间轮：大量定时任务（如未确认消息的可见性超时）的O(1)登记与取消
+# 时间被划分为固定间隔的刻度，每个槽位保存到期刻度落在该槽的任务；超过一圈的任务在槽位中等待后续轮次
+import math
+import threading
+import time
+
+DEFAULT_TICK_INTERVAL = 0.1     # 刻度间隔（秒）
+DEFAULT_WHEEL_SIZE = 1024       # 槽位数（默认一圈约102秒，常见超时无需跨轮）
+
+
+class TimerWheel:
+    def __init__(self, tick_interval=DEFAULT_TICK_INTERVAL, wheel_size=DEFAULT_WHEEL_SIZE):
+        self.tick_interval = tick_interval
+        self.wheel_size = wheel_size
+        self._slots = [{} for _ in range(wheel_size)]  # 每个槽位：key -> (到期刻度, 回调)
+        self._where = {}                 # key -> 所在槽位，用于O(1)取消
+        self._current_tick = 0
+        self._origin = time.monotonic()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def __len__(self):
+        return len(self._where)
+
+    def schedule(self, key, delay, callback):
+        """登记（或重新登记）一个定时任务：delay秒后在时间轮线程中调用callback(key)"""
+        ticks = max(1, math.ceil(delay / self.tick_interval))
+        with self._lock:
+            slot = self._where.pop(key, None)
+            if slot is not None:
+                del self._slots[slot][key]
+            expiry = self._current_tick + ticks
+            slot = expiry % self.wheel_size
+            self._slots[slot][key] = (expiry, callback)
+            self._where[key] = slot
+
+    def cancel(self, key):
+        """取消定时任务，返回任务是否存在"""
+        with self._lock:
+            slot = self._where.pop(key, None)
+            if slot is None:
+                return False
+            del self._slots[slot][key]
+            return True
+
+    def advance(self, now=None):
+        """推进到当前时间，执行所有到期的任务，返回执行的任务数"""
+        target = int(((time.monotonic() if now is None else now) - self._origin) / self.tick_interval)
+        due = []
+        with self._lock:
+            while self._current_tick < target:
+                self._current_tick += 1
+                slot = self._slots[self._current_tick % self.wheel_size]
+                expired = [key for key, (expiry, _) in slot.items() if expiry <= self._current_tick]
+                for key in expired:
+                    due.append((key, slot.pop(key)[1]))
+                    del self._where[key]
+        # 在锁外执行回调，回调中可以重新登记任务
+        for key, callback in due:
+            callback(key)
+        return len(due)
+
+    # 后台推进线程
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="timer-wheel", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.tick_interval):
+            self.advance()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
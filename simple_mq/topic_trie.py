@@ -0,0 +1,106 @@
+# topic_trie.py
+# 层级主题与通配符订阅：主题名按"."分层，订阅模式中"*"匹配恰好一层，"#"匹配零层或多层
+# 例如 orders.* 匹配 orders.created，alerts.# 匹配 alerts、alerts.disk、alerts.disk.full
+import threading
+
+TOPIC_SEPARATOR = '.'
+WILDCARD_ONE = '*'
+WILDCARD_ANY = '#'
+
+
+def is_pattern(name):
+    """主题名中存在完整的"*"或"#"层级时视为通配符订阅模式"""
+    name = str(name)
+    if WILDCARD_ONE not in name and WILDCARD_ANY not in name:
+        return False              # 绝大多数主题名不含通配符字符，无需拆分层级
+    return any(level in (WILDCARD_ONE, WILDCARD_ANY) for level in name.split(TOPIC_SEPARATOR))
+
+
+# 模式字典树的节点：子节点按层级名索引，subscribers为在此节点结束的模式的订阅者
+class _TrieNode:
+    __slots__ = ('children', 'subscribers')
+
+    def __init__(self):
+        self.children = {}
+        self.subscribers = {}     # key=观察者ID，value=观察者（保持订阅顺序）
+
+
+class TopicTrie:
+    def __init__(self):
+        self.root = _TrieNode()
+
+    def add(self, pattern, observer):
+        """添加订阅；已存在时返回False"""
+        node = self.root
+        for level in pattern.split(TOPIC_SEPARATOR):
+            node = node.children.setdefault(level, _TrieNode())
+        if observer.observer_id in node.subscribers:
+            return False
+        node.subscribers[observer.observer_id] = observer
+        return True
+
+    def remove(self, pattern, observer):
+        """移除订阅并清理空节点；不存在时返回False"""
+        path = [self.root]
+        levels = pattern.split(TOPIC_SEPARATOR)
+        for level in levels:
+            node = path[-1].children.get(level)
+            if node is None:
+                return False
+            path.append(node)
+        if path[-1].subscribers.pop(observer.observer_id, None) is None:
+            return False
+        for depth in range(len(levels), 0, -1):
+            node = path[depth]
+            if node.subscribers or node.children:
+                break
+            del path[depth - 1].children[levels[depth - 1]]
+        return True
+
+    def match(self, topic_name):
+        """返回模式匹配该主题的所有订阅者（按观察者ID去重）"""
+        matched = {}
+        levels = topic_name.split(TOPIC_SEPARATOR)
+        self._match(self.root, levels, 0, matched)
+        return list(matched.values())
+
+    def _match(self, node, levels, index, matched):
+        any_node = node.children.get(WILDCARD_ANY)
+        if any_node is not None:
+            # "#"可以吞掉剩余的任意层级（包括零层）
+            for rest in range(index, len(levels) + 1):
+                self._match(any_node, levels, rest, matched)
+        if index == len(levels):
+            matched.update(node.subscribers)
+            return
+        for key in (levels[index], WILDCARD_ONE):
+            child = node.children.get(key)
+            if child is not None:
+                self._match(child, levels, index + 1, matched)
+
+
+# 通配符订阅索引：字典树 + 版本号；每次订阅变更后版本号递增，主题据此判断缓存的匹配结果是否失效
+class PatternIndex:
+    def __init__(self):
+        self.trie = TopicTrie()
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, pattern, observer):
+        with self._lock:
+            added = self.trie.add(pattern, observer)
+            if added:
+                self.version += 1
+            return added
+
+    def unsubscribe(self, pattern, observer):
+        with self._lock:
+            removed = self.trie.remove(pattern, observer)
+            if removed:
+                self.version += 1
+            return removed
+
+    def match(self, topic_name):
+        """返回(版本号, 匹配的订阅者列表)"""
+        with self._lock:
+            return self.version, self.trie.match(topic_name)
@@ -0,0 +1,262 @@
+# wire_protocol.py
+# 二进制长度前缀帧协议：生产者/消费者通过TCP长连接直接访问中间件，支持流水线（同一连接上多个请求并发在途）
+#
+# 帧格式（大端序）：
+#   帧头 = 帧体长度(4字节) + 操作码(1字节) + 请求ID(4字节)
+#   帧体 = 按操作码约定的字段序列；字符串为2字节长度+UTF-8，
+#          消息内容为1字节类型(0文本/1二进制)+4字节长度+数据（文本为UTF-8，二进制原样传输）
+# 响应帧的请求ID与请求相同，客户端据此匹配响应（等待型FETCH的响应可能晚于后续请求返回）
+#
+# 用法：python wire_protocol.py --port 5002
+import argparse
+import asyncio
+import struct
+
+FRAME_HEADER = struct.Struct('>IBI')
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+# 请求操作码
+OP_PUBLISH = 0x01          # producer_id, topic_name, payload                   -> OP_ACK(offset)
+OP_PUBLISH_BATCH = 0x02    # producer_id, topic_name, count(u32), payload*count -> OP_ACK(accepted)，全部被拒绝时OP_ERROR
+OP_SUBSCRIBE = 0x03        # observer_id, topic_name                            -> OP_ACK
+OP_FETCH = 0x04            # observer_id, since(u64), max_count(u32), wait_ms(u32) -> OP_MESSAGES
+OP_UNSUBSCRIBE = 0x05      # observer_id, topic_name                            -> OP_ACK
+OP_ACK_MESSAGES = 0x06     # consumer_id, topic_name, count(u32), offset(u64)*count -> OP_ACK(acked)
+OP_CREATE_TOPIC = 0x10     # topic_name                                         -> OP_ACK
+OP_CREATE_PRODUCER = 0x11  # producer_id                                        -> OP_ACK
+OP_CREATE_OBSERVER = 0x12  # observer_id                                        -> OP_ACK
+# 响应操作码
+OP_ACK = 0x80              # value(i64)：发布为主题内偏移量（无则为-1），批量发布为接受条数，确认消息为确认条数，其余为0
+OP_ERROR = 0x81            # message(str)
+OP_MESSAGES = 0x82         # next_offset(u64), count(u32), 每条：topic, producer, timestamp(f64), offset(i64), payload
+
+U32 = struct.Struct('>I')
+U64 = struct.Struct('>Q')
+I64 = struct.Struct('>q')
+F64 = struct.Struct('>d')
+STR_LEN = struct.Struct('>H')
+PAYLOAD_HEADER = struct.Struct('>BI')
+PAYLOAD_TEXT = 0
+PAYLOAD_BINARY = 1
+
+
+class ProtocolError(Exception):
+    """帧格式错误或服务端返回错误"""
+
+
+def pack_str(value):
+    data = str(value).encode('utf-8')
+    return STR_LEN.pack(len(data)) + data
+
+
+def pack_payload(value):
+    """编码消息内容：字节串按二进制传输，负载池句柄直接从共享内存视图写入，其余按文本传输"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        kind, data = PAYLOAD_BINARY, value
+    elif hasattr(value, 'is_text') and hasattr(value, 'view'):
+        kind, data = (PAYLOAD_TEXT if value.is_text else PAYLOAD_BINARY), value.view()
+    else:
+        kind, data = PAYLOAD_TEXT, str(value).encode('utf-8')
+    return PAYLOAD_HEADER.pack(kind, len(data)) + bytes(data)
+
+
+def encode_frame(opcode, request_id, body=b''):
+    return FRAME_HEADER.pack(len(body), opcode, request_id) + body
+
+
+# 帧体解析器：按顺序读取字段
+class BodyReader:
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.position = 0
+
+    def _take(self, size):
+        if self.position + size > len(self.data):
+            raise ProtocolError("帧体长度不足")
+        chunk = self.data[self.position:self.position + size]
+        self.position += size
+        return chunk
+
+    def read_str(self):
+        length = STR_LEN.unpack(self._take(STR_LEN.size))[0]
+        return bytes(self._take(length)).decode('utf-8')
+
+    def read_payload(self):
+        """读取消息内容：文本返回str，二进制返回bytes"""
+        kind, length = PAYLOAD_HEADER.unpack(self._take(PAYLOAD_HEADER.size))
+        data = bytes(self._take(length))
+        if kind == PAYLOAD_BINARY:
+            return data
+        if kind != PAYLOAD_TEXT:
+            raise ProtocolError(f"未知的消息内容类型：{kind}")
+        return data.decode('utf-8')
+
+    def read_u32(self):
+        return U32.unpack(self._take(U32.size))[0]
+
+    def read_u64(self):
+        return U64.unpack(self._take(U64.size))[0]
+
+    def read_i64(self):
+        return I64.unpack(self._take(I64.size))[0]
+
+    def read_f64(self):
+        return F64.unpack(self._take(F64.size))[0]
+
+
+def encode_messages(messages, next_offset):
+    """编码OP_MESSAGES帧体（字符串消息的生产者、时间戳为空值）"""
+    parts = [U64.pack(next_offset), U32.pack(len(messages))]
+    for message in messages:
+        if hasattr(message, 'payload'):
+            offset = message.offset if message.offset is not None else -1
+            parts += [pack_str(message.topic_name), pack_str(message.producer_id),
+                      F64.pack(message.timestamp), I64.pack(offset), pack_payload(message.payload)]
+        else:
+            parts += [pack_str(''), pack_str(''), F64.pack(0.0), I64.pack(-1), pack_payload(message)]
+    return b''.join(parts)
+
+
+def decode_messages(body):
+    """解码OP_MESSAGES帧体，返回(消息字典列表, 下一次拉取的偏移量)"""
+    reader = BodyReader(body)
+    next_offset = reader.read_u64()
+    messages = []
+    for _ in range(reader.read_u32()):
+        messages.append({
+            "topic_name": reader.read_str(),
+            "producer_id": reader.read_str(),
+            "timestamp": reader.read_f64(),
+            "offset": reader.read_i64(),
+            "payload": reader.read_payload()
+        })
+    return messages, next_offset
+
+
+# TCP协议服务：复用asyncio版本的中间件核心
+class WireProtocolServer:
+    def __init__(self, core, host='0.0.0.0', port=5002):
+        self.core = core
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port, backlog=4096)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def handle_connection(self, reader, writer):
+        waiting = set()  # 连接上仍在等待新消息的FETCH请求
+        try:
+            while True:
+                header = await reader.readexactly(FRAME_HEADER.size)
+                length, opcode, request_id = FRAME_HEADER.unpack(header)
+                if length > MAX_FRAME_SIZE:
+                    writer.write(encode_frame(OP_ERROR, request_id, pack_str("帧过大")))
+                    break
+                body = await reader.readexactly(length) if length else b''
+                if opcode == OP_FETCH:
+                    # 等待型拉取不阻塞同一连接上后续的流水线请求
+                    task = asyncio.ensure_future(self.handle_fetch(writer, request_id, body))
+                    waiting.add(task)
+                    task.add_done_callback(waiting.discard)
+                    continue
+                writer.write(self.handle_request(opcode, request_id, body))
+                # 仅在写缓冲超过高水位时等待，流水线请求的响应可以合并发送
+                if writer.transport.get_write_buffer_size() > 256 * 1024:
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for task in waiting:
+                task.cancel()
+            writer.close()
+
+    def handle_request(self, opcode, request_id, body):
+        try:
+            reader = BodyReader(body)
+            if opcode == OP_PUBLISH:
+                producer_id, topic_name, payload = reader.read_str(), reader.read_str(), reader.read_payload()
+                producer = self.core.producers.get(producer_id)
+                if not producer:
+                    return encode_frame(OP_ERROR, request_id, pack_str(f"生产者{producer_id}不存在，请先创建"))
+                success, msg, message = producer.publish(self.core, topic_name, payload)
+                if not success:
+                    return encode_frame(OP_ERROR, request_id, pack_str(msg))
+                # 不回显消息内容，只返回这条消息分配到的偏移量
+                offset = message.offset if message.offset is not None else -1
+                return encode_frame(OP_ACK, request_id, I64.pack(offset))
+            if opcode == OP_PUBLISH_BATCH:
+                producer_id, topic_name = reader.read_str(), reader.read_str()
+                payloads = [reader.read_payload() for _ in range(reader.read_u32())]
+                producer = self.core.producers.get(producer_id)
+                if not producer:
+                    return encode_frame(OP_ERROR, request_id, pack_str(f"生产者{producer_id}不存在，请先创建"))
+                _, msg, accepted = producer.publish_batch(self.core, topic_name, payloads)
+                if not accepted:
+                    return encode_frame(OP_ERROR, request_id, pack_str(msg))
+                # 异步队列只拒绝了部分消息时仍确认已接受的条数（这些消息已经投递，客户端不应整批重发）
+                return encode_frame(OP_ACK, request_id, I64.pack(accepted))
+            if opcode == OP_ACK_MESSAGES:
+                consumer_id, topic_name = reader.read_str(), reader.read_str()
+                offsets = [reader.read_u64() for _ in range(reader.read_u32())]
+                success, msg, acked = self.core.ack_messages(consumer_id, topic_name, offsets)
+                if not success:
+                    return encode_frame(OP_ERROR, request_id, pack_str(msg))
+                return encode_frame(OP_ACK, request_id, I64.pack(acked))
+            if opcode in (OP_SUBSCRIBE, OP_UNSUBSCRIBE):
+                observer_id, topic_name = reader.read_str(), reader.read_str()
+                if opcode == OP_SUBSCRIBE:
+                    success, msg = self.core.observer_subscribe_topic(observer_id, topic_name)
+                else:
+                    success, msg = self.core.observer_unsubscribe_topic(observer_id, topic_name)
+            elif opcode == OP_CREATE_TOPIC:
+                success, msg = self.core.create_topic(reader.read_str())
+            elif opcode == OP_CREATE_PRODUCER:
+                success, msg = self.core.create_producer(reader.read_str())
+            elif opcode == OP_CREATE_OBSERVER:
+                success, msg = self.core.create_observer(reader.read_str())
+            else:
+                return encode_frame(OP_ERROR, request_id, pack_str(f"未知操作码：{opcode:#x}"))
+            if not success:
+                return encode_frame(OP_ERROR, request_id, pack_str(msg))
+            return encode_frame(OP_ACK, request_id, I64.pack(0))
+        except (ProtocolError, UnicodeDecodeError) as e:
+            return encode_frame(OP_ERROR, request_id, pack_str(f"帧解析失败：{e}"))
+
+    async def handle_fetch(self, writer, request_id, body):
+        try:
+            reader = BodyReader(body)
+            observer_id, since = reader.read_str(), reader.read_u64()
+            max_count, wait_ms = reader.read_u32(), reader.read_u32()
+        except (ProtocolError, UnicodeDecodeError) as e:
+            writer.write(encode_frame(OP_ERROR, request_id, pack_str(f"帧解析失败：{e}")))
+            return
+        result = await self.core.fetch(observer_id, since, wait_ms / 1000, max_count or None)
+        if result is None:
+            writer.write(encode_frame(OP_ERROR, request_id, pack_str(f"观察者{observer_id}不存在，请先创建观察者")))
+            return
+        messages, next_offset = result
+        writer.write(encode_frame(OP_MESSAGES, request_id, encode_messages(messages, next_offset)))
+
+
+async def serve(host, port, load_config=False):
+    from async_broker import AsyncMiddlewareCore
+    core = AsyncMiddlewareCore()
+    if load_config:
+        core.load_config()
+    server = WireProtocolServer(core, host, port)
+    await server.start()
+    print(f"二进制协议服务已启动：{host}:{server.port}")
+    async with server.server:
+        await server.server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="简易消息中间件二进制TCP协议服务")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5002)
+    parser.add_argument("--load-config", action="store_true", help="启动时加载config.json")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.load_config))